@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+
+import pytest
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+DEFAULT_SIZES = '10,100,1000,10000'
+
+# Targets in the multi-target deployer files, and the most applications
+# such a file may hold in all
+NUM_TARGETS = 200
+MAX_TARGETS_APPS = 20000
+
+
+def pytest_addoption(parser):
+    parser.addoption('--bundle-sizes', default=DEFAULT_SIZES,
+                     help='Comma separated numbers of applications in the '
+                          'synthetic bundles. Default: %s' % DEFAULT_SIZES)
+    parser.addoption('--cs-latency', type=float, default=0.0,
+                     help='Seconds each fake charm store query takes. '
+                          'Default: 0')
+
+
+def pytest_generate_tests(metafunc):
+    if 'num_apps' in metafunc.fixturenames:
+        sizes = [int(size) for size in
+                 metafunc.config.getoption('bundle_sizes').split(',')]
+        metafunc.parametrize('num_apps', sizes)
+
+
+def rounds(num_apps):
+    '''Fewer rounds for larger bundles, keeping each benchmark bounded.'''
+    return max(1, min(20, 2000 // num_apps))
+
+
+@pytest.fixture
+def charm_store(request, monkeypatch):
+    store = synthetic.FakeCharmStore(
+        request.config.getoption('cs_latency'))
+    monkeypatch.setattr('os_charms_tools.charm.cs_query', store)
+    return store
+
+
+@pytest.fixture
+def bundle_dict(num_apps):
+    return synthetic.generate_bundle(num_apps)
+
+
+@pytest.fixture
+def bundle_file(tmp_path, bundle_dict):
+    path = str(tmp_path / 'bundle.yaml')
+    with open(path, 'w') as bundle:
+        bundle.write(yaml.dump(bundle_dict, default_flow_style=False))
+    return path
+
+
+@pytest.fixture
+def targets_file(tmp_path, num_apps):
+    if num_apps * NUM_TARGETS > MAX_TARGETS_APPS:
+        pytest.skip('{} targets of {} applications take too long to '
+                    'generate'.format(NUM_TARGETS, num_apps))
+    path = str(tmp_path / 'targets.yaml')
+    with open(path, 'w') as targets:
+        yaml.dump(synthetic.generate_targets(NUM_TARGETS, num_apps), targets,
+                  Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper),
+                  default_flow_style=False)
+    return path
+
+
+@pytest.fixture
+def overrides_file(tmp_path, num_apps):
+    path = str(tmp_path / 'overrides.yaml')
+    with open(path, 'w') as overrides:
+        overrides.write(yaml.dump(synthetic.generate_overrides(num_apps),
+                                  default_flow_style=False))
+    return path
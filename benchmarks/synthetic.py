@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Synthetic bundles and a fake charm store for the benchmarks.
+'''
+
+import threading
+import time
+
+BASE_TARGET = 'openstack-base'
+TARGET = 'xenial-mitaka'
+
+# Charms the synthetic applications are deployed from, in turn
+CHARMS = [
+    'keystone',
+    'glance',
+    'nova-cloud-controller',
+    'neutron-api',
+    'cinder',
+    'rabbitmq-server',
+    'percona-cluster',
+    'ceph-mon',
+]
+
+
+def application_name(index):
+    return 'app-{:05d}'.format(index)
+
+
+def generate_services(num_apps, first=0):
+    '''Return num_apps synthetic services, named from index first.'''
+    services = {}
+    for index in range(first, first + num_apps):
+        charm = CHARMS[index % len(CHARMS)]
+        services[application_name(index)] = {
+            'charm': 'cs:xenial/{}'.format(charm),
+            'num_units': 1 + index % 3,
+            'constraints': 'mem=4G',
+            'options': {
+                'debug': index % 2 == 0,
+                'worker-multiplier': 0.25,
+            },
+        }
+    return services
+
+
+def generate_relations(num_apps, first=0):
+    '''Relate every application to the next one and to the first one.'''
+    relations = []
+    for index in range(first + 1, first + num_apps):
+        relations.append([application_name(index),
+                          application_name(index - 1)])
+        if index - 1 != first:
+            relations.append([application_name(index),
+                              application_name(first)])
+    return relations
+
+
+def generate_bundle(num_apps):
+    '''Return a deployer style bundle of num_apps applications.
+
+    The base target holds the applications and relations, TARGET inherits
+    from it, changing the options of one application in ten.
+    '''
+    inherited = {}
+    for index in range(0, num_apps, 10):
+        inherited[application_name(index)] = {
+            'options': {'debug': True, 'verbose': True}}
+    return {
+        BASE_TARGET: {
+            'series': 'xenial',
+            'services': generate_services(num_apps),
+            'relations': generate_relations(num_apps),
+        },
+        TARGET: {
+            'inherits': BASE_TARGET,
+            'services': inherited,
+        },
+    }
+
+
+def generate_targets(num_targets, num_apps):
+    '''Return a deployer style file of num_targets targets.
+
+    Besides the targets of generate_bundle(num_apps), which TARGET needs,
+    it holds num_targets - 2 unrelated targets of num_apps applications.
+    '''
+    targets = generate_bundle(num_apps)
+    for index in range(num_targets - len(targets)):
+        targets['other-{:03d}'.format(index)] = {
+            'series': 'xenial',
+            'services': generate_services(num_apps),
+            'relations': generate_relations(num_apps),
+        }
+    return targets
+
+
+def generate_overrides(num_apps):
+    '''Return an overrides bundle changing one existing application in
+    four and adding num_apps // 10 new ones.'''
+    services = {}
+    for index in range(0, num_apps, 4):
+        services[application_name(index)] = {
+            'num_units': 3,
+            'options': {'region': 'RegionTwo'},
+        }
+    new_apps = max(1, num_apps // 10)
+    services.update(generate_services(new_apps, first=num_apps))
+    return {
+        'services': services,
+        'relations': [[application_name(num_apps + i), application_name(0)]
+                      for i in range(new_apps)],
+    }
+
+
+class FakeCharmStore(object):
+    '''Stands in for charm_store.cs_query.
+
+    :param latency: seconds each query takes, as the real charm store
+                    would over the network
+    '''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, charm, series, uri=''):
+        with self._lock:
+            self.queries += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if uri == 'charm-metadata':
+            if charm.startswith('hacluster'):
+                return {'Subordinate': True}
+            return {'Subordinate': False,
+                    'Requires': {'ha': {'Interface': 'hacluster'}}}
+        if uri == 'charm-config':
+            return {'Options': {'openstack-origin': {'Type': 'string'},
+                                'debug': {'Type': 'boolean'}}}
+        return {}
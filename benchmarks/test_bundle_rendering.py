@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Benchmarks of each stage of the bundle rendering pipeline.
+
+Run with: tox -e bench
+'''
+
+import os
+
+from os_charms_tools.rendered_bundle import RenderedBundle
+from os_charms_tools import yaml_io
+from os_charms_tools.tools_common import (
+    extract_services,
+    read_yaml,
+    render,
+    render_many,
+    render_target_inheritance,
+)
+
+from conftest import NUM_TARGETS, rounds
+import synthetic
+
+
+# One rendered file per application, as a charm config or an overlay is
+APPLICATION_TEMPLATE = '''\
+{{ name }}:
+  charm: {{ app.charm }}
+  num_units: {{ app.num_units }}
+  options:
+{% for key, value in app.options | dictsort %}
+    {{ key }}: {{ value | tojson }}
+{% endfor %}
+'''
+
+
+def loaded_bundle(bundle_file):
+    bundle = RenderedBundle('xenial', 'mitaka', target=synthetic.TARGET)
+    bundle.get_bundle_from_yaml(bundle_file)
+    return bundle
+
+
+def test_read_yaml(benchmark, bundle_file, num_apps):
+    data = benchmark.pedantic(read_yaml, args=(bundle_file,),
+                              rounds=rounds(num_apps))
+    assert len(data[synthetic.BASE_TARGET]['services']) == num_apps
+
+
+def test_read_yaml_one_target(benchmark, targets_file, num_apps):
+    data = benchmark.pedantic(read_yaml, args=(targets_file,),
+                              kwargs={'target': synthetic.TARGET},
+                              rounds=rounds(num_apps * NUM_TARGETS // 10))
+    assert sorted(data) == [synthetic.BASE_TARGET, synthetic.TARGET]
+
+
+def test_read_yaml_all_targets(benchmark, targets_file, num_apps):
+    data = benchmark.pedantic(yaml_io.load_file, args=(targets_file,),
+                              rounds=rounds(num_apps * NUM_TARGETS // 10))
+    assert len(data) == NUM_TARGETS
+
+
+def test_extract_services(benchmark, bundle_dict, num_apps):
+    data = benchmark.pedantic(
+        extract_services, args=(bundle_dict,),
+        kwargs={'svcs_include': frozenset(), 'svcs_exclude': set(),
+                'render_target': synthetic.TARGET},
+        rounds=rounds(num_apps))
+    assert len(data['services']) == num_apps
+
+
+def test_render_target_inheritance(benchmark, bundle_dict, num_apps):
+    data = benchmark.pedantic(render_target_inheritance,
+                              args=(bundle_dict, synthetic.TARGET),
+                              rounds=rounds(num_apps))
+    assert len(data['services']) == num_apps
+
+
+def test_get_bundle_from_yaml(benchmark, charm_store, bundle_file, num_apps):
+    bundle = benchmark.pedantic(loaded_bundle, args=(bundle_file,),
+                                rounds=rounds(num_apps))
+    assert len(bundle.charms) == num_apps
+
+
+def test_add_ha(benchmark, charm_store, bundle_file, num_apps):
+    def setup():
+        return (loaded_bundle(bundle_file),), {}
+
+    benchmark.pedantic(RenderedBundle.add_ha, setup=setup,
+                       rounds=rounds(num_apps))
+
+
+def test_merge_overrides(benchmark, charm_store, bundle_file, overrides_file,
+                         num_apps):
+    def setup():
+        return (loaded_bundle(bundle_file), [overrides_file]), {}
+
+    benchmark.pedantic(RenderedBundle.merge_overrides, setup=setup,
+                       rounds=rounds(num_apps))
+
+
+def test_write_bundle(benchmark, charm_store, bundle_file, tmp_path,
+                      num_apps):
+    bundle = loaded_bundle(bundle_file)
+    destination = str(tmp_path / 'rendered.yaml')
+    benchmark.pedantic(bundle.write_bundle, args=(destination,),
+                       rounds=rounds(num_apps))
+    assert os.path.getsize(destination)
+
+
+def template_jobs(tmp_path, bundle_dict):
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    (templates / 'application.yaml.j2').write_text(APPLICATION_TEMPLATE)
+    services = bundle_dict[synthetic.BASE_TARGET]['services']
+    jobs = [('application.yaml.j2', str(tmp_path / '{}.yaml'.format(name)),
+             {'name': name, 'app': app})
+            for name, app in sorted(services.items())]
+    return str(templates), jobs
+
+
+def render_each(jobs, templates_dir):
+    for source, target, context in jobs:
+        render(source, target, context, templates_dir)
+
+
+def test_render(benchmark, bundle_dict, tmp_path, num_apps):
+    templates_dir, jobs = template_jobs(tmp_path, bundle_dict)
+    benchmark.pedantic(render_each, args=(jobs, templates_dir),
+                       rounds=rounds(num_apps))
+
+
+def test_render_many(benchmark, bundle_dict, tmp_path, num_apps):
+    templates_dir, jobs = template_jobs(tmp_path, bundle_dict)
+    targets = benchmark.pedantic(render_many, args=(jobs, templates_dir),
+                                 rounds=rounds(num_apps))
+    assert len(targets) == num_apps
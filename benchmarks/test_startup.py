@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Startup time of render_bundle.py, which CI runs thousands of times a day.
+
+Times are measured over the startup of a bare interpreter, so the budgets
+hold on slower machines too.
+'''
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import yaml
+
+import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RENDER_BUNDLE = os.path.join(ROOT, 'render_bundle.py')
+
+# Seconds over interpreter startup allowed for render_bundle.py --help
+HELP_BUDGET = 0.25
+# Seconds over interpreter startup allowed to render OFFLINE_APPS
+# applications without the charm store
+RENDER_BUDGET = 1.0
+OFFLINE_APPS = 100
+# Runs of each command, the fastest counts
+REPEAT = 5
+
+# Modules which must only be imported when their feature is used
+LAZY_MODULES = ('jinja2', 'urllib3', 'cProfile', 'pstats')
+
+
+def fastest_run(cmd, cwd=None):
+    best = None
+    for _ in range(REPEAT):
+        start = time.time()
+        subprocess.check_call(cmd, cwd=cwd, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def overhead(cmd, cwd=None):
+    '''Seconds cmd takes over starting the interpreter and doing nothing'''
+    return fastest_run(cmd, cwd) - fastest_run([sys.executable, '-c', 'pass'])
+
+
+def offline_bundle(tmp_path):
+    path = str(tmp_path / 'bundle.yaml')
+    with open(path, 'w') as bundle:
+        bundle.write(yaml.dump(synthetic.generate_bundle(OFFLINE_APPS),
+                               default_flow_style=False))
+    return path
+
+
+def render_cmd(bundle, destination):
+    # Charms from github are not looked up in the charm store
+    return [RENDER_BUNDLE, '-b', bundle, '-t', synthetic.TARGET,
+            '-src', 'github', '-d', destination, '-l', 'ERROR']
+
+
+def test_help_within_budget():
+    assert overhead([sys.executable, RENDER_BUNDLE, '--help']) < HELP_BUDGET
+
+
+def test_offline_render_within_budget(tmp_path):
+    cmd = render_cmd(offline_bundle(tmp_path), str(tmp_path / 'out.yaml'))
+    assert overhead([sys.executable] + cmd) < RENDER_BUDGET
+
+
+def test_offline_render_imports_no_lazy_modules(tmp_path):
+    cmd = render_cmd(offline_bundle(tmp_path), str(tmp_path / 'out.yaml'))
+    script = ('import runpy, sys, json\n'
+              'sys.argv = {}\n'
+              'runpy.run_path(sys.argv[0], run_name="__main__")\n'
+              'print(json.dumps([m for m in {} if m in sys.modules]))\n'
+              ''.format(cmd, list(LAZY_MODULES)))
+    output = subprocess.check_output([sys.executable, '-c', script],
+                                     cwd=ROOT, stderr=subprocess.DEVNULL)
+    assert json.loads(output.decode('utf-8')) == []
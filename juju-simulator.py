@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Stands in for the juju client, serving a simulated model.
+
+juju-simulator.py init DESCRIPTION [--state FILE]
+    Create the simulated model a YAML description describes and print the
+    environment variables pointing kiki at the simulator.
+juju-simulator.py report [--state FILE]
+    Print the number of calls made of each juju command and their time.
+juju-simulator.py COMMAND ...
+    Run a juju command against the model in $JUJU_SIMULATOR_STATE.
+"""
+
+import sys
+
+from os_charms_tools.juju_simulator import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,22 +1,87 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 #
 # Upgrade the OpenStack with Clustering Status Control.
 # Usage: $ ./do-upgrade.py -o cloud:xenial-newton [application-name]
 #
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import os
 import six
-import subprocess
+import sys
 import time
-import yaml
 
+from os_charms_tools.compute_client import (
+    COMPUTE_CLIENTS,
+    DEFAULT_CONCURRENCY as DEFAULT_MIGRATION_CONCURRENCY,
+    DEFAULT_TIMEOUT as DEFAULT_EVACUATE_TIMEOUT,
+    ComputeClientError,
+    EvacuationFailed,
+    enable_hosts,
+    evacuate_hosts,
+    get_compute_client,
+)
+from os_charms_tools.juju_backend import (
+    ACTION_COMPLETED,
+    ACTION_DONE_STATES,
+    BACKENDS,
+    JujuBackendError,
+    UNIT_FIELDS,
+    get_backend,
+)
+from os_charms_tools import profiling
+from os_charms_tools.juju_ratelimit import (
+    DEFAULT_READ_RATE,
+    DEFAULT_WRITE_RATE,
+    RateLimitedBackend,
+)
+from os_charms_tools.kiki.status import StatusSnapshot, UnknownEntity
+from os_charms_tools.upgrade_fleet import (
+    DEFAULT_CONCURRENCY as DEFAULT_FLEET_CONCURRENCY,
+    EVENTS_FILE,
+    JOURNAL_FILE,
+    LOG_FILE,
+    OUTPUT_FILE,
+    FleetUpgrade,
+    model_directory,
+)
+from os_charms_tools.upgrade_journal import (
+    JournalMismatch,
+    UNIT_DONE,
+    UNIT_PAUSED,
+    UNIT_RESUMED,
+    UNIT_UPGRADED,
+    UpgradeJournal,
+)
+from os_charms_tools.upgrade_preflight import (
+    enumerate_actions,
+    hacluster_applications,
+    preflight_problems,
+)
+from os_charms_tools.upgrade_prestage import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_TIMEOUT,
+    UnsupportedOrigin,
+    prestage_units,
+)
+from os_charms_tools.upgrade_probe import upgraded_units
+from os_charms_tools.upgrade_telemetry import UpgradeTelemetry
+from os_charms_tools.upgrade_timings import (
+    BIGBANG,
+    DEFAULT_TIMINGS_FILE,
+    PHASE_BIGBANG,
+    PHASE_EVACUATE,
+    PHASE_PAUSE,
+    PHASE_PRESTAGE,
+    PHASE_RESUME,
+    PHASE_UPGRADE,
+    ROLLING,
+    TimingHistory,
+    UpgradePlan,
+    charm_name,
+)
 
-logging.basicConfig(
-    filename='os-upgrade.log',
-    level=logging.DEBUG,
-    format=('%(asctime)s %(levelname)s '
-            '(%(funcName)s) %(message)s'))
 
 log = logging.getLogger('os_upgrader')
 handler = logging.StreamHandler()
@@ -24,124 +89,89 @@ formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
 handler.setFormatter(formatter)
 log.addHandler(handler)
 
-JUJU_VERSION = 1
-
 
 class Juju(dict):
 
-    def get_service(self, name):
-        if JUJU_VERSION == 1:
-            key = 'services'
-        else:
-            key = 'applications'
+    # The JujuBackend used for every operation, selected in main()
+    backend = None
 
-        if name not in self[key]:
-            return None
+    def __init__(self, status):
+        super(Juju, self).__init__(status)
+        # Every lookup the upgrade makes reads this one index of the status
+        self.snapshot = StatusSnapshot(
+            status=self, fetch=Juju.backend.status,
+            applications_key=Juju.backend.applications_key())
 
-        svc = Service(self[key][name])
+    def get_service(self, name):
+        try:
+            svc = Service(self.snapshot.application(name))
+        except UnknownEntity:
+            return None
         svc['name'] = name
         return svc
 
     @classmethod
-    def set_config_value(self, service, key, value):
+    def set_config_value(cls, service, key, value):
         try:
-            setting = '%s=%s' % (key, value)
-            if JUJU_VERSION == 1:
-                cmd = ['juju', 'set', service, setting]
-            else:
-                cmd = ['juju', 'config', service, setting]
-            subprocess.check_output(cmd)
+            cls.backend.set_config(service, key, value)
             return True
-        except subprocess.CalledProcessError as e:
-            # If the value is already set to the current value
-            # return True to let the calling code know that it
-            # can expect the value is set.
-            print(e)
-            if e.message.lower().index('already') >= 0:
-                return True
-
+        except JujuBackendError as e:
             log.error(e)
             return False
 
     @classmethod
     def run_action(cls, unit_name, action):
         try:
-            if JUJU_VERSION == 1:
-                cmd = ['juju', 'action', 'do', unit_name, action]
-            else:
-                cmd = ['juju', 'run-action', unit_name, action]
-
-            output = subprocess.check_output(cmd)
-            return output.split(':')[1].strip()
-        except subprocess.CalledProcessError as e:
+            return cls.backend.run_action(unit_name, action)
+        except JujuBackendError as e:
             log.error(e)
             raise e
 
     @classmethod
-    def enumerate_actions(cls, service):
+    def run_actions(cls, requests):
         try:
-            if JUJU_VERSION == 1:
-                cmd = ['juju', 'action', 'defined', service]
-            else:
-                cmd = ['juju', 'actions', '--schema', '--format=json',
-                       service]
-
-            output = subprocess.check_output(cmd)
-            actions = yaml.safe_load(output)
-            return actions.keys()
-        except subprocess.CalledProcessError as e:
+            return cls.backend.run_actions(requests)
+        except JujuBackendError as e:
             log.error(e)
             raise e
 
     @classmethod
-    def is_action_done(cls, act_id):
-        """Determines if the action by the action id is currently done or not.
+    def action_statuses(cls, act_ids):
+        """Determines the status of several actions with a single query.
 
-        :param act_id: the action id to query the juju service on the status.
-        :return boolean: True if the actino is done, False otherwise.
+        :param act_ids list<str>: the action ids to query the status of.
+        :return dict: action id to the status of the action.
         """
         try:
-            if JUJU_VERSION == 1:
-                cmd = ['juju', 'action', 'fetch', act_id]
-            else:
-                cmd = ['juju', 'show-action-output', act_id]
-            output = subprocess.check_output(cmd)
-            results = yaml.safe_load(output)
-            return results['status'] in ['completed', 'failed']
-        except subprocess.CalledProcessError as e:
+            return cls.backend.action_statuses(act_ids)
+        except JujuBackendError as e:
             log.error(e)
             raise e
 
     @classmethod
-    def current(cls, service=None):
-        global JUJU_VERSION
-        output = subprocess.check_output(['juju', '--version'])
-        if output.strip().startswith('1.'):
-            JUJU_VERSION = 1
-        else:
-            JUJU_VERSION = 2
+    def enumerate_actions(cls, service):
+        try:
+            return cls.backend.enumerate_actions(service)
+        except JujuBackendError as e:
+            log.error(e)
+            raise e
 
-        cmd = ['juju', 'status']
-        if service:
-            cmd.append(service)
+    @classmethod
+    def current(cls, service=None):
+        return Juju(cls.backend.status(service))
 
-        if JUJU_VERSION == 2:
-            cmd.append('--format=yaml')
+    @classmethod
+    def units(cls, service):
+        """Returns the current status of just the units of the service.
 
-        output = subprocess.check_output(cmd)
-        parsed = yaml.safe_load(output)
-        return Juju(parsed)
+        :param service: the name of the service.
+        :return dict: unit name to the unit fields the upgrade reads.
+        """
+        return cls.backend.units(service)
 
     @classmethod
     def run_on_service(cls, service, command):
-        if JUJU_VERSION == 1:
-            where = '--service'
-        else:
-            where = '--application'
-        cmd = ['juju', 'run', where, service, command]
-        output = subprocess.check_output(cmd)
-        parsed = yaml.safe_load(output)
-        return parsed
+        return cls.backend.run_on_application(service, command)
 
 
 class Service(dict):
@@ -152,14 +182,20 @@ class Service(dict):
     def has_relation(self, rel_name):
         return rel_name in self['relations']
 
+    @property
+    def charm(self):
+        return charm_name(self.get('charm', self.name))
+
     def set_config(self, key, value):
         return Juju.set_config_value(self.name, key, value)
 
     def units(self):
         units = []
-        for name, info in self['units'].iteritems():
-            unit = Unit(info)
+        for name, info in self['units'].items():
+            unit = Unit((field, info[field]) for field in UNIT_FIELDS
+                        if field in info)
             unit['name'] = name
+            unit['charm'] = self.charm
             units.append(unit)
         return units
 
@@ -189,39 +225,50 @@ class Unit(dict):
             return False
         return wl_status.is_upgrading()
 
-    def run_action(self, action):
-        try:
-            action_id = Juju.run_action(self.name, action)
-            while not Juju.is_action_done(action_id):
-                time.sleep(2)
-        except subprocess.CalledProcessError as e:
-            log.error(e)
-            raise e
+    def is_paused(self):
+        wl_status = self.workload_status
+        if wl_status is None:
+            return False
+        return wl_status.is_paused()
+
+    @property
+    def application(self):
+        return self.name.split('/')[0]
+
+    @property
+    def charm(self):
+        return self.get('charm', self.application)
+
+    @property
+    def host(self):
+        return self.get('public-address', self.get('machine'))
 
     def get_hacluster_subordinate_unit(self):
-        if not self['subordinates']:
+        if not self.get('subordinates'):
             return None
         for k in self['subordinates']:
             if k.find('hacluster') >= 0:
                 # TODO(wolsen) hack!
-                return Unit({'name': k})
+                unit = Unit(self['subordinates'][k] or {})
+                unit.update({'name': k, 'charm': 'hacluster',
+                             'machine': self.get('machine')})
+                return unit
 
         return None
 
-    def pause(self):
-        log.info(' Pausing service on unit: %s' % self.name)
-        self.run_action('pause')
-        log.info(' Service on unit %s is paused.' % self.name)
+    def _phase(self, phase):
+        if self.charm == 'hacluster':
+            return 'hacluster-%s' % phase
+        return phase
+
+    def pause_request(self):
+        return (self, 'pause', self._phase(PHASE_PAUSE))
 
-    def resume(self):
-        log.info(' Resuming service on unit: %s' % self.name)
-        self.run_action('resume')
-        log.info(' Service on unit %s has resumed.' % self.name)
+    def resume_request(self):
+        return (self, 'resume', self._phase(PHASE_RESUME))
 
-    def upgrade_openstack(self):
-        log.info(' Upgrading OpenStack for unit: %s' % self.name)
-        self.run_action('openstack-upgrade')
-        log.info(' Completed upgrade for unit: %s' % self.name)
+    def upgrade_request(self):
+        return (self, 'openstack-upgrade', PHASE_UPGRADE)
 
 
 class Status(dict):
@@ -237,6 +284,9 @@ class Status(dict):
     def is_upgrading(self):
         return self.message.lower().find('upgrad') >= 0
 
+    def is_paused(self):
+        return self.message.lower().find('paused') >= 0
+
 
 # The 15.10 charm versions support the big bang upgrade scenario
 # or the rollinng upgrade within a specific service (e.g. all
@@ -274,15 +324,20 @@ ORIGIN_KEYS = {
 }
 
 
-def is_rollable(service):
+def is_rollable(service, configure=True, actions=None):
     """Determines if the service provided is eligible for a rolling
     upgrade or not.
 
     :param service <Service>: the service object describing the service
                               that should be tested for rollable upgrades
+    :param configure <bool>: enable action-managed-upgrade on the service.
+                             When False the model is left untouched.
+    :param actions list<str>: the actions of the service, when already known.
     :return <bool>: True if the service is rollable, false if not.
     """
-    if 'openstack-upgrade' not in Juju.enumerate_actions(service.name):
+    if actions is None:
+        actions = Juju.enumerate_actions(service.name)
+    if 'openstack-upgrade' not in actions:
         # If the service does not have an openstack-upgrade action,
         # then the service cannot be upgraded in a rollable fashion.
         return False
@@ -300,6 +355,9 @@ def is_rollable(service):
         # than rely on the service/application name.
         return False
 
+    if not configure:
+        return True
+
     if not service.set_config('action-managed-upgrade', True):
         log.warning('Failed to enable action-managed-upgrade mode.')
         return False
@@ -307,10 +365,35 @@ def is_rollable(service):
     return True
 
 
+def get_leader(service, units):
+    """Returns the name of the leader unit of the service.
+
+    Juju 2 reports a leader flag for each unit in the status output, so
+    the leader is normally known without asking Juju anything. Only
+    when the status carries no leader information (older controllers)
+    are all units of the service asked with is-leader.
+
+    :param service <Service>: the service to find the leader of
+    :param units list<Unit>: the units of the service
+    :return <str>: the name of the leader unit, None if there is none.
+    """
+    for unit in units:
+        if unit.get('leader'):
+            return unit.name
+
+    log.debug('Status has no leader for %s, asking units' % service.name)
+    is_leader_data = Juju.run_on_service(service.name, 'is-leader')
+    leader_info = [u for u in is_leader_data
+                   if u['Stdout'].strip() == 'True']
+    if not leader_info:
+        return None
+    return leader_info[0]['UnitId']
+
+
 def order_units(service, units):
     """Orders the units by ensuring that the leader is the first unit.
 
-    Queries Juju in order to determine which unit is the leader, and
+    Takes the leader from the status the units were built from, and
     places that unit at the top of the list.
 
     :param service <Service>: the service to order the units by
@@ -320,10 +403,7 @@ def order_units(service, units):
     log.info('Determining ordering for service: %s' % service.name)
     ordered = []
 
-    is_leader_data = Juju.run_on_service(service.name, 'is-leader')
-    leader_info = filter(lambda u: u['Stdout'].strip() == 'True',
-                         is_leader_data)
-    leader_unit = leader_info[0]['UnitId']
+    leader_unit = get_leader(service, units)
     for unit in units:
         if unit.name == leader_unit:
             ordered.insert(0, unit)
@@ -334,52 +414,374 @@ def order_units(service, units):
     return ordered
 
 
+def already_upgraded(service):
+    """Returns the names of the units of the service already on the origin.
+
+    All units of the service are probed at once for the cloud archive
+    pocket configured on them, so that a rerun does not upgrade them
+    again.
+
+    :param service <Service>: the service to probe.
+    :return set<str>: names of the units already on args.origin.
+    """
+    if not args.probe:
+        return set()
+    upgraded = upgraded_units(Juju.backend, service.name, args.origin)
+    if upgraded:
+        log.info('Units of %s already on %s: %s' %
+                 (service.name, args.origin, sorted(upgraded)))
+    return upgraded
+
+
+def is_upgraded(unit, upgraded):
+    """Determines if the unit can be skipped as it is already upgraded.
+
+    A unit left paused, by hand or by an interrupted run, still needs
+    to go through the upgrade so that it is resumed.
+
+    :param unit <Unit>: the unit to check.
+    :param upgraded set<str>: names of the units already on the origin.
+    :return <bool>: True if the unit need not be upgraded.
+    """
+    return (unit.name in upgraded and not unit.is_paused() and
+            not journal.has_step(unit.name, UNIT_PAUSED))
+
+
+def prestage_packages(service, units):
+    """Downloads the packages for the new origin onto the units.
+
+    The units all download at the same time, up to the pre-stage
+    concurrency, so that the packages are already in the apt cache of
+    each unit by the time it is paused and upgraded.
+
+    :param service <Service>: the service the units belong to.
+    :param units list<Unit>: the units to pre-stage packages on.
+    """
+    log.info('Pre-staging packages for %d units of service: %s' %
+             (len(units), service.name))
+    try:
+        results = prestage_units(Juju.backend, [unit.name for unit in units],
+                                 args.origin,
+                                 concurrency=args.prestage_concurrency,
+                                 timeout=args.prestage_timeout)
+    except UnsupportedOrigin as e:
+        log.warning('Not pre-staging packages: %s' % e)
+        return
+
+    for unit in units:
+        result = results[unit.name]
+        telemetry.record(service.name, unit.name, PHASE_PRESTAGE,
+                         result['start'], result['end'],
+                         status='ok' if result['ok'] else 'failed',
+                         host=unit.host, charm=unit.charm)
+    log.info('Pre-staged packages on %d of %d units.' %
+             (len([r for r in results.values() if r['ok']]), len(units)))
+
+
+def run_actions(requests):
+    """Runs actions on several units at once and waits for all of them.
+
+    All actions are queued with a single call and their status is then
+    collected with a single query per poll, rather than queueing and
+    polling every action on its own.
+
+    :param requests list<tuple>: (Unit, action, phase) tuples, the phase
+                                 being the label the action is timed as.
+    :return list<Unit>: the units whose action did not complete.
+    """
+    if not requests:
+        return []
+    start = time.time()
+    action_ids = Juju.run_actions([(unit.name, action)
+                                   for unit, action, _ in requests])
+    pending = dict(zip(action_ids, requests))
+    failed = []
+    while pending:
+        statuses = Juju.action_statuses(list(pending))
+        end = time.time()
+        for act_id, status in statuses.items():
+            if act_id not in pending or status not in ACTION_DONE_STATES:
+                continue
+            unit, action, phase = pending.pop(act_id)
+            ok = status == ACTION_COMPLETED
+            if not ok:
+                log.error('Action %s on unit %s %s.' %
+                          (action, unit.name, status))
+                failed.append(unit)
+            telemetry.record(unit.application, unit.name, phase, start, end,
+                             status='ok' if ok else 'failed',
+                             host=unit.host, charm=unit.charm,
+                             history_phase=action)
+        if pending:
+            time.sleep(2)
+    return failed
+
+
 def perform_rolling_upgrade(service):
     """Performs a rolling upgrade for the specified service.
 
-    Performs a rolling upgrade of the service by iterating through each
-    of the units and runs a juju action do <unit_name> openstack-upgrade
-    and waits for each unit to finish before continuing on to the next.
+    Performs a rolling upgrade of the service in waves of units, the
+    leader being in the first wave. The pause actions of every unit of a
+    wave and of its hacluster subordinate are run as one batch, followed
+    by one batch of openstack-upgrade actions and one batch of resume
+    actions, and each wave finishes before the next one starts.
 
     :param service <Service>: the service object describing the juju service
                               that should be upgraded.
     """
     log.info('Performing a rolling upgrade for service: %s' % service.name)
     avail_actions = Juju.enumerate_actions(service.name)
+    # Probed before the origin is set, see perform_bigbang_upgrade
+    upgraded = already_upgraded(service)
     config_key = ORIGIN_KEYS.get(service.name, 'openstack-origin')
     service.set_config(config_key, args.origin)
 
+    units = []
     for unit in order_units(service, service.units()):
-        log.info('Upgrading unit: %s' % unit.name)
+        if is_upgraded(unit, upgraded):
+            log.info('Skipping unit %s, already on %s.' %
+                     (unit.name, args.origin))
+            journal.record_unit(unit.name, UNIT_DONE)
+            continue
+        units.append(unit)
+
+    if args.prestage:
+        with profiling.phase('prestage'):
+            prestage_packages(service, [
+                unit for unit in units
+                if not journal.has_step(unit.name, UNIT_UPGRADED)])
+
+    remaining = []
+    for unit in units:
+        if journal.is_unit_done(unit.name):
+            log.info('Skipping unit %s, already upgraded.' % unit.name)
+            continue
+        remaining.append(unit)
+
+    # The compute hosts of every unit are found with one command, rather
+    # than one per wave
+    hosts = {}
+    if (args.evacuate and compute and service.name == 'nova-compute' and
+            (remaining or journal.disabled_hosts)):
+        hosts = compute_hosts(service)
+
+    try:
+        wave_size = max(1, args.wave_size)
+        for i in range(0, len(remaining), wave_size):
+            upgrade_wave(service, remaining[i:i + wave_size], avail_actions,
+                         hosts)
+        # Hosts of units an interrupted run upgraded, but died before
+        # enabling
+        upgraded_hosts = sorted(
+            host for unit, host in hosts.items()
+            if host in journal.disabled_hosts and journal.is_unit_done(unit))
+        if upgraded_hosts:
+            enable_compute_hosts(upgraded_hosts)
+    finally:
+        if service.name == 'nova-compute':
+            warn_disabled_hosts()
+
+
+def upgrade_wave(service, units, avail_actions, hosts=None):
+    """Upgrades a wave of units of a service at the same time.
+
+    :param service <Service>: the service the units belong to.
+    :param units list<Unit>: the units of the wave.
+    :param avail_actions list<str>: the actions the service provides.
+    :param hosts dict: unit name to compute host name, for the units of
+                       nova-compute evacuated with a compute client.
+    """
+    names = [unit.name for unit in units]
+    log.info('Upgrading units: %s' % names)
+
+    hosts = hosts or {}
+    if args.evacuate and service.name == 'nova-compute':
+        if compute:
+            with profiling.phase('evacuate'):
+                evacuate_units(service, [
+                    unit for unit in units
+                    if not journal.has_step(unit.name, UNIT_PAUSED)], hosts)
+        else:
+            # Without a compute client the upgrade pauses, allowing the
+            # user to manually intervene with the underlying cloud.
+            for unit in units:
+                six.moves.input('Preparing to upgrade %s. Perform any '
+                                'additional admin actions desired. Press '
+                                'ENTER to proceed.' % unit.name)
+
+    failed = []
+    to_pause = [unit for unit in units
+                if not journal.has_step(unit.name, UNIT_PAUSED)]
+    if args.pause and to_pause:
+        requests = []
+        for unit in to_pause:
+            hacluster_unit = unit.get_hacluster_subordinate_unit()
+            if hacluster_unit:
+                requests.append(hacluster_unit.pause_request())
+            if 'pause' in avail_actions:
+                requests.append(unit.pause_request())
+        log.info(' Pausing services on units: %s' %
+                 [unit.name for unit, _, _ in requests])
+        with profiling.phase('pause'):
+            failed = run_actions(requests)
+    for unit in completed_units(to_pause, failed):
+        journal.record_unit(unit.name, UNIT_PAUSED)
+    stop_on_failure(service, 'pause', failed)
+
+    failed = []
+    to_upgrade = [unit for unit in units
+                  if not journal.has_step(unit.name, UNIT_UPGRADED)]
+    if 'openstack-upgrade' in avail_actions and to_upgrade:
+        log.info(' Upgrading OpenStack for units: %s' %
+                 [unit.name for unit in to_upgrade])
+        with profiling.phase('openstack-upgrade'):
+            failed = run_actions([unit.upgrade_request()
+                                  for unit in to_upgrade])
+    for unit in completed_units(to_upgrade, failed):
+        journal.record_unit(unit.name, UNIT_UPGRADED)
+    stop_on_failure(service, 'openstack-upgrade', failed)
+
+    failed = []
+    to_resume = [unit for unit in units
+                 if not journal.has_step(unit.name, UNIT_RESUMED)]
+    if args.pause and to_resume:
+        requests = []
+        for unit in to_resume:
+            if 'resume' in avail_actions:
+                requests.append(unit.resume_request())
+            hacluster_unit = unit.get_hacluster_subordinate_unit()
+            if hacluster_unit:
+                requests.append(hacluster_unit.resume_request())
+        log.info(' Resuming services on units: %s' %
+                 [unit.name for unit, _, _ in requests])
+        with profiling.phase('resume'):
+            failed = run_actions(requests)
+    for unit in completed_units(to_resume, failed):
+        journal.record_unit(unit.name, UNIT_RESUMED)
+    stop_on_failure(service, 'resume', failed)
+
+    if hosts:
+        enable_compute_hosts([hosts[unit.name] for unit in units
+                              if unit.name in hosts])
+
+    for unit in units:
+        journal.record_unit(unit.name, UNIT_DONE)
+    log.info(' Units %s have finished the upgrade.' % names)
+
+
+def enable_compute_hosts(host_names):
+    """Puts evacuated compute hosts back in service.
+
+    :param host_names list<str>: the compute hosts to enable.
+    """
+    try:
+        enable_hosts(compute, host_names)
+    except ComputeClientError as e:
+        log.error(e)
+        raise SystemExit(1)
+    journal.record_hosts(host_names, enabled=True)
+
+
+def warn_disabled_hosts():
+    """Logs the compute hosts evacuated and not yet back in service."""
+    if journal.disabled_hosts:
+        log.warning('Compute hosts %s are left disabled. A --resume run with '
+                    '--evacuate and --compute-client enables each once its '
+                    'unit is upgraded, or enable them with nova '
+                    'service-enable.' % sorted(journal.disabled_hosts))
+
+
+def completed_units(units, failed):
+    """Returns the units whose actions of a step all completed.
+
+    Only these may have the step journaled, a unit whose action failed,
+    or whose hacluster subordinate's action failed, must run the step
+    again on --resume.
+
+    :param units list<Unit>: the units the step ran on.
+    :param failed list<Unit>: the units whose action did not complete.
+    :return list<Unit>: the units the step succeeded on.
+    """
+    failed_names = set(unit.name for unit in failed)
+    completed = []
+    for unit in units:
         hacluster_unit = unit.get_hacluster_subordinate_unit()
+        if unit.name in failed_names or (
+                hacluster_unit and hacluster_unit.name in failed_names):
+            continue
+        completed.append(unit)
+    return completed
+
+
+def stop_on_failure(service, step, failed):
+    """Stops the upgrade if an action of a step failed on any unit.
+
+    Called once the units the step completed on are journaled, so that
+    --resume runs the step again on the others only.
+
+    :param service <Service>: the service being upgraded.
+    :param step <str>: the step of the wave, for the log.
+    :param failed list<Unit>: the units whose action did not complete.
+    """
+    if not failed:
+        return
+    log.error('The %s step of %s failed on units: %s' %
+              (step, service.name, sorted(unit.name for unit in failed)))
+    log.error('Stopping the upgrade, fix the units and rerun with --resume.')
+    raise SystemExit(1)
 
-        # TODO(wolsen) This is a temporary work around to allow the user
-        # to evacuate a compute node during the upgrade procedure if
-        # desired. This has the effect of pausing the upgrade script to
-        # allow the user to manually intervene with the underlying cloud.
-        # In the future, it would be nice to provide a mechanism to allow
-        # the script to evacuate the node automatically (if desired).
-        if args.evacuate and service.name == 'nova-compute':
-            six.moves.input('Preparing to upgrade %s. Perform any additional '
-                            'admin actions desired. Press ENTER to proceed.' %
-                            unit.name)
 
-        if args.pause and hacluster_unit:
-            hacluster_unit.pause()
+def compute_hosts(service):
+    """Returns the compute host name of every unit of the service.
 
-        if args.pause and 'pause' in avail_actions:
-            unit.pause()
+    :param service <Service>: the nova-compute service.
+    :return dict: unit name to the host name nova knows the unit by.
+    """
+    return dict((result['UnitId'], result['Stdout'].strip())
+                for result in Juju.run_on_service(service.name, 'hostname')
+                if str(result.get('Code', result.get('ReturnCode', 0))) ==
+                '0')
 
-        if 'openstack-upgrade' in avail_actions:
-            unit.upgrade_openstack()
 
-        if args.pause and 'resume' in avail_actions:
-            unit.resume()
+def evacuate_units(service, units, hosts):
+    """Migrates every instance off the compute hosts of the units.
 
-        if args.pause and hacluster_unit:
-            hacluster_unit.resume()
+    The hosts are evacuated at the same time and left disabled until the
+    units have been upgraded, the journal recording them as disabled until
+    then. The upgrade stops if any host can not be emptied.
 
-        log.info(' Unit %s has finished the upgrade.' % unit.name)
+    :param service <Service>: the nova-compute service.
+    :param units list<Unit>: the units whose hosts are evacuated.
+    :param hosts dict: unit name to compute host name.
+    """
+    if not units:
+        return
+    missing = [unit.name for unit in units if unit.name not in hosts]
+    if missing:
+        log.error('Unable to determine the compute host of %s' % missing)
+        raise SystemExit(1)
+
+    log.info(' Evacuating compute hosts of units: %s' %
+             [unit.name for unit in units])
+    # Journaled first, so the hosts are known even if the run dies while
+    # disabling them
+    journal.record_hosts([hosts[unit.name] for unit in units], enabled=False)
+    start = time.time()
+    status = 'failed'
+    try:
+        evacuate_hosts(compute, [hosts[unit.name] for unit in units],
+                       concurrency=args.migration_concurrency,
+                       timeout=args.evacuate_timeout)
+        status = 'ok'
+    except (ComputeClientError, EvacuationFailed) as e:
+        log.error(e)
+        raise SystemExit(1)
+    finally:
+        end = time.time()
+        for unit in units:
+            telemetry.record(service.name, unit.name, PHASE_EVACUATE, start,
+                             end, status=status, host=hosts.get(unit.name),
+                             charm=unit.charm)
 
 
 def perform_bigbang_upgrade(service):
@@ -390,20 +792,87 @@ def perform_bigbang_upgrade(service):
     message is reported.
     """
     log.info('Performing a big-bang upgrade for service: %s' % service.name)
+    # Probed before the origin is set, as config-changed may otherwise
+    # have written the new pocket before apt-get update sees the packages
+    # pending, making units look upgraded
+    upgraded = already_upgraded(service)
+    # The upgrade starts with the config change, and so does its timing
+    start = time.time()
     config_key = ORIGIN_KEYS.get(service.name, 'openstack-origin')
     service.set_config(config_key, args.origin)
 
-    # Give the service a chance to invoke the config-changed hook
-    # for the bigbang upgrade.
-    time.sleep(5)
+    if upgraded and upgraded.issuperset(unit.name for unit in service.units()):
+        log.info('All units of %s are already on %s.' %
+                 (service.name, args.origin))
+        return
+
+    with telemetry.phase(service.name, None, PHASE_BIGBANG, start=start,
+                         charm=service.charm):
+        # Give the service a chance to invoke the config-changed hook
+        # for the bigbang upgrade.
+        time.sleep(5)
+
+        waiting = set(unit.name for unit in service.units())
+        upgrade_in_progress = True
+        while upgrade_in_progress:
+            service['units'] = Juju.units(service.name)
+            upgrading = set()
+            for unit in service.units():
+                if unit.is_upgrading():
+                    upgrading.add(unit.name)
+                elif unit.name in waiting:
+                    waiting.discard(unit.name)
+                    telemetry.record(service.name, unit.name, PHASE_BIGBANG,
+                                     start, time.time(), host=unit.host)
+            upgrade_in_progress = bool(upgrading)
+            if upgrade_in_progress:
+                time.sleep(5)
+
+
+def plan_upgrade(env):
+    """Builds the upgrade plan without changing anything in the model.
+
+    :param env <Juju>: the current status of the model.
+    :return <UpgradePlan>: the ordered plan with duration estimates.
+    """
+    plan = UpgradePlan(telemetry.history, pause=args.pause,
+                       wave_size=args.wave_size,
+                       prestage_concurrency=(args.prestage and
+                                             args.prestage_concurrency))
+    for service in applications_to_upgrade():
+        if journal.is_application_done(service):
+            continue
 
-    upgrade_in_progress = True
-    while upgrade_in_progress:
-        service = Juju.current().get_service(service.name)
-        unit_uip = [u.is_upgrading() for u in service.units()]
-        upgrade_in_progress = any(unit_uip)
-        if upgrade_in_progress:
-            time.sleep(5)
+        svc = env.get_service(service)
+        if not svc:
+            log.warning('Unable to find application %s', service)
+            continue
+
+        rollable = is_rollable(svc, configure=False)
+        units = svc.units()
+        if rollable:
+            units = order_units(svc, units)
+        upgraded = already_upgraded(svc)
+        units = [unit for unit in units
+                 if not journal.is_unit_done(unit.name) and
+                 not is_upgraded(unit, upgraded)]
+        if not units:
+            continue
+
+        if rollable:
+            hacluster = any(unit.get_hacluster_subordinate_unit()
+                            for unit in units)
+            plan.add_application(svc.name, svc.charm, ROLLING,
+                                 [unit.name for unit in units],
+                                 hacluster=hacluster,
+                                 actions=Juju.enumerate_actions(svc.name),
+                                 evacuate=bool(args.evacuate and
+                                               args.compute_client and
+                                               svc.name == 'nova-compute'))
+        else:
+            plan.add_application(svc.name, svc.charm, BIGBANG,
+                                 [unit.name for unit in units])
+    return plan
 
 
 def main():
@@ -423,19 +892,336 @@ def main():
     parser.add_argument('-e', '--evacuate', action='store_true',
                         help='Prompt before upgrading nova-compute units to '
                              'allow the compute host to be evacuated prior to '
-                             'upgrading the unit.')
+                             'upgrading the unit, or with --compute-client '
+                             'to evacuate the host automatically.')
+    parser.add_argument('--compute-client',
+                        choices=sorted(c for c in COMPUTE_CLIENTS
+                                       if c != 'fake'),
+                        help='Compute API client used to evacuate '
+                             'nova-compute hosts with --evacuate, instead of '
+                             'prompting. nova requires python-novaclient and '
+                             'the OS_* credentials in the environment.')
+    parser.add_argument('--migration-concurrency', type=int,
+                        default=DEFAULT_MIGRATION_CONCURRENCY,
+                        help='Number of instances migrated at the same time '
+                             'when evacuating hosts. Default: %d' %
+                             DEFAULT_MIGRATION_CONCURRENCY)
+    parser.add_argument('--evacuate-timeout', type=int,
+                        default=DEFAULT_EVACUATE_TIMEOUT,
+                        help='Seconds the compute hosts of a wave are given '
+                             'to be emptied. Default: %d' %
+                             DEFAULT_EVACUATE_TIMEOUT)
+    parser.add_argument('-b', '--backend', default='cli',
+                        choices=sorted(b for b in BACKENDS if b != 'fake'),
+                        help='How to talk to Juju. cli forks the juju client '
+                             'for every operation, api keeps a single '
+                             'connection to the controller open and requires '
+                             'python-libjuju. Default: cli')
+    parser.add_argument('-m', '--model',
+                        help='The [controller:]model to upgrade. Default: '
+                             'the current model.')
+    parser.add_argument('--fleet', action='append', metavar='MODELS',
+                        help='Comma separated [controller:]models to upgrade '
+                             'at the same time, each by its own os-upgrade '
+                             'process. May be given more than once.')
+    parser.add_argument('--fleet-concurrency', type=int,
+                        default=DEFAULT_FLEET_CONCURRENCY,
+                        help='Number of models of the fleet upgraded at the '
+                             'same time. Default: %d' %
+                             DEFAULT_FLEET_CONCURRENCY)
+    parser.add_argument('--fleet-dir', default='os-upgrade-fleet',
+                        help='Directory under which each model of the fleet '
+                             'gets a directory for its log, journal and '
+                             'events. Default: os-upgrade-fleet')
+    parser.add_argument('-w', '--wave-size', type=int, default=1,
+                        help='Number of units of an application upgraded at '
+                             'the same time during a rolling upgrade. Their '
+                             'pause, upgrade and resume actions each run as '
+                             'one batch. Default: 1')
+    parser.add_argument('--read-rate', type=float, default=DEFAULT_READ_RATE,
+                        help='Maximum number of Juju status and action '
+                             'status queries per second. Lowered '
+                             'automatically while the controller is failing '
+                             'or slow. Default: %s' % DEFAULT_READ_RATE)
+    parser.add_argument('--write-rate', type=float,
+                        default=DEFAULT_WRITE_RATE,
+                        help='Maximum number of Juju config changes, actions '
+                             'and commands started per second. Lowered '
+                             'automatically while the controller is failing '
+                             'or slow. Default: %s' % DEFAULT_WRITE_RATE)
+    parser.add_argument('-s', '--prestage', action='store_true',
+                        help='Download the new packages onto all units of '
+                             'an application before its rolling upgrade '
+                             'starts, so paused units only install them.')
+    parser.add_argument('--prestage-concurrency', type=int,
+                        default=DEFAULT_CONCURRENCY,
+                        help='Number of units to pre-stage packages on at '
+                             'the same time. Default: %d' %
+                             DEFAULT_CONCURRENCY)
+    parser.add_argument('--prestage-timeout', type=int,
+                        default=DEFAULT_TIMEOUT,
+                        help='Seconds each unit is given to pre-stage its '
+                             'packages. Default: %d' % DEFAULT_TIMEOUT)
+    parser.add_argument('--no-probe', dest='probe', action='store_false',
+                        help='Do not probe units for the cloud archive '
+                             'pocket they are on. By default units already '
+                             'on the origin are not upgraded again.')
+    parser.add_argument('--skip-preflight', action='store_true',
+                        help='Upgrade without first checking that every '
+                             'unit is active and idle, every hacluster has '
+                             'quorum and the charms provide the actions the '
+                             'upgrade runs.')
+    parser.add_argument('-j', '--journal', default='os-upgrade.journal',
+                        help='File in which upgrade progress is recorded. '
+                             'Default: os-upgrade.journal')
+    parser.add_argument('-r', '--resume', action='store_true',
+                        help='Resume an interrupted upgrade, skipping the '
+                             'units and applications the journal records as '
+                             'already upgraded.')
+    parser.add_argument('--plan', action='store_true',
+                        help='Print the ordered upgrade plan with duration '
+                             'estimates from previous runs, then exit '
+                             'without upgrading anything.')
+    parser.add_argument('--timings', default=DEFAULT_TIMINGS_FILE,
+                        help='File in which the duration of each upgrade '
+                             'phase is recorded for future estimates. '
+                             'Default: %s' % DEFAULT_TIMINGS_FILE)
+    parser.add_argument('--log-file', default='os-upgrade.log',
+                        help='File the debug log is written to. Default: '
+                             'os-upgrade.log')
+    parser.add_argument('--events-file', default='os-upgrade.events',
+                        help='File to which a JSON document is appended for '
+                             'every upgrade phase of every unit. Default: '
+                             'os-upgrade.events')
+    parser.add_argument('--prometheus-file',
+                        help='Prometheus textfile collector file to write '
+                             'upgrade phase metrics to, i.e. '
+                             '/var/lib/prometheus/node-exporter/'
+                             'os_upgrade.prom')
+    parser.add_argument('--profile', nargs='?', const='os-upgrade.profile',
+                        metavar='PREFIX',
+                        help='Profile the upgrade, writing PREFIX.pstats, '
+                             'PREFIX.txt, PREFIX.collapsed and '
+                             'PREFIX.phases. Default PREFIX: '
+                             'os-upgrade.profile')
     parser.add_argument('app', metavar='app', type=str, nargs='*',
                         help='target app to upgrade')
     args = parser.parse_args()
+    if args.fleet and args.model:
+        parser.error('--model and --fleet are mutually exclusive')
+    fleet = [model for models in args.fleet or []
+             for model in models.split(',') if model]
+    duplicates = sorted(set(model for model in fleet
+                            if fleet.count(model) > 1))
+    if duplicates:
+        parser.error('--fleet lists models more than once: %s' %
+                     ', '.join(duplicates))
+    if args.fleet and args.evacuate and not args.compute_client:
+        parser.error('--evacuate without --compute-client prompts for '
+                     'input, which is not possible for the models of a '
+                     'fleet')
+
+    logging.basicConfig(
+        filename=args.log_file,
+        level=logging.DEBUG,
+        format=('%(asctime)s %(levelname)s '
+                '(%(funcName)s) %(message)s'))
+
+    if args.profile:
+        profiling.start(args.profile)
+    try:
+        if args.fleet:
+            upgrade_fleet(fleet)
+        else:
+            execute()
+    finally:
+        profiling.stop()
 
-    env = Juju.current()
 
-    if args.app:
-        to_upgrade = args.app
+def execute():
+    """Plans or performs the upgrade of the model, as args ask."""
+    global compute, journal, telemetry
+    compute = None
+    if args.evacuate and args.compute_client and not args.plan:
+        try:
+            compute = get_compute_client(args.compute_client)
+        except ComputeClientError as e:
+            log.error(e)
+            raise SystemExit(1)
+
+    timings = TimingHistory(args.timings)
+    labels = {'model': args.model} if args.model else None
+    telemetry = UpgradeTelemetry(args.events_file, args.prometheus_file,
+                                 history=timings, labels=labels)
+    journal = UpgradeJournal(args.journal)
+    if args.plan:
+        if args.resume:
+            journal.load()
     else:
-        to_upgrade = SERVICES
+        try:
+            journal.start(args.origin, resume=args.resume)
+        except JournalMismatch as e:
+            log.error(e)
+            raise SystemExit(1)
+        if not compute:
+            warn_disabled_hosts()
+
+    backend_args = {'model': args.model} if args.model else {}
+    Juju.backend = RateLimitedBackend(get_backend(args.backend,
+                                                  **backend_args),
+                                      read_rate=args.read_rate,
+                                      write_rate=args.write_rate)
+    try:
+        with profiling.phase('status'):
+            env = Juju.current()
+        with profiling.phase('preflight'):
+            problems = [] if args.skip_preflight else preflight(env)
+        if args.plan:
+            print('Upgrade plan to %s' % args.origin)
+            with profiling.phase('plan'):
+                plan = plan_upgrade(env)
+            print(plan.format())
+            if problems:
+                print('\nPre-flight problems:')
+                for problem in problems:
+                    print('  %s' % problem)
+        elif problems:
+            for problem in problems:
+                log.error('Pre-flight check failed: %s' % problem)
+            log.error('Not upgrading, fix the problems or run with '
+                      '--skip-preflight.')
+            raise SystemExit(1)
+        else:
+            with profiling.phase('upgrade'):
+                upgrade(env)
+    finally:
+        telemetry.flush()
+        Juju.backend.close()
+
+
+def preflight(env):
+    """Checks that every application to upgrade is fit to be upgraded.
+
+    All checks read the one status snapshot the upgrade starts from. The
+    actions of the applications are listed at the same time.
+
+    :param env <Juju>: the current status of the model.
+    :return list<str>: the problems found, empty if the upgrade may start.
+    """
+    targets = [service for service in applications_to_upgrade()
+               if not journal.is_application_done(service)]
+    clusters = hacluster_applications(env.snapshot, targets)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        actions = enumerate_actions(Juju.backend, targets + clusters,
+                                    executor)
+
+    rolling = {}
+    for service in targets:
+        svc = env.get_service(service)
+        if (svc and service in actions and
+                is_rollable(svc, configure=False, actions=actions[service])):
+            rolling[service] = actions[service]
+    for cluster in clusters:
+        if cluster in actions:
+            rolling[cluster] = actions[cluster]
+
+    required = ['pause', 'resume'] if args.pause else []
+    in_progress = [unit for unit in journal.units
+                   if not journal.is_unit_done(unit)]
+    return preflight_problems(env.snapshot, targets, actions=rolling,
+                              required_actions=required,
+                              hacluster_actions=required,
+                              allow_paused=in_progress)
+
+
+def fleet_command(model, directory):
+    """Returns the command line which upgrades one model of the fleet.
+
+    The model is upgraded with the options given for the fleet, its log,
+    journal and events being kept in the directory of the model.
+
+    :param model <str>: the [controller:]model to upgrade.
+    :param directory <str>: the directory of the model.
+    :return list<str>: the command line.
+    """
+    cmd = [sys.executable, os.path.abspath(__file__),
+           '--model', model,
+           '--origin', args.origin,
+           '--backend', args.backend,
+           '--wave-size', str(args.wave_size),
+           '--read-rate', str(args.read_rate),
+           '--write-rate', str(args.write_rate),
+           '--prestage-concurrency', str(args.prestage_concurrency),
+           '--prestage-timeout', str(args.prestage_timeout),
+           '--migration-concurrency', str(args.migration_concurrency),
+           '--evacuate-timeout', str(args.evacuate_timeout),
+           '--timings', args.timings,
+           '--journal', os.path.join(directory, JOURNAL_FILE),
+           '--log-file', os.path.join(directory, LOG_FILE),
+           '--events-file', os.path.join(directory, EVENTS_FILE)]
+    for flag, enabled in [('--pause', args.pause),
+                          ('--evacuate', args.evacuate),
+                          ('--skip-preflight', args.skip_preflight),
+                          ('--prestage', args.prestage),
+                          ('--no-probe', not args.probe),
+                          ('--resume', args.resume),
+                          ('--plan', args.plan)]:
+        if enabled:
+            cmd.append(flag)
+    if args.compute_client:
+        cmd.extend(['--compute-client', args.compute_client])
+    if args.profile:
+        cmd.extend(['--profile', os.path.join(
+            directory, os.path.basename(args.profile))])
+    if args.prometheus_file:
+        # One textfile per model, the samples are labelled with the model
+        base, ext = os.path.splitext(args.prometheus_file)
+        cmd.extend(['--prometheus-file', '%s_%s%s' % (
+            base, os.path.basename(model_directory('', model)), ext)])
+    return cmd + args.app
+
+
+def upgrade_fleet(models):
+    """Upgrades several models at the same time.
+
+    :param models list<str>: the [controller:]models to upgrade.
+    """
+    # Report the progress of the fleet on the console as well
+    log.removeHandler(handler)
+    logging.getLogger().addHandler(handler)
+
+    fleet = FleetUpgrade(models, fleet_command, args.fleet_dir,
+                         concurrency=args.fleet_concurrency)
+    returncodes = fleet.run()
+    if args.plan:
+        for model in models:
+            print('Model %s' % model)
+            with open(os.path.join(model_directory(args.fleet_dir, model),
+                                   OUTPUT_FILE)) as output:
+                print(output.read())
+    failed = sorted(model for model, code in returncodes.items() if code)
+    if failed:
+        log.error('Upgrade failed for models: %s' % ', '.join(failed))
+        raise SystemExit(1)
+
+
+def applications_to_upgrade():
+    """Returns the names of the applications to upgrade, in order."""
+    if args.app:
+        return args.app
+    return SERVICES
+
+
+def upgrade(env):
+    """Upgrades each of the requested applications in turn.
+
+    :param env <Juju>: the current status of the model.
+    """
+    for service in applications_to_upgrade():
+        if journal.is_application_done(service):
+            log.info('Skipping %s, already upgraded.', service)
+            continue
 
-    for service in to_upgrade:
         log.info('Upgrading %s', service)
         svc = env.get_service(service)
 
@@ -443,10 +1229,12 @@ def main():
             log.error('Unable to find application %s', service)
             continue
 
-        if is_rollable(svc):
-            perform_rolling_upgrade(svc)
-        else:
-            perform_bigbang_upgrade(svc)
+        with profiling.phase(service):
+            if is_rollable(svc):
+                perform_rolling_upgrade(svc)
+            else:
+                perform_bigbang_upgrade(svc)
+        journal.record_application(service)
 
 
 if __name__ == '__main__':
@@ -16,9 +16,9 @@
 
 
 import logging
-import yaml
 
 import os_charms_tools.control_data_common as control_data
+from os_charms_tools import yaml_io
 from os_charms_tools.charm_store import cs_query
 
 __author__ = 'David Ames <david.ames@canonical.com>'
@@ -122,7 +122,7 @@ class Charm(object):
         return {self.application_name: charm_attr_dict}
 
     def get_yaml(self):
-        return yaml.dump(self.get_dict())
+        return yaml_io.dump(self.get_dict())
 
     def set_charm_name(self):
         self.charm_name = self.application_name
@@ -17,8 +17,9 @@
 
 import logging
 from pprint import pprint
-import urllib3
-import yaml
+import threading
+
+from os_charms_tools import yaml_io
 
 
 __author__ = 'James Page <james.page@canonical.com'
@@ -26,6 +27,23 @@ __author__ = 'James Page <james.page@canonical.com'
 VERSION = 'v5'
 API_URL = "https://api.jujucharms.com/charmstore/{}/{}/{}/meta/{}"
 
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool_manager():
+    """ Return the connection pool shared by charm store queries
+
+    urllib3 is only imported by the first query, so renders which never
+    reach the charm store do not pay for it.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import urllib3
+            _pool = urllib3.PoolManager()
+    return _pool
+
 
 def cs_query(charm, series, uri=''):
     """ Query the charm store
@@ -67,10 +85,9 @@ def cs_query(charm, series, uri=''):
          'terms']
     """
     url = API_URL.format(VERSION, series, charm, uri)
-    http = urllib3.PoolManager()
-    result = http.request('GET', url)
+    result = pool_manager().request('GET', url)
     if result.status == 200:
-        return yaml.load(result.data)
+        return yaml_io.load(result.data)
     else:
         logging.error("FAILED to query: charm: {}, series {}, uri: {}, "
                       "result:{}".format(charm, series, uri, result.status))
@@ -0,0 +1,394 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Evacuate compute hosts through a pluggable compute API client.
+
+Two clients are provided:
+
+ nova: talks to the Nova API with python-novaclient, authenticating with the
+       usual OS_* environment variables.
+ fake: an in-memory cloud for exercising evacuations without one.
+
+The hosts are disabled first, so the scheduler does not place instances on a
+host about to be emptied, then their instances are migrated away a bounded
+number at a time. Running instances are live-migrated, stopped instances are
+cold-migrated.
+
+Usage:
+
+client = get_compute_client('nova')
+evacuate_hosts(client, ['compute-1', 'compute-2'], concurrency=4)
+...
+enable_hosts(client, ['compute-1', 'compute-2'])
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import logging
+import os
+import threading
+import time
+
+# Default number of instances migrated at the same time
+DEFAULT_CONCURRENCY = 4
+# Default seconds a host is given to be emptied
+DEFAULT_TIMEOUT = 3600
+# Seconds between checks on a migrating instance
+POLL_INTERVAL = 5
+
+EVACUATE_REASON = 'os-upgrade: evacuated for the OpenStack upgrade'
+
+ACTIVE = 'ACTIVE'
+SHUTOFF = 'SHUTOFF'
+ERROR = 'ERROR'
+VERIFY_RESIZE = 'VERIFY_RESIZE'
+# Instances in these states are moving between hosts
+MIGRATING_STATES = ['MIGRATING', 'RESIZE']
+
+
+class ComputeClientError(Exception):
+    pass
+
+
+class EvacuationFailed(Exception):
+    pass
+
+
+class ComputeClient(object):
+    """Interface for the compute API operations evacuation relies upon
+
+    Instances are returned as dictionaries with id, status and host keys.
+    Every operation raises ComputeClientError when the API fails.
+    """
+
+    def disable_host(self, host, reason=EVACUATE_REASON):
+        """Stop the scheduler placing instances on host"""
+        raise NotImplementedError
+
+    def enable_host(self, host):
+        """Let the scheduler place instances on host again"""
+        raise NotImplementedError
+
+    def instances(self, host):
+        """Return the instances on host, of every project"""
+        raise NotImplementedError
+
+    def instance(self, instance_id):
+        """Return one instance"""
+        raise NotImplementedError
+
+    def live_migrate(self, instance_id):
+        """Live-migrate a running instance to a host of the scheduler's
+        choosing"""
+        raise NotImplementedError
+
+    def cold_migrate(self, instance_id):
+        """Migrate a stopped instance to a host of the scheduler's choosing
+
+        The instance ends up in VERIFY_RESIZE, waiting for
+        confirm_migration().
+        """
+        raise NotImplementedError
+
+    def confirm_migration(self, instance_id):
+        raise NotImplementedError
+
+
+class NovaClient(ComputeClient):
+    """Client for the Nova API
+
+    Credentials are taken from the OS_* environment variables, as for the
+    openstack client.
+    """
+
+    # Lowest microversion accepting block_migration='auto'
+    API_VERSION = '2.25'
+
+    def __init__(self, env=None):
+        try:
+            from keystoneauth1 import exceptions as auth_exceptions
+            from keystoneauth1 import loading
+            from keystoneauth1 import session
+            from novaclient import client
+            from novaclient import exceptions as nova_exceptions
+        except ImportError:
+            raise ComputeClientError('The nova compute client requires '
+                                     'python-novaclient. Install it with: '
+                                     'pip install python-novaclient')
+        env = os.environ if env is None else env
+        try:
+            auth = loading.get_plugin_loader('password').load_from_options(
+                auth_url=env['OS_AUTH_URL'],
+                username=env['OS_USERNAME'],
+                password=env['OS_PASSWORD'],
+                project_name=env.get('OS_PROJECT_NAME',
+                                     env.get('OS_TENANT_NAME')),
+                user_domain_name=env.get('OS_USER_DOMAIN_NAME'),
+                project_domain_name=env.get('OS_PROJECT_DOMAIN_NAME'))
+        except KeyError as e:
+            raise ComputeClientError('{} is not set in the environment'
+                                     ''.format(e))
+        # Failures of the API or of authentication, raised on any call
+        self._errors = (auth_exceptions.ClientException,
+                        nova_exceptions.ClientException)
+        self._nova = client.Client(self.API_VERSION,
+                                   session=session.Session(auth=auth),
+                                   region_name=env.get('OS_REGION_NAME'))
+
+    @staticmethod
+    def _instance_dict(server):
+        return {'id': server.id,
+                'status': server.status,
+                'host': getattr(server, 'OS-EXT-SRV-ATTR:host', None)}
+
+    def _call(self, what, method, *args, **kwargs):
+        """Call a novaclient method, raising ComputeClientError on failure
+
+        :param: what: the operation and the host or instance it is about,
+                      for the error message
+        """
+        try:
+            return method(*args, **kwargs)
+        except self._errors as e:
+            raise ComputeClientError('Unable to {}: {}'.format(what, e))
+
+    def disable_host(self, host, reason=EVACUATE_REASON):
+        self._call('disable host {}'.format(host),
+                   self._nova.services.disable_log_reason, host,
+                   'nova-compute', reason)
+
+    def enable_host(self, host):
+        self._call('enable host {}'.format(host), self._nova.services.enable,
+                   host, 'nova-compute')
+
+    def instances(self, host):
+        servers = self._call('list the instances of {}'.format(host),
+                             self._nova.servers.list,
+                             search_opts={'host': host, 'all_tenants': True})
+        return [self._instance_dict(server) for server in servers]
+
+    def instance(self, instance_id):
+        return self._instance_dict(self._call(
+            'get instance {}'.format(instance_id), self._nova.servers.get,
+            instance_id))
+
+    def live_migrate(self, instance_id):
+        self._call('live-migrate {}'.format(instance_id),
+                   self._nova.servers.live_migrate, instance_id, None, 'auto')
+
+    def cold_migrate(self, instance_id):
+        self._call('migrate {}'.format(instance_id),
+                   self._nova.servers.migrate, instance_id)
+
+    def confirm_migration(self, instance_id):
+        self._call('confirm the migration of {}'.format(instance_id),
+                   self._nova.servers.confirm_resize, instance_id)
+
+
+class FakeComputeClient(ComputeClient):
+    """In-memory compute API
+
+    Migrated instances move to the enabled host with the fewest instances
+    after migration_polls calls to instance().
+
+    :param: hosts: dictionary of host name to the number of instances on it
+    :param: stopped: ids of the instances which are stopped
+    """
+
+    def __init__(self, hosts=None, stopped=(), migration_polls=0):
+        self.migration_polls = migration_polls
+        self.hosts = sorted(hosts or {})
+        self.disabled = set()
+        self.calls = []
+        self._instances = {}
+        self._migrations = {}
+        self._lock = threading.Lock()
+        ids = itertools.count()
+        for host, count in sorted((hosts or {}).items()):
+            for _ in range(count):
+                instance_id = 'i-{}'.format(next(ids))
+                self._instances[instance_id] = {
+                    'id': instance_id, 'host': host,
+                    'status': SHUTOFF if instance_id in stopped else ACTIVE}
+
+    def _record(self, *call):
+        with self._lock:
+            self.calls.append(call)
+
+    def disable_host(self, host, reason=EVACUATE_REASON):
+        self._record('disable_host', host)
+        self.disabled.add(host)
+
+    def enable_host(self, host):
+        self._record('enable_host', host)
+        self.disabled.discard(host)
+
+    def instances(self, host):
+        with self._lock:
+            return [dict(i) for i in self._instances.values()
+                    if i['host'] == host]
+
+    def instance(self, instance_id):
+        with self._lock:
+            instance = self._instances[instance_id]
+            migration = self._migrations.get(instance_id)
+            if migration is not None:
+                if migration['polls'] > 0:
+                    migration['polls'] -= 1
+                else:
+                    del self._migrations[instance_id]
+                    instance['host'] = migration['target']
+                    instance['status'] = migration['status']
+            return dict(instance)
+
+    def _migrate(self, instance_id, status, final_status):
+        with self._lock:
+            instance = self._instances[instance_id]
+            loads = dict((host, 0) for host in self.hosts)
+            for i in self._instances.values():
+                loads[i['host']] += 1
+            targets = sorted((load, host) for host, load in loads.items()
+                             if host not in self.disabled and
+                             host != instance['host'])
+            if not targets:
+                raise ComputeClientError('No valid host was found for '
+                                         '{}'.format(instance_id))
+            instance['status'] = status
+            self._migrations[instance_id] = {'target': targets[0][1],
+                                             'status': final_status,
+                                             'polls': self.migration_polls}
+
+    def live_migrate(self, instance_id):
+        self._record('live_migrate', instance_id)
+        self._migrate(instance_id, 'MIGRATING', ACTIVE)
+
+    def cold_migrate(self, instance_id):
+        self._record('cold_migrate', instance_id)
+        self._migrate(instance_id, 'RESIZE', VERIFY_RESIZE)
+
+    def confirm_migration(self, instance_id):
+        self._record('confirm_migration', instance_id)
+        with self._lock:
+            self._instances[instance_id]['status'] = SHUTOFF
+
+
+COMPUTE_CLIENTS = {
+    'nova': NovaClient,
+    'fake': FakeComputeClient,
+}
+
+
+def get_compute_client(name, **kwargs):
+    """Return an instance of the named compute client
+
+    :param: name: one of the keys of COMPUTE_CLIENTS
+    :raises ComputeClientError: for an unknown client name
+    """
+    try:
+        client_class = COMPUTE_CLIENTS[name]
+    except KeyError:
+        raise ComputeClientError('Unknown compute client {}. Valid clients '
+                                 'are: {}'.format(name, ', '.join(
+                                     sorted(COMPUTE_CLIENTS))))
+    return client_class(**kwargs)
+
+
+def migrate_instance(client, instance, deadline):
+    """Move one instance off its host and wait for it to land elsewhere
+
+    :param: instance: dictionary with id, status and host keys
+    :param: deadline: time.time() by which the instance must have moved
+    :raises EvacuationFailed: if the instance could not be moved
+    """
+    instance_id, host = instance['id'], instance['host']
+    try:
+        if instance['status'] == ACTIVE:
+            client.live_migrate(instance_id)
+        elif instance['status'] == SHUTOFF:
+            client.cold_migrate(instance_id)
+        else:
+            raise EvacuationFailed('Unable to migrate {} instance {} off {}'
+                                   ''.format(instance['status'], instance_id,
+                                             host))
+        while True:
+            current = client.instance(instance_id)
+            if current['status'] == ERROR:
+                raise EvacuationFailed('Migration of {} off {} failed'
+                                       ''.format(instance_id, host))
+            if (current['host'] != host and
+                    current['status'] not in MIGRATING_STATES):
+                break
+            if time.time() > deadline:
+                raise EvacuationFailed('Timed out migrating {} off {}'
+                                       ''.format(instance_id, host))
+            time.sleep(POLL_INTERVAL)
+        if current['status'] == VERIFY_RESIZE:
+            client.confirm_migration(instance_id)
+    except ComputeClientError as e:
+        raise EvacuationFailed('Unable to migrate {} off {}: {}'
+                               ''.format(instance_id, host, e))
+    logging.debug("Migrated {} from {} to {}".format(instance_id, host,
+                                                     current['host']))
+
+
+def evacuate_hosts(client, hosts, concurrency=DEFAULT_CONCURRENCY,
+                   timeout=DEFAULT_TIMEOUT):
+    """Disable hosts and migrate every instance off them
+
+    The instances of all hosts share one pool of concurrency migrations.
+    Hosts are left disabled, enable_hosts() puts them back in service.
+
+    :param: hosts: names of the compute hosts to empty
+    :param: concurrency: maximum number of instances migrating at once
+    :param: timeout: seconds the hosts are given to be emptied
+    :raises EvacuationFailed: if any instance is left on the hosts
+    """
+    deadline = time.time() + timeout
+    instances = []
+    for host in hosts:
+        client.disable_host(host)
+        instances.extend(client.instances(host))
+    logging.info("Migrating {} instances off {}".format(len(instances),
+                                                        ', '.join(hosts)))
+
+    def migrate(instance):
+        try:
+            migrate_instance(client, instance, deadline)
+        except EvacuationFailed as e:
+            logging.error(e)
+            return e
+
+    if instances:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            errors = [e for e in executor.map(migrate, instances) if e]
+        if errors:
+            raise EvacuationFailed('{} of {} instances could not be migrated '
+                                   'off {}'.format(len(errors),
+                                                   len(instances),
+                                                   ', '.join(hosts)))
+
+    # Instances created while the hosts were being disabled
+    remaining = [i['id'] for host in hosts for i in client.instances(host)]
+    if remaining:
+        raise EvacuationFailed('Instances still on {}: {}'.format(
+            ', '.join(hosts), ', '.join(remaining)))
+
+
+def enable_hosts(client, hosts):
+    """Put hosts back in service after their upgrade"""
+    for host in hosts:
+        client.enable_host(host)
@@ -0,0 +1,684 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pluggable backends for the Juju operations used by os-upgrade.
+
+Three implementations are provided:
+
+ cli:  forks the juju client for every operation (the historic behaviour).
+ api:  keeps one authenticated websocket connection to the controller open
+       for the lifetime of the process. Requires python-libjuju.
+ fake: an in-memory model for exercising upgrade logic without a
+       controller.
+
+Usage:
+
+backend = get_backend('cli')
+status = backend.status('keystone')
+action_id = backend.run_action('keystone/0', 'pause')
+backend.action_result(action_id)['status']
+"""
+
+from copy import deepcopy
+import itertools
+import json
+import logging
+import re
+import threading
+
+from os_charms_tools import kiki
+from os_charms_tools import yaml_io
+from os_charms_tools.kiki.runner import Runner
+
+try:
+    # Status of large models runs to megabytes, prefer a fast decoder
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        json_loads = json.loads
+
+# The only state of an action which ran successfully
+ACTION_COMPLETED = 'completed'
+# Action states after which an action will not change any more
+ACTION_DONE_STATES = [ACTION_COMPLETED, 'failed', 'cancelled', 'aborted',
+                      'error']
+
+# The unit status fields the upgrade tooling reads
+UNIT_FIELDS = (
+    'workload-status',
+    'juju-status',
+    'agent-status',
+    'subordinates',
+    'leader',
+    'machine',
+    'public-address',
+)
+
+
+def extract_units(status, application, applications_key='applications'):
+    """Return the units of an application from status
+
+    Only the UNIT_FIELDS of each unit are picked out, the rest of the status
+    is neither walked nor copied.
+
+    @param status: dictionary of status data
+    @param application: name of the application
+    @param applications_key: key applications are listed under in status
+    @returns dictionary of unit name to dictionary of unit fields, None if
+             the application is not in status
+    """
+    app = (status.get(applications_key) or {}).get(application)
+    if app is None:
+        return None
+    units = {}
+    for name, info in (app.get('units') or {}).items():
+        units[name] = dict((field, info[field]) for field in UNIT_FIELDS
+                           if field in info)
+    return units
+
+
+class JujuBackendError(Exception):
+    pass
+
+
+class JujuBackend(object):
+    """Interface for the Juju operations os-upgrade relies upon
+
+    Backends return plain python data shaped like the yaml output of the juju
+    client so that callers do not need to care which backend is in use.
+    """
+
+    # Major version of the juju controller/client being spoken to
+    juju_version = 2
+
+    def applications_key(self):
+        """Return the status key under which applications are listed
+
+        @returns string 'services' for Juju 1.x, 'applications' otherwise
+        """
+        if self.juju_version == 1:
+            return 'services'
+        return 'applications'
+
+    def status(self, application=None):
+        """Return the model status
+
+        @param application: optionally restrict the status to one application
+        @returns dictionary of status data
+        """
+        raise NotImplementedError
+
+    def set_config(self, application, key, value):
+        """Set a config option on an application
+
+        @raises JujuBackendError: if the option could not be set
+        """
+        raise NotImplementedError
+
+    def enumerate_actions(self, application):
+        """Return the names of the actions an application provides
+
+        @returns list of action names
+        """
+        raise NotImplementedError
+
+    def run_action(self, unit, action):
+        """Queue an action on a unit
+
+        @returns string action id
+        """
+        raise NotImplementedError
+
+    def action_result(self, action_id):
+        """Return the status and results of an action
+
+        @returns dictionary with at least a 'status' key
+        """
+        raise NotImplementedError
+
+    def run_actions(self, requests):
+        """Queue several actions at once
+
+        @param requests: list of (unit, action) tuples
+        @returns list of string action ids, in the order of requests
+        """
+        return [self.run_action(unit, action) for unit, action in requests]
+
+    def action_statuses(self, action_ids):
+        """Return the status of several actions at once
+
+        @returns dictionary of action id to status
+        """
+        return dict((action_id, self.action_result(action_id)['status'])
+                    for action_id in action_ids)
+
+    def units(self, application):
+        """Return the units of an application and the fields of UNIT_FIELDS
+
+        @raises JujuBackendError: if the application is unknown
+        @returns dictionary of unit name to dictionary of unit fields
+        """
+        units = extract_units(self.status(application), application,
+                              self.applications_key())
+        if units is None:
+            raise JujuBackendError('Unknown application: '
+                                   '{}'.format(application))
+        return units
+
+    def is_action_done(self, action_id):
+        """Return True if the action has finished running
+
+        A failed action is done too, the status of the action_result()
+        tells whether it completed.
+        """
+        return self.action_result(action_id)['status'] in ACTION_DONE_STATES
+
+    def run_on_application(self, application, command):
+        """Run a command on every unit of an application
+
+        @returns list of dictionaries with UnitId, Stdout and Code keys
+        """
+        raise NotImplementedError
+
+    def run_on_unit(self, unit, command, timeout=None):
+        """Run a command on a single unit
+
+        @param timeout: seconds to allow the command to run for
+        @returns dictionary with UnitId, Stdout, Stderr and Code keys
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the backend"""
+        pass
+
+
+class CLIBackend(JujuBackend):
+    """Backend which forks the juju client for each operation
+
+    The juju binary, its version and the command structure for that version
+    come from kiki, so they are only worked out once per process.
+
+    @param model: model to operate on, [controller:]model, defaults to the
+                  current model of the client
+    """
+
+    def __init__(self, model=None):
+        self.model = model
+        self._runner = Runner(model=model)
+
+    @property
+    def juju_version(self):
+        if kiki.min_version('2.0'):
+            return 2
+        return 1
+
+    def applications_key(self):
+        return kiki.applications()
+
+    def _check_output(self, cmd):
+        result = self._runner.run(cmd, output_format=None)
+        if not result.ok:
+            raise JujuBackendError(result.error)
+        return result.stdout
+
+    def _check_outputs(self, cmds):
+        """Run several commands at once, returning the output of each"""
+        results = self._runner.run_many(cmds, output_format=None)
+        errors = [result.error for result in results if not result.ok]
+        if errors:
+            raise JujuBackendError('; '.join(errors))
+        return [result.stdout for result in results]
+
+    def status(self, application=None):
+        cmd = [kiki.cmd(), 'status']
+        if application:
+            cmd.append(application)
+        cmd.append('--format=json')
+        return json_loads(self._check_output(cmd))
+
+    def set_config(self, application, key, value):
+        setting = '{}={}'.format(key, value)
+        cmd = [kiki.cmd(), kiki.set_config(), application, setting]
+        try:
+            self._check_output(cmd)
+        except JujuBackendError as e:
+            # If the value is already set to the current value the client
+            # complains, but the value is set as far as callers care.
+            if 'already' in str(e).lower():
+                return
+            raise
+
+    def enumerate_actions(self, application):
+        cmd = kiki.list_actions_cmd() + [application]
+        if kiki.min_version('2.1'):
+            cmd.extend(['--schema', '--format=json'])
+        actions = yaml_io.load(self._check_output(cmd))
+        return list((actions or {}).keys())
+
+    def run_action(self, unit, action):
+        cmd = kiki.run_action_cmd() + [unit, action]
+        output = self._check_output(cmd)
+        return output.split(':')[1].strip()
+
+    def action_result(self, action_id):
+        cmd = kiki.show_action_output_cmd() + [action_id, '--format=json']
+        return json_loads(self._check_output(cmd))
+
+    def run_actions(self, requests):
+        if not kiki.min_version('2.1'):
+            # One action per call, but the calls can run at the same time
+            outputs = self._check_outputs([
+                kiki.run_action_cmd() + [unit, action]
+                for unit, action in requests])
+            return [output.split(':')[1].strip() for output in outputs]
+        # run-action queues one action on any number of units, so only one
+        # call is needed per distinct action.
+        units_by_action = {}
+        for unit, action in requests:
+            units_by_action.setdefault(action, []).append(unit)
+        queued = {}
+        for action, units in units_by_action.items():
+            cmd = kiki.run_action_cmd() + units + [action]
+            ids = re.findall(r'id:\s*(\S+)', self._check_output(cmd))
+            if len(ids) != len(units):
+                raise JujuBackendError('Expected {} action ids from {}, got '
+                                       '{}'.format(len(units), ' '.join(cmd),
+                                                   ids))
+            queued.update(((unit, action), action_id)
+                          for unit, action_id in zip(units, ids))
+        return [queued[request] for request in requests]
+
+    def action_statuses(self, action_ids):
+        cmd = kiki.show_action_status_cmd() + ['--format=json']
+        listed = json_loads(self._check_output(cmd)).get('actions') or []
+        wanted = set(action_ids)
+        statuses = dict((action['id'], action['status'])
+                        for action in listed if action['id'] in wanted)
+        # Fall back to asking after any action the listing missed
+        missing = [i for i in action_ids if i not in statuses]
+        outputs = self._check_outputs([
+            kiki.show_action_output_cmd() + [action_id, '--format=json']
+            for action_id in missing])
+        statuses.update((action_id, json_loads(output)['status'])
+                        for action_id, output in zip(missing, outputs))
+        return statuses
+
+    def run_on_application(self, application, command):
+        cmd = [kiki.cmd(), 'run', '--{}'.format(kiki.application()),
+               application, command]
+        return yaml_io.load(self._check_output(cmd))
+
+    def run_on_unit(self, unit, command, timeout=None):
+        cmd = [kiki.cmd(), 'run', '--unit', unit, '--format=json']
+        if timeout:
+            cmd.extend(['--timeout', '{}s'.format(int(timeout))])
+        cmd.append(command)
+        result = json_loads(self._check_output(cmd))[0]
+        return {
+            'UnitId': unit,
+            'Stdout': result.get('Stdout', ''),
+            'Stderr': result.get('Stderr', ''),
+            'Code': int(result.get('ReturnCode', result.get('Code', 0))),
+        }
+
+
+class APIBackend(JujuBackend):
+    """Backend which talks to the controller over a persistent websocket
+
+    The libjuju event loop runs in a dedicated thread so that the backend
+    may be used from synchronous code, including from several threads.
+    """
+
+    def __init__(self, model=None, timeout=300):
+        try:
+            from juju.model import Model
+        except ImportError:
+            raise JujuBackendError('The api backend requires python-libjuju. '
+                                   'Install it with: pip install juju')
+        import asyncio
+
+        self.timeout = timeout
+        self._asyncio = asyncio
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name='juju-api-backend')
+        self._thread.daemon = True
+        self._thread.start()
+        self._model = Model()
+        self._run(self._model.connect(model))
+
+    def _run(self, coro, timeout=None):
+        future = self._asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout or self.timeout)
+        except JujuBackendError:
+            raise
+        except Exception as e:
+            raise JujuBackendError(e)
+
+    def _get_application(self, application):
+        try:
+            return self._model.applications[application]
+        except KeyError:
+            raise JujuBackendError('Unknown application: '
+                                   '{}'.format(application))
+
+    def _get_unit(self, unit):
+        try:
+            return self._model.units[unit]
+        except KeyError:
+            raise JujuBackendError('Unknown unit: {}'.format(unit))
+
+    @staticmethod
+    def _status_dict(status):
+        if status is None:
+            return {}
+        return {'current': status.status,
+                'message': status.info or '',
+                'since': status.since}
+
+    def _unit_dict(self, unit):
+        unit_dict = {
+            'workload-status': self._status_dict(unit.workload_status),
+            'juju-status': self._status_dict(unit.agent_status),
+            'machine': unit.machine,
+            'leader': bool(unit.leader),
+        }
+        if unit.subordinates:
+            unit_dict['subordinates'] = dict(
+                (name, self._unit_dict(sub))
+                for name, sub in unit.subordinates.items())
+        return unit_dict
+
+    def status(self, application=None):
+        filters = [application] if application else None
+        full_status = self._run(self._model.get_status(filters))
+        applications = {}
+        for name, app in full_status.applications.items():
+            applications[name] = {
+                'charm': app.charm,
+                'relations': dict(app.relations or {}),
+                'units': dict((unit_name, self._unit_dict(unit))
+                              for unit_name, unit in
+                              (app.units or {}).items()),
+            }
+        return {'model': {'name': full_status.model.name},
+                'applications': applications}
+
+    def set_config(self, application, key, value):
+        app = self._get_application(application)
+        self._run(app.set_config({key: str(value)}))
+
+    def enumerate_actions(self, application):
+        app = self._get_application(application)
+        return list(self._run(app.get_actions()).keys())
+
+    def run_action(self, unit, action):
+        queued = self._run(self._get_unit(unit).run_action(action))
+        return queued.entity_id
+
+    def action_result(self, action_id):
+        status = self._run(self._model.get_action_status(action_id))
+        result = {'status': status.get(action_id,
+                                       status.get('action-' + action_id,
+                                                  'unknown'))}
+        if result['status'] in ACTION_DONE_STATES:
+            result['results'] = self._run(
+                self._model.get_action_output(action_id))
+        return result
+
+    def run_actions(self, requests):
+        async def queue_all():
+            return await self._asyncio.gather(
+                *[self._get_unit(unit).run_action(action)
+                  for unit, action in requests])
+
+        return [queued.entity_id for queued in self._run(queue_all())]
+
+    def run_on_application(self, application, command):
+        units = self._get_application(application).units
+
+        async def run_all():
+            return await self._asyncio.gather(
+                *[unit.run(command) for unit in units])
+
+        return [self._run_result(unit.name, action)
+                for unit, action in zip(units, self._run(run_all()))]
+
+    @staticmethod
+    def _run_result(unit, action):
+        output = action.results or {}
+        return {
+            'UnitId': unit,
+            'Stdout': output.get('Stdout', output.get('stdout', '')),
+            'Stderr': output.get('Stderr', output.get('stderr', '')),
+            'Code': int(output.get('Code', output.get('return-code', 0))),
+        }
+
+    def run_on_unit(self, unit, command, timeout=None):
+        action = self._run(self._get_unit(unit).run(command, timeout=timeout),
+                           timeout=timeout and timeout + 60)
+        return self._run_result(unit, action)
+
+    def close(self):
+        try:
+            self._run(self._model.disconnect())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class FakeBackend(JujuBackend):
+    """In-memory backend for exercising upgrade logic without a controller
+
+    Actions complete after being polled ``action_polls`` times, those of the
+    ``(unit, action)`` pairs in ``failed_actions`` fail instead. A custom
+    ``action_handler(backend, unit, action)`` may be supplied to mutate the
+    fake model when an action is queued, and a ``command_handler(backend,
+    unit, command)`` to produce output for run_on_application. Every call is
+    recorded in ``calls`` for later inspection.
+    """
+
+    def __init__(self, status=None, actions=None, action_polls=0,
+                 action_handler=None, command_handler=None,
+                 failed_actions=()):
+        self.model = deepcopy(status) if status else {}
+        self.model.setdefault(self.applications_key(), {})
+        self.actions = actions or {}
+        self.config = {}
+        self.calls = []
+        self.action_polls = action_polls
+        self.action_handler = action_handler
+        self.command_handler = command_handler
+        self.failed_actions = set(failed_actions)
+        self._actions = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _record(self, *call):
+        with self._lock:
+            self.calls.append(call)
+
+    def _applications(self):
+        return self.model[self.applications_key()]
+
+    def _get_application(self, application):
+        try:
+            return self._applications()[application]
+        except KeyError:
+            raise JujuBackendError('Unknown application: '
+                                   '{}'.format(application))
+
+    def _get_unit(self, unit):
+        for application in self._applications().values():
+            for name, info in (application.get('units') or {}).items():
+                if name == unit:
+                    return info
+                if unit in (info.get('subordinates') or {}):
+                    return info['subordinates'][unit]
+        raise JujuBackendError('Unknown unit: {}'.format(unit))
+
+    def add_application(self, name, num_units=1, leader=0, actions=None,
+                        subordinates=None, workload_status='active'):
+        """Add an application with num_units units to the fake model
+
+        @param leader: index of the leader unit
+        @param actions: list of action names the application provides
+        @param subordinates: list of subordinate application names deployed
+                             alongside every unit
+        @returns dictionary describing the application
+        """
+        units = {}
+        for i in range(num_units):
+            unit = {
+                'workload-status': {'current': workload_status,
+                                    'message': 'Unit is ready'},
+                'juju-status': {'current': 'idle'},
+                'machine': str(len(units)),
+                'leader': i == leader,
+            }
+            subs = {}
+            for sub in subordinates or []:
+                sub_name = '{}/{}'.format(sub, i)
+                subs[sub_name] = {
+                    'workload-status': {'current': workload_status,
+                                        'message': 'Unit is ready'},
+                    'juju-status': {'current': 'idle'},
+                }
+                self._applications().setdefault(sub, {'units': {},
+                                                      'relations': {}})
+            if subs:
+                unit['subordinates'] = subs
+            units['{}/{}'.format(name, i)] = unit
+        app = {'charm': 'cs:{}'.format(name), 'units': units,
+               'relations': {}}
+        self._applications()[name] = app
+        self.actions[name] = list(actions or [])
+        for sub in subordinates or []:
+            self.actions.setdefault(sub, ['pause', 'resume'])
+        return app
+
+    def status(self, application=None):
+        self._record('status', application)
+        with self._lock:
+            if application is None:
+                return deepcopy(self.model)
+            status = dict((k, v) for k, v in self.model.items()
+                          if k != self.applications_key())
+            status[self.applications_key()] = {
+                application: deepcopy(self._get_application(application))}
+            return status
+
+    def set_config(self, application, key, value):
+        self._record('set_config', application, key, value)
+        self._get_application(application)
+        with self._lock:
+            self.config.setdefault(application, {})[key] = value
+
+    def enumerate_actions(self, application):
+        self._record('enumerate_actions', application)
+        self._get_application(application)
+        return list(self.actions.get(application, []))
+
+    def run_action(self, unit, action):
+        self._record('run_action', unit, action)
+        return self._queue_action(unit, action)
+
+    def run_actions(self, requests):
+        self._record('run_actions', list(requests))
+        return [self._queue_action(unit, action)
+                for unit, action in requests]
+
+    def _queue_action(self, unit, action):
+        self._get_unit(unit)
+        if action not in self.actions.get(unit.split('/')[0], []):
+            raise JujuBackendError('{} has no action {}'.format(unit, action))
+        with self._lock:
+            action_id = str(next(self._ids))
+            self._actions[action_id] = {
+                'unit': unit, 'action': action, 'polls': self.action_polls,
+                'status': ('failed' if (unit, action) in self.failed_actions
+                           else ACTION_COMPLETED)}
+        if self.action_handler:
+            self.action_handler(self, unit, action)
+        return action_id
+
+    def action_result(self, action_id):
+        self._record('action_result', action_id)
+        return self._action_result(action_id)
+
+    def action_statuses(self, action_ids):
+        self._record('action_statuses', list(action_ids))
+        return dict((action_id, self._action_result(action_id)['status'])
+                    for action_id in action_ids)
+
+    def _action_result(self, action_id):
+        with self._lock:
+            try:
+                action = self._actions[action_id]
+            except KeyError:
+                raise JujuBackendError('Unknown action: '
+                                       '{}'.format(action_id))
+            if action['polls'] > 0:
+                action['polls'] -= 1
+                return {'status': 'running'}
+        return {'status': action['status'], 'results': {}}
+
+    def run_on_application(self, application, command):
+        self._record('run_on_application', application, command)
+        return [self._run_command(name, info, command)
+                for name, info in sorted(
+                    self._get_application(application)['units'].items())]
+
+    def _run_command(self, unit, info, command):
+        if self.command_handler:
+            stdout = self.command_handler(self, unit, command)
+        elif command == 'is-leader':
+            stdout = str(bool(info.get('leader')))
+        else:
+            stdout = ''
+        return {'UnitId': unit, 'Stdout': stdout + '\n', 'Stderr': '',
+                'Code': 0}
+
+    def run_on_unit(self, unit, command, timeout=None):
+        self._record('run_on_unit', unit, command)
+        return self._run_command(unit, self._get_unit(unit), command)
+
+
+BACKENDS = {
+    'cli': CLIBackend,
+    'api': APIBackend,
+    'fake': FakeBackend,
+}
+
+
+def get_backend(name, **kwargs):
+    """Return an instance of the named backend
+
+    @param name: one of the keys of BACKENDS
+    @raises JujuBackendError: for an unknown backend name
+    @returns JujuBackend instance
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise JujuBackendError('Unknown backend {}. Valid backends are: '
+                               '{}'.format(name, ', '.join(sorted(BACKENDS))))
+    logging.debug('Using the {} juju backend'.format(name))
+    return backend_class(**kwargs)
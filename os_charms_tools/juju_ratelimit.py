@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Controller load aware limits on the rate of Juju operations.
+
+Every call made through a RateLimitedBackend takes a token from a bucket and
+a slot from a concurrency limit before it reaches the wrapped backend. Reads
+(status, action results) and writes (config, actions, commands) have their
+own limiter so a burst of polling can not starve the upgrade of writes.
+
+The limits adapt to the controller: a call which fails, or takes longer than
+slow_seconds, halves the rate and concurrency of its limiter, and every call
+which succeeds in time raises them again a little, up to the configured
+maximum.
+
+Usage:
+
+backend = RateLimitedBackend(get_backend('cli'), read_rate=10, write_rate=2)
+backend.status('keystone')
+"""
+
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+from os_charms_tools.juju_backend import JujuBackend, JujuBackendError
+
+# Default calls per second started against the controller
+DEFAULT_READ_RATE = 10.0
+DEFAULT_WRITE_RATE = 2.0
+# Default calls in flight at once. The write limit also bounds commands run
+# on units, which can take minutes, so it is higher.
+DEFAULT_READ_CONCURRENCY = 8
+DEFAULT_WRITE_CONCURRENCY = 16
+# Seconds after which a controller call counts as slow
+DEFAULT_SLOW_SECONDS = 10.0
+# Fraction of the maximum rate restored by each successful call
+RATE_INCREASE = 0.05
+
+
+class AdaptiveLimiter(object):
+    """Token bucket and concurrency limit which back off under load
+
+    :param: name: name used when logging changes to the limits
+    :param: rate: maximum calls started per second
+    :param: concurrency: maximum calls in flight at once
+    :param: min_rate: rate the limiter never backs off below
+    :param: slow_seconds: calls taking longer count as failures
+    """
+
+    def __init__(self, name, rate, concurrency, min_rate=None,
+                 slow_seconds=DEFAULT_SLOW_SECONDS):
+        self.name = name
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.min_rate = min(self.max_rate, min_rate or self.max_rate / 20)
+        self.max_concurrency = max(1, concurrency)
+        self.concurrency = float(self.max_concurrency)
+        self.slow_seconds = slow_seconds
+        self.burst = max(1.0, self.max_rate)
+        self.tokens = self.burst
+        self.in_flight = 0
+        self.calls = 0
+        self.backoffs = 0
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a call may start"""
+        with self._cond:
+            while True:
+                self._refill()
+                if self.in_flight < int(self.concurrency):
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        self.calls += 1
+                        return
+                    self._cond.wait((1 - self.tokens) / self.rate)
+                else:
+                    self._cond.wait()
+
+    def release(self, ok):
+        """Finish a call, adapting the limits to how it went
+
+        :param: ok: False if the call failed or was slow
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if ok:
+                self.rate = min(self.max_rate,
+                                self.rate + self.max_rate * RATE_INCREASE)
+                self.concurrency = min(self.max_concurrency,
+                                       self.concurrency +
+                                       1.0 / self.concurrency)
+            else:
+                self.backoffs += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.concurrency = max(1.0, self.concurrency / 2)
+                logging.warning("Juju controller under load, limiting {} to "
+                                "{:.2f} calls/s and {} at once"
+                                "".format(self.name, self.rate,
+                                          int(self.concurrency)))
+            self._cond.notify_all()
+
+    @contextmanager
+    def call(self, timed=True):
+        """Run the enclosed block as one limited call
+
+        A block raising JujuBackendError counts as a failed call.
+
+        :param: timed: whether the duration of the block says anything about
+                       the load on the controller
+        """
+        self.acquire()
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = (not timed or
+                  time.monotonic() - start <= self.slow_seconds)
+        except JujuBackendError:
+            raise
+        except Exception:
+            # Not the controller's doing, do not back off for it
+            ok = True
+            raise
+        finally:
+            self.release(ok)
+
+
+class RateLimitedBackend(JujuBackend):
+    """JujuBackend which limits the calls made to another backend
+
+    :param: backend: the JujuBackend to wrap
+    """
+
+    def __init__(self, backend, read_rate=DEFAULT_READ_RATE,
+                 write_rate=DEFAULT_WRITE_RATE,
+                 read_concurrency=DEFAULT_READ_CONCURRENCY,
+                 write_concurrency=DEFAULT_WRITE_CONCURRENCY,
+                 slow_seconds=DEFAULT_SLOW_SECONDS):
+        self.backend = backend
+        self.reads = AdaptiveLimiter('reads', read_rate, read_concurrency,
+                                     slow_seconds=slow_seconds)
+        self.writes = AdaptiveLimiter('writes', write_rate,
+                                      write_concurrency,
+                                      slow_seconds=slow_seconds)
+
+    @property
+    def juju_version(self):
+        return self.backend.juju_version
+
+    def applications_key(self):
+        return self.backend.applications_key()
+
+    def status(self, application=None):
+        with self.reads.call():
+            return self.backend.status(application)
+
+    def set_config(self, application, key, value):
+        with self.writes.call():
+            return self.backend.set_config(application, key, value)
+
+    def enumerate_actions(self, application):
+        with self.reads.call():
+            return self.backend.enumerate_actions(application)
+
+    def run_action(self, unit, action):
+        with self.writes.call():
+            return self.backend.run_action(unit, action)
+
+    def action_result(self, action_id):
+        with self.reads.call():
+            return self.backend.action_result(action_id)
+
+    def run_actions(self, requests):
+        with self.writes.call():
+            return self.backend.run_actions(requests)
+
+    def action_statuses(self, action_ids):
+        with self.reads.call():
+            return self.backend.action_statuses(action_ids)
+
+    def run_on_application(self, application, command):
+        # How long a command runs for depends on the command, not the load
+        # on the controller
+        with self.writes.call(timed=False):
+            return self.backend.run_on_application(application, command)
+
+    def run_on_unit(self, unit, command, timeout=None):
+        with self.writes.call(timed=False):
+            return self.backend.run_on_unit(unit, command, timeout=timeout)
+
+    def close(self):
+        logging.debug("Juju calls: {} reads ({} backoffs), {} writes ({} "
+                      "backoffs)".format(self.reads.calls,
+                                         self.reads.backoffs,
+                                         self.writes.calls,
+                                         self.writes.backoffs))
+        self.backend.close()
@@ -0,0 +1,797 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A simulated Juju 2.1 client for benchmarking os-upgrade without a cloud.
+
+A model is described in YAML: its applications, how many units each has,
+which unit leads, the subordinates deployed alongside the units and how
+long each action takes, drawn from a random distribution. The description
+is turned into a state file which every invocation of juju-simulator.py,
+standing in for the juju binary, reads and updates under a lock. Actions
+run one at a time per unit and take effect on the workload status of the
+unit when they complete, so os-upgrade sees a model which pauses, upgrades
+and resumes as a real one would.
+
+Every invocation is logged, giving the number of calls os-upgrade made of
+each command and the time they took.
+
+Example description:
+
+model: bench
+seed: 42
+# Multiplies every action and command duration
+time-scale: 0.01
+# Seconds every juju invocation is delayed by, not scaled
+latency: {distribution: uniform, min: 0.05, max: 0.2}
+actions:
+  pause: {distribution: normal, mean: 30, stddev: 5}
+  resume: {distribution: normal, mean: 45, stddev: 10}
+  openstack-upgrade:
+    distribution: uniform
+    min: 300
+    max: 900
+    failure-rate: 0.01
+commands:
+  - match: download-only
+    duration: {distribution: exponential, mean: 120}
+applications:
+  keystone:
+    units: 3
+    subordinates: [keystone-hacluster]
+    config: {openstack-origin: distro}
+  keystone-hacluster:
+    charm: hacluster
+    subordinate: true
+    actions: {openstack-upgrade: null}
+  nova-compute:
+    units: 1000
+    leader: 3
+
+Usage:
+
+eval $(./juju-simulator.py init bench.yaml --state /tmp/bench.json)
+./os-upgrade.py --origin cloud:xenial-newton
+./juju-simulator.py report
+"""
+
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from os_charms_tools.upgrade_prestage import (
+    UnsupportedOrigin,
+    cloud_archive_pocket,
+)
+
+# The Juju version reported by `juju version`
+SIMULATED_VERSION = '2.1.2-xenial-amd64'
+
+# Environment variable naming the state file of the simulated model
+STATE_ENVIRONMENT = 'JUJU_SIMULATOR_STATE'
+
+# Duration of the actions of every application, unless overridden
+DEFAULT_ACTIONS = {
+    'pause': {'distribution': 'normal', 'mean': 20, 'stddev': 5},
+    'resume': {'distribution': 'normal', 'mean': 30, 'stddev': 5},
+    'openstack-upgrade': {'distribution': 'uniform', 'min': 180,
+                          'max': 600},
+}
+
+# Configuration keys which select the origin packages are installed from
+ORIGIN_KEYS = ('openstack-origin', 'source')
+
+# Pseudo action a unit runs when its origin changes outside of
+# action-managed-upgrade mode
+CONFIG_UPGRADE = 'config-changed'
+
+# Operations which move a unit onto the origin of its application
+UPGRADE_ACTIONS = ('openstack-upgrade', CONFIG_UPGRADE)
+
+READY = "Unit is ready"
+PAUSED = "Paused. Use 'resume' action to resume normal service."
+
+
+class SimulatorError(Exception):
+    pass
+
+
+def sample_duration(spec, rng):
+    """Return a duration in seconds drawn from a distribution
+
+    :param: spec: a number of seconds, or a dictionary naming the
+                  distribution, one of fixed (seconds), uniform (min, max),
+                  normal (mean, stddev) and exponential (mean)
+    :param: rng: random.Random to draw from
+    :raises SimulatorError: for an unknown distribution
+    """
+    if spec is None:
+        return 0.0
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    distribution = spec.get('distribution', 'fixed')
+    if distribution == 'fixed':
+        duration = spec.get('seconds', 0)
+    elif distribution == 'uniform':
+        duration = rng.uniform(spec.get('min', 0), spec['max'])
+    elif distribution == 'normal':
+        duration = rng.normalvariate(spec['mean'], spec.get('stddev', 0))
+    elif distribution == 'exponential':
+        duration = rng.expovariate(1.0 / spec['mean'])
+    else:
+        raise SimulatorError('Unknown distribution: {}'.format(distribution))
+    return max(0.0, float(duration))
+
+
+def failure_rate(spec):
+    if isinstance(spec, dict):
+        return float(spec.get('failure-rate', 0))
+    return 0.0
+
+
+def build_state(description):
+    """Return the initial state of the model a description describes
+
+    :param: description: dictionary loaded from a model description
+    :raises SimulatorError: if the description is inconsistent
+    """
+    applications = description.get('applications') or {}
+    default_actions = dict(DEFAULT_ACTIONS)
+    default_actions.update(description.get('actions') or {})
+    state = {
+        'model': description.get('model', 'simulated'),
+        'seed': description.get('seed', 0),
+        'time-scale': float(description.get('time-scale', 1.0)),
+        'latency': description.get('latency'),
+        'commands': description.get('commands') or [],
+        'applications': {},
+        'units': {},
+        'machines': {},
+        'operations': {},
+        'pending': [],
+        'next-id': 0,
+    }
+
+    def add_application(name, info):
+        actions = dict(default_actions)
+        actions.update(info.get('actions') or {})
+        state['applications'][name] = {
+            'charm': info.get('charm', name),
+            'series': info.get('series', 'xenial'),
+            'subordinate': bool(info.get('subordinate')),
+            'config': dict(info.get('config') or {}),
+            'actions': dict((action, spec) for action, spec in
+                            actions.items() if spec is not None),
+            'units': [],
+            'subordinate-to': [],
+        }
+
+    for name, info in sorted(applications.items()):
+        add_application(name, info or {})
+
+    for name, info in sorted(applications.items()):
+        info = info or {}
+        if info.get('subordinate'):
+            continue
+        subordinates = info.get('subordinates') or []
+        for sub in subordinates:
+            if sub not in state['applications']:
+                add_application(sub, {'subordinate': True})
+            elif not state['applications'][sub]['subordinate']:
+                raise SimulatorError('{} is deployed alongside {} but is not '
+                                     'a subordinate'.format(sub, name))
+            state['applications'][sub]['subordinate-to'].append(name)
+        leader = info.get('leader', 0)
+        for index in range(info.get('units', 1)):
+            machine = str(len(state['machines']))
+            state['machines'][machine] = {
+                'hostname': 'juju-{}-{}'.format(state['model'], machine),
+                'dns-name': '10.{}.{}.{}'.format(
+                    int(machine) // 65536 % 256, int(machine) // 256 % 256,
+                    int(machine) % 256),
+            }
+            unit = '{}/{}'.format(name, index)
+            _add_unit(state, name, unit, machine, leader=index == leader)
+            for sub in subordinates:
+                sub_units = state['applications'][sub]['units']
+                sub_unit = '{}/{}'.format(sub, len(sub_units))
+                _add_unit(state, sub, sub_unit, machine,
+                          leader=not sub_units, principal=unit)
+                state['units'][unit]['subordinates'].append(sub_unit)
+    return state
+
+
+def _add_unit(state, application, unit, machine, leader=False,
+              principal=None):
+    app = state['applications'][application]
+    app['units'].append(unit)
+    origin = None
+    for key in ORIGIN_KEYS:
+        origin = app['config'].get(key, origin)
+    state['units'][unit] = {
+        'application': application,
+        'machine': machine,
+        'leader': leader,
+        'principal': principal,
+        'subordinates': [],
+        'paused': False,
+        'origin': origin,
+        'busy-until': 0.0,
+    }
+
+
+class Simulator(object):
+    """The simulated model, as stored in a state file
+
+    Use Simulator.locked() to load the state under a lock and write back any
+    changes made to it.
+
+    :param: state: dictionary of the model state, see build_state()
+    :param: now: time the simulated commands run at, defaults to the
+                 current time
+    """
+
+    def __init__(self, state, now=None):
+        self.state = state
+        self.now = time.time() if now is None else now
+        self.changed = False
+        self.advance()
+
+    @classmethod
+    @contextmanager
+    def locked(cls, path):
+        with open(path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path) as state_file:
+                    simulator = cls(json.load(state_file))
+            except (IOError, OSError, ValueError) as e:
+                raise SimulatorError('Unable to read the simulator state '
+                                     'from {}: {}'.format(path, e))
+            yield simulator
+            if simulator.changed:
+                save_state(path, simulator.state)
+
+    def _rng(self, *labels):
+        # Seeded per operation, so a run can be repeated exactly
+        return random.Random(':'.join(str(label) for label in
+                                      (self.state['seed'],) + labels))
+
+    def _scaled(self, seconds):
+        return seconds * self.state['time-scale']
+
+    def _unit(self, unit):
+        try:
+            return self.state['units'][unit]
+        except KeyError:
+            raise SimulatorError('unit "{}" not found'.format(unit))
+
+    def _application(self, application):
+        try:
+            return self.state['applications'][application]
+        except KeyError:
+            raise SimulatorError('application "{}" not found'.format(
+                application))
+
+    def advance(self):
+        """Apply the effects of every operation completed by now"""
+        operations = self.state['operations']
+        done = [op_id for op_id in self.state['pending']
+                if operations[op_id]['completed'] <= self.now]
+        if not done:
+            return
+        done.sort(key=lambda op_id: operations[op_id]['completed'])
+        for op_id in done:
+            operation = operations[op_id]
+            if operation['status'] == 'completed':
+                unit = self.state['units'][operation['unit']]
+                if operation['action'] == 'pause':
+                    unit['paused'] = True
+                elif operation['action'] == 'resume':
+                    unit['paused'] = False
+                elif operation['action'] in UPGRADE_ACTIONS:
+                    unit['origin'] = operation['origin']
+        done = set(done)
+        self.state['pending'] = [op_id for op_id in self.state['pending']
+                                 if op_id not in done]
+        self.changed = True
+
+    def _queue(self, unit, action, spec):
+        op_id = '{:08x}-0000-4000-8000-{:012x}'.format(
+            self.state['next-id'], self.state['next-id'])
+        self.state['next-id'] += 1
+        rng = self._rng(op_id)
+        info = self.state['units'][unit]
+        app = self.state['applications'][info['application']]
+        started = max(self.now, info['busy-until'])
+        completed = started + self._scaled(sample_duration(spec, rng))
+        failed = rng.random() < failure_rate(spec)
+        info['busy-until'] = completed
+        origin = None
+        for key in ORIGIN_KEYS:
+            origin = app['config'].get(key, origin)
+        self.state['operations'][op_id] = {
+            'unit': unit,
+            'action': action,
+            'enqueued': self.now,
+            'started': started,
+            'completed': completed,
+            'status': 'failed' if failed else 'completed',
+            'origin': origin,
+        }
+        self.state['pending'].append(op_id)
+        self.changed = True
+        return op_id
+
+    def _operation_status(self, operation):
+        if operation['completed'] <= self.now:
+            return operation['status']
+        if operation['started'] <= self.now:
+            return 'running'
+        return 'pending'
+
+    def _running(self, unit):
+        for op_id in self.state['pending']:
+            operation = self.state['operations'][op_id]
+            if (operation['unit'] == unit and
+                    self._operation_status(operation) == 'running'):
+                return operation
+        return None
+
+    def run_action(self, units, action):
+        """Queue an action on units
+
+        :returns: list of action ids, in the order of units
+        :raises SimulatorError: if a unit or the action does not exist, in
+                                which case nothing is queued
+        """
+        specs = []
+        for unit in units:
+            app = self._application(self._unit(unit)['application'])
+            if action not in app['actions']:
+                raise SimulatorError('action "{}" not defined on unit "{}"'
+                                     ''.format(action, unit))
+            specs.append(app['actions'][action])
+        return [self._queue(unit, action, spec)
+                for unit, spec in zip(units, specs)]
+
+    def action_output(self, action_id):
+        try:
+            operation = self.state['operations'][action_id]
+        except KeyError:
+            raise SimulatorError('action "{}" not found'.format(action_id))
+        status = self._operation_status(operation)
+        output = {'status': status,
+                  'timing': {'enqueued': _timestamp(operation['enqueued'])}}
+        if status != 'pending':
+            output['timing']['started'] = _timestamp(operation['started'])
+        if status in ('completed', 'failed'):
+            output['timing']['completed'] = _timestamp(
+                operation['completed'])
+        if status == 'completed':
+            output['results'] = {'outcome': 'success'}
+        elif status == 'failed':
+            output['message'] = '{} failed on {}'.format(operation['action'],
+                                                         operation['unit'])
+        return output
+
+    def action_statuses(self):
+        return {'actions': [
+            {'id': op_id, 'unit': operation['unit'],
+             'action': operation['action'],
+             'status': self._operation_status(operation)}
+            for op_id, operation in sorted(self.state['operations'].items())
+            if operation['action'] != CONFIG_UPGRADE]}
+
+    def actions(self, application):
+        return sorted(self._application(application)['actions'])
+
+    def get_config(self, application):
+        app = self._application(application)
+        return {
+            'application': application,
+            'charm': app['charm'],
+            'settings': dict((key, {'value': value, 'source': 'user'})
+                             for key, value in app['config'].items()),
+        }
+
+    def set_config(self, application, settings):
+        """Change the configuration of an application
+
+        Changing the origin of an application not in action-managed-upgrade
+        mode upgrades all of its units at once, as the charms do.
+        """
+        app = self._application(application)
+        origin_changed = any(
+            key in ORIGIN_KEYS and app['config'].get(key) != value
+            for key, value in settings.items())
+        app['config'].update(settings)
+        self.changed = True
+        managed = str(app['config'].get('action-managed-upgrade',
+                                        False)).lower() == 'true'
+        if origin_changed and not managed:
+            spec = app['actions'].get('openstack-upgrade',
+                                      DEFAULT_ACTIONS['openstack-upgrade'])
+            for unit in app['units']:
+                self._queue(unit, CONFIG_UPGRADE, spec)
+
+    def _workload_status(self, unit, info):
+        running = self._running(unit)
+        if running and running['action'] in UPGRADE_ACTIONS:
+            return {'current': 'maintenance',
+                    'message': 'Upgrading to {}'.format(running['origin'])}
+        if info['paused']:
+            return {'current': 'maintenance', 'message': PAUSED}
+        return {'current': 'active', 'message': READY}
+
+    def _juju_status(self, unit):
+        running = self._running(unit)
+        if running is None:
+            return {'current': 'idle'}
+        if running['action'] == CONFIG_UPGRADE:
+            return {'current': 'executing',
+                    'message': 'running config-changed hook'}
+        return {'current': 'executing',
+                'message': 'running action {}'.format(running['action'])}
+
+    def _unit_status(self, unit):
+        info = self.state['units'][unit]
+        machine = self.state['machines'][info['machine']]
+        status = {
+            'workload-status': self._workload_status(unit, info),
+            'juju-status': self._juju_status(unit),
+            'public-address': machine['dns-name'],
+        }
+        if info['leader']:
+            status['leader'] = True
+        if info['principal'] is None:
+            status['machine'] = info['machine']
+            status['subordinates'] = dict(
+                (sub, self._unit_status(sub)) for sub in info['subordinates'])
+        return status
+
+    def status(self, filters=None):
+        """Return the status of the model, in the format of Juju 2.1
+
+        :param: filters: names of the applications or units to include,
+                         every application if empty
+        """
+        wanted = set()
+        for name in filters or []:
+            wanted.add(name.split('/')[0])
+        applications = {}
+        machines = set()
+        for name, app in self.state['applications'].items():
+            if wanted and name not in wanted:
+                continue
+            entry = {'charm': 'cs:{}/{}'.format(app['series'], app['charm']),
+                     'series': app['series'], 'exposed': False,
+                     'relations': {}}
+            if app['subordinate']:
+                entry['subordinate-to'] = sorted(app['subordinate-to'])
+            else:
+                entry['units'] = dict((unit, self._unit_status(unit))
+                                      for unit in app['units'])
+                machines.update(self.state['units'][unit]['machine']
+                                for unit in app['units'])
+            current = set(unit['workload-status']['current']
+                          for unit in (entry.get('units') or {}).values())
+            entry['application-status'] = {
+                'current': 'maintenance' if 'maintenance' in current
+                else 'active'}
+            applications[name] = entry
+        return {
+            'model': {'name': self.state['model'],
+                      'version': SIMULATED_VERSION.split('-')[0]},
+            'machines': dict(
+                (machine, {'juju-status': {'current': 'started'},
+                           'dns-name': self.state['machines'][machine][
+                               'dns-name'],
+                           'instance-id': self.state['machines'][machine][
+                               'hostname'],
+                           'series': 'xenial'})
+                for machine in machines),
+            'applications': applications,
+        }
+
+    def _command_result(self, unit, command):
+        info = self.state['units'][unit]
+        machine = self.state['machines'][info['machine']]
+        for handler in self.state['commands']:
+            if re.search(handler['match'], command):
+                duration = self._scaled(sample_duration(
+                    handler.get('duration'),
+                    self._rng(unit, command, self.now)))
+                return (handler.get('stdout', ''), int(handler.get('code', 0)),
+                        duration)
+        if command.strip() == 'is-leader':
+            return str(info['leader']), 0, 0.0
+        if command.strip() == 'hostname':
+            return machine['hostname'], 0, 0.0
+        if 'pocket=' in command and 'pending=' in command:
+            # The probe for the cloud archive pocket of the unit
+            try:
+                pocket = cloud_archive_pocket(info['origin'])
+            except UnsupportedOrigin:
+                pocket = ''
+            return 'pocket={}\npending=0'.format(pocket), 0, 0.0
+        return '', 0, 0.0
+
+    def run(self, units, command, timeout=None):
+        """Run a command on units at the same time
+
+        :returns: tuple of the list of results, in the format of juju run,
+                  and the seconds the slowest unit took
+        """
+        results = []
+        longest = 0.0
+        for unit in units:
+            info = self._unit(unit)
+            stdout, code, duration = self._command_result(unit, command)
+            result = {'UnitId': unit, 'MachineId': info['machine'],
+                      'Stdout': stdout + '\n' if stdout else '',
+                      'ReturnCode': code}
+            if timeout and duration > timeout:
+                duration = timeout
+                result.update({'Stdout': '', 'ReturnCode': 124,
+                               'Stderr': 'command timed out'})
+            elif code:
+                result['Stderr'] = 'command failed'
+            longest = max(longest, duration)
+            results.append(result)
+        return results, longest
+
+
+def _timestamp(seconds):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds))
+
+
+def _parse_timeout(timeout):
+    """Return the seconds in a juju duration such as 30s, 5m or 1h"""
+    if not timeout:
+        return None
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    if timeout[-1] in units:
+        return float(timeout[:-1]) * units[timeout[-1]]
+    return float(timeout)
+
+
+def save_state(path, state):
+    """Write state to path atomically"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.simulator-')
+    try:
+        with os.fdopen(fd, 'w') as state_file:
+            json.dump(state, state_file)
+        os.rename(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+def calls_file(path):
+    return path + '.calls'
+
+
+def init(description_file, path):
+    """Create the state of a simulated model from a description
+
+    Any previous state and call log at path are replaced.
+    """
+    from os_charms_tools import yaml_io
+    state = build_state(yaml_io.load_file(description_file) or {})
+    save_state(path, state)
+    with open(calls_file(path), 'w'):
+        pass
+    return state
+
+
+def report(path):
+    """Summarise the juju calls made against a simulated model
+
+    :returns: dictionary of command name to a dictionary with the calls
+              count and total seconds, and the wall time from the first
+              call to the end of the last one under 'wall-seconds'
+    """
+    commands = {}
+    first = last = None
+    with open(calls_file(path)) as calls:
+        for line in calls:
+            call = json.loads(line)
+            entry = commands.setdefault(call['command'],
+                                        {'calls': 0, 'seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += call['seconds']
+            first = call['start'] if first is None else min(first,
+                                                            call['start'])
+            end = call['start'] + call['seconds']
+            last = end if last is None else max(last, end)
+    return {'commands': commands,
+            'calls': sum(entry['calls'] for entry in commands.values()),
+            'wall-seconds': (last - first) if commands else 0.0}
+
+
+def _option(args, name, default=None):
+    """Remove --name value or --name=value from args, returning the value"""
+    for i, arg in enumerate(args):
+        if arg == name and i + 1 < len(args):
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        if arg.startswith(name + '='):
+            del args[i]
+            return arg.split('=', 1)[1]
+    return default
+
+
+def _flag(args, name):
+    if name in args:
+        args.remove(name)
+        return True
+    return False
+
+
+def _dump(data, output_format):
+    if output_format == 'json':
+        return json.dumps(data) + '\n'
+    from os_charms_tools import yaml_io
+    return yaml_io.dump(data)
+
+
+def juju(path, argv):
+    """Run a juju command against the simulated model
+
+    :param: path: the state file of the model
+    :param: argv: the arguments juju was invoked with
+    :returns: tuple of stdout, stderr and the exit code
+    """
+    if not argv:
+        return '', 'ERROR no command specified\n', 2
+    command, args = argv[0], list(argv[1:])
+    if command == 'version':
+        return SIMULATED_VERSION + '\n', '', 0
+    # The model is chosen by the state file
+    _option(args, '-m')
+    _option(args, '--model')
+    output_format = _option(args, '--format')
+    sleep = 0.0
+    try:
+        with Simulator.locked(path) as simulator:
+            sleep += sample_duration(simulator.state['latency'], random)
+            if command == 'status':
+                output = _dump(simulator.status(args), output_format or
+                               'yaml')
+            elif command == 'run-action':
+                _flag(args, '--wait')
+                if len(args) < 2:
+                    raise SimulatorError('no action specified')
+                ids = simulator.run_action(args[:-1], args[-1])
+                output = ''.join('Action queued with id: {}\n'.format(i)
+                                 for i in ids)
+            elif command == 'show-action-output':
+                output = _dump(simulator.action_output(args[0]),
+                               output_format or 'yaml')
+            elif command == 'show-action-status':
+                output = _dump(simulator.action_statuses(),
+                               output_format or 'yaml')
+            elif command in ('actions', 'list-actions'):
+                schema = _flag(args, '--schema')
+                actions = simulator.actions(args[0])
+                if schema:
+                    data = dict((action, {'description': action,
+                                          'properties': {}})
+                                for action in actions)
+                else:
+                    data = dict((action, action) for action in actions)
+                output = _dump(data, output_format or 'yaml')
+            elif command == 'config':
+                settings = dict(arg.split('=', 1) for arg in args[1:]
+                                if '=' in arg)
+                if settings:
+                    simulator.set_config(args[0], settings)
+                    output = ''
+                elif len(args) > 1:
+                    config = simulator.get_config(args[0])['settings']
+                    output = '{}\n'.format(
+                        config.get(args[1], {}).get('value', ''))
+                else:
+                    output = _dump(simulator.get_config(args[0]),
+                                   output_format or 'yaml')
+            elif command == 'run':
+                units = []
+                applications = _option(args, '--application')
+                for application in (applications or '').split(','):
+                    if application:
+                        units.extend(simulator._application(
+                            application)['units'])
+                units.extend(unit for unit in
+                             (_option(args, '--unit') or '').split(',')
+                             if unit)
+                timeout = _parse_timeout(_option(args, '--timeout'))
+                results, duration = simulator.run(units, ' '.join(args),
+                                                  timeout)
+                sleep += duration
+                output = _dump(results, output_format or 'yaml')
+            else:
+                return '', 'ERROR unrecognized command: juju {}\n'.format(
+                    command), 2
+    except SimulatorError as e:
+        return '', 'ERROR {}\n'.format(e), 1
+    # The controller round trip, and juju run waiting for the command to
+    # finish on every unit, happen without holding the model
+    if sleep:
+        time.sleep(sleep)
+    return output, '', 0
+
+
+def main(argv=None):
+    """Entry point of juju-simulator.py
+
+    init and report manage a simulated model, any other command is handled
+    as the juju client would, against the model named by
+    JUJU_SIMULATOR_STATE.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    path = os.environ.get(STATE_ENVIRONMENT)
+    if argv and argv[0] in ('init', 'report'):
+        args = list(argv[1:])
+        path = _option(args, '--state', path)
+        if not path:
+            sys.stderr.write('Set {} or pass --state\n'.format(
+                STATE_ENVIRONMENT))
+            return 2
+        path = os.path.abspath(path)
+        if argv[0] == 'init':
+            if not args:
+                sys.stderr.write('Usage: juju-simulator.py init '
+                                 'DESCRIPTION [--state FILE]\n')
+                return 2
+            state = init(args[0], path)
+            sys.stderr.write('Simulating {} units of {} applications\n'
+                             ''.format(len(state['units']),
+                                       len(state['applications'])))
+            sys.stdout.write('export JUJU_BINARY={} {}={}\n'.format(
+                os.path.abspath(sys.argv[0]), STATE_ENVIRONMENT, path))
+        else:
+            summary = report(path)
+            for command, entry in sorted(summary['commands'].items()):
+                sys.stdout.write('{:<20} {:>8} calls {:>10.2f}s\n'.format(
+                    command, entry['calls'], entry['seconds']))
+            sys.stdout.write('{:<20} {:>8} calls {:>10.2f}s wall\n'.format(
+                'total', summary['calls'], summary['wall-seconds']))
+        return 0
+
+    if not path:
+        sys.stderr.write('ERROR {} is not set, create a simulated model '
+                         'with juju-simulator.py init\n'.format(
+                             STATE_ENVIRONMENT))
+        return 1
+    start = time.time()
+    stdout, stderr, code = juju(path, argv)
+    elapsed = time.time() - start
+    with open(calls_file(path), 'a') as calls:
+        calls.write(json.dumps({'command': argv[0] if argv else '',
+                                'start': start, 'seconds': elapsed,
+                                'code': code}) + '\n')
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return code
@@ -0,0 +1,569 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+kiki is a set of helpers to allow coding against both Juju 1.25 and 2.1
+commands.
+
+Usage:
+
+import kiki
+
+cmd = [kiki.cmd(), kiki.remove_unit(), unit]
+subprocess.check_call(cmd)
+
+if kiki.min_version('2.1'):
+   ...
+
+The Juju version is only probed when a translation first needs it, and is
+remembered on disk per Juju binary so later processes do not need to run
+`juju version` at all.
+
+"""
+
+from collections import OrderedDict
+from distutils.version import LooseVersion
+from functools import wraps
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+__author__ = 'David Ames <david.ames@canonical.com>'
+
+# Environment variables which select the Juju binary, see cmd(). Every cached
+# result is dropped when any of them changes.
+CACHE_ENVIRONMENT = ('JUJU_BINARY', 'JUJU_VERSION')
+
+# Qualified function name to FunctionCache of every cached function
+caches = {}
+_cache_environment = None
+_cache_lock = threading.Lock()
+
+
+class JujuBinaryNotFound(Exception):
+    pass
+
+
+class UnsupportedJujuVersion(Exception):
+    pass
+
+
+class FunctionCache(object):
+    """Results of one cached function
+
+    @param maxsize: number of results kept, the least recently used result is
+                    dropped first. None for no limit.
+    @param ttl: seconds a result is kept for. None for no limit.
+    """
+
+    def __init__(self, name, maxsize=None, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached result for key
+
+        @raises KeyError: if there is no result, or it has expired
+        """
+        with self._lock:
+            try:
+                value, expires = self._results[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            if expires is not None and expires < time.monotonic():
+                del self._results[key]
+                self.misses += 1
+                raise KeyError(key)
+            if self.maxsize is not None:
+                self._results.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._results[key] = (value, expires)
+            if self.maxsize is not None:
+                self._results.move_to_end(key)
+                while len(self._results) > self.maxsize:
+                    self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def info(self):
+        """Return the counters of the cache
+
+        @returns dictionary with hits, misses, size, maxsize and ttl keys
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._results), 'maxsize': self.maxsize,
+                    'ttl': self.ttl}
+
+
+def clear_caches():
+    """Drop every cached result"""
+    for function_cache in caches.values():
+        function_cache.clear()
+
+
+def cache_info():
+    """Return the counters of every cached function
+
+    @returns dictionary of qualified function name, i.e.
+             os_charms_tools.kiki.version, to FunctionCache.info()
+    """
+    return dict((name, function_cache.info())
+                for name, function_cache in caches.items())
+
+
+def _check_cache_environment():
+    """Drop every cached result if the Juju binary selection changed"""
+    global _cache_environment
+    environment = tuple(os.environ.get(name) for name in CACHE_ENVIRONMENT)
+    if environment != _cache_environment:
+        with _cache_lock:
+            if environment != _cache_environment:
+                clear_caches()
+                _cache_environment = environment
+
+
+def cached(func=None, maxsize=None, ttl=None):
+    """Cache return values for multiple executions of func + args
+
+    For example::
+
+        @cached
+        def min_version(attribute):
+            pass
+
+        min_version('2.1')
+
+    will cache the result of min_version + '2.1' for future calls.
+
+    The number of results kept and how long they are kept for may be
+    limited::
+
+        @cached(maxsize=128, ttl=60)
+        def status(application):
+            pass
+
+    Results are keyed on the arguments, which must be hashable; calls with
+    unhashable arguments are not cached. All results are dropped when an
+    environment variable of CACHE_ENVIRONMENT changes.
+
+    @param maxsize: number of results kept, None for no limit
+    @param ttl: seconds each result is kept for, None for no limit
+    @returns fuction
+    """
+    if func is None:
+        return lambda f: cached(f, maxsize=maxsize, ttl=ttl)
+
+    # Qualified, so same-named functions of other modules get their own
+    name = '{}.{}'.format(func.__module__, func.__qualname__)
+    function_cache = FunctionCache(name, maxsize=maxsize, ttl=ttl)
+    caches[name] = function_cache
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        _check_cache_environment()
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            return function_cache.get(key)
+        except KeyError:
+            pass  # Drop out of the exception handler scope.
+        except TypeError:
+            # Unhashable arguments
+            return func(*args, **kwargs)
+        res = func(*args, **kwargs)
+        function_cache.put(key, res)
+        return res
+    wrapper._wrapped = func
+    wrapper.cache = function_cache
+    return wrapper
+
+
+@cached
+def cmd():
+    """Return the Juju command
+
+    There are times when multiple versions of Juju may be installed or
+    unpacked requiring testing.
+    This function leverages two environment variables to select the correct
+    Juju binary. Thus allowing easy switching from one version to another.
+
+     JUJU_BINARY: The full path location to a Juju binary that may not be in
+                  $PATH.
+                  Example:
+                  /home/ubuntu/Downloads/juju/usr/lib/juju-2.1-rc1/bin/juju
+
+     JUJU_VERSION: The full binary name of Juju that is in $PATH.
+                   Example: juju-2.1-rc1
+                   The result of $(which juju-2.1-rc1)
+
+    If neither of these environment variables is set, the default Juju binary
+    in $PATH is selected.
+    Example: juju
+    The result of $(which juju)
+
+    @returns string Juju command
+    """
+
+    if os.environ.get('JUJU_BINARY'):
+        juju = os.environ.get('JUJU_BINARY')
+    elif os.environ.get('JUJU_VERSION'):
+        ver = (".".join(os.environ.get('JUJU_VERSION')
+               .split('-')[0].split('.')[:2]))
+        juju = 'juju-{}'.format(ver)
+    else:
+        juju = 'juju'
+    return juju
+
+
+def version_cache_file():
+    """Return the file Juju versions are remembered in
+
+    @returns string path
+    """
+    cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                  os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'kiki', 'versions.json')
+
+
+def _binary_key():
+    """Return the resolved path and mtime of the Juju binary
+
+    @returns tuple (path, mtime), None if the binary can not be found
+    """
+    path = shutil.which(cmd())
+    if not path:
+        return None
+    path = os.path.realpath(path)
+    try:
+        return path, os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _read_version_cache():
+    try:
+        with open(version_cache_file()) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_version_cache(path, mtime, juju_version):
+    """Remember the version of the binary at path
+
+    Failing to write the cache only costs a `juju version` next time, so
+    errors are ignored.
+    """
+    versions = _read_version_cache()
+    versions[path] = {'mtime': mtime, 'version': juju_version}
+    cache_file = version_cache_file()
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump(versions, tmp_file, indent=2, sort_keys=True)
+        os.rename(tmp_path, cache_file)
+    except OSError:
+        pass
+
+
+@cached
+def version():
+    """Return the Juju version
+
+    The version is looked up in the version cache first, keyed by the
+    resolved path and modification time of the binary, and only probed with
+    `juju version` when the binary is not in the cache or has changed.
+
+    @raises JujuBinaryNotFound: If command not found.
+    @returns string Juju version
+    """
+    key = _binary_key()
+    if key:
+        cached_version = _read_version_cache().get(key[0])
+        if cached_version and cached_version.get('mtime') == key[1]:
+            return cached_version['version']
+    try:
+        juju_version = (subprocess.check_output([cmd(), 'version'])
+                        .decode('utf-8').rstrip())
+    except OSError as e:
+        raise JujuBinaryNotFound("Juju is not installed at {}. Error: {}"
+                                 "".format(cmd(), e))
+    if key:
+        _write_version_cache(key[0], key[1], juju_version)
+    return juju_version
+
+
+@cached
+def min_version(minimum_version='2.1'):
+    """Return True if the Juju version is at least the provided version
+
+    The first call validates that the Juju version is supported.
+
+    @param minimum_version: string version of Juju
+    @raises UnsupportedJujuVersion: If Juju version 2.0.x
+    @returns boolean
+    """
+    supported_juju_version()
+    return _at_least(minimum_version)
+
+
+@cached
+def _at_least(minimum_version):
+    return LooseVersion(version()) >= LooseVersion(minimum_version)
+
+
+@cached
+def supported_juju_version():
+    """Validate supported version of Juju
+
+    kiki currently supports Juju 1.25.x and >= 2.1.0 CLI command structures.
+    Juju 2.0.x has a third set of command structure that could be added to kiki
+    at a later date if it becomes necessary.
+
+    kiki currently does not support 2.0.x. Explicitly fail if the Juju binary
+    is 2.0.x.
+
+    @raises UnsupportedJujuVersion: If Juju version 2.0.x
+    @returns boolean
+    """
+    if (not _at_least('2.1') and
+            _at_least('2.0')):
+        raise UnsupportedJujuVersion("Kiki does not support Juju 2.0.x "
+                                     "command structure")
+    return True
+
+
+@cached
+def application():
+    """Translate argument for application
+
+    @returns string Juju argument for application
+    """
+    if min_version('2.1'):
+        return "application"
+    else:
+        return "service"
+
+
+@cached
+def applications():
+    """Translate identifier for applications
+
+    In Juju status yaml/json output the dictionary key for the set of deployed
+    charms is referred to in the plural.
+
+    Example:
+    juju_status = subprocess.check_call([kiki.cmd(), 'status', '--format',
+                                        'yaml'])
+    juju_status[kiki.applications()]['myapp']['units']
+
+    @returns string Juju identifier for applications
+    """
+    return '{}s'.format(application())
+
+
+@cached
+def get_config():
+    """Translate argument for config get
+
+    @returns string Juju argument for config (get)
+    """
+    if min_version('2.1'):
+        return "config"
+    else:
+        return "get"
+
+
+@cached
+def set_config():
+    """Translate argument for config set
+
+    @returns string Juju argument for config (set)
+    """
+    if min_version('2.1'):
+        return "config"
+    else:
+        return "set"
+
+
+@cached
+def get_model_config():
+    """Translate argument for model-config get
+
+    @returns string Juju argument for model-config (get)
+    """
+    if min_version('2.1'):
+        return "model-config"
+    else:
+        return "get-environment"
+
+
+@cached
+def set_model_config():
+    """Translate argument for model-config get
+
+    @returns string Juju argument for model-config (get)
+    """
+    if min_version('2.1'):
+        return "model-config"
+    else:
+        return "set-environment"
+
+
+@cached
+def remove_unit():
+    """Translate argument for remove-unit
+
+    @returns string Juju argument for remove-unit
+    """
+    if min_version('2.1'):
+        return "remove-unit"
+    else:
+        return "destroy-unit"
+
+
+@cached
+def actions():
+    """Translate argument for actions
+
+    @returns string Juju argument for actions
+    """
+    if min_version('2.1'):
+        return "actions"
+    else:
+        return "action"
+
+
+@cached
+def action_show_action_output():
+    """Translate argument for show-action-output
+
+    @returns string Juju argument for show-action-output
+    """
+    if min_version('2.1'):
+        return "show-action-output"
+    else:
+        return "fetch"
+
+
+@cached
+def action_show_action_status():
+    """Translate argument for show-action-status
+
+    @returns string Juju argument for show-action-status
+    """
+    if min_version('2.1'):
+        return "show-action-status"
+    else:
+        return "status"
+
+
+@cached
+def run_action():
+    """Translate argument for run-action
+
+    @returns string Juju argument for run-action
+    """
+    if min_version('2.1'):
+        return "run-action"
+    else:
+        return "do"
+
+
+@cached
+def show_action_output_cmd():
+    """Translate command for show-action-output
+
+    The command structure for retrieving the results of an action is quite
+    different from Juju 1.25.x to Juju 2.1.
+
+    Build and return the whole command required to retrieve action results.
+
+    @returns list of Juju command arguments for show-action-output
+    """
+    command = [cmd()]
+    if not min_version('2.1'):
+        command.append(actions())
+    command.append(action_show_action_output())
+    return command
+
+
+@cached
+def show_action_status_cmd():
+    """Translate command for show-action-status
+
+    Build and return the whole command required to retrieve the status of
+    all actions in the model.
+
+    @returns list of Juju command arguments for show-action-status
+    """
+    command = [cmd()]
+    if not min_version('2.1'):
+        command.append(actions())
+    command.append(action_show_action_status())
+    return command
+
+
+@cached
+def run_action_cmd():
+    """Translate command for run-action
+
+    The command structure for running an action is quite different from Juju
+    1.25.x to Juju 2.1.
+
+    Build and return the whole command required to run an action.
+
+    @returns list of Juju command arguments for run-action
+    """
+    command = [cmd()]
+    if not min_version('2.1'):
+        command.append(actions())
+    command.append(run_action())
+    return command
+
+
+@cached
+def list_actions_cmd():
+    """Translate command for list-actions
+
+    @returns list of Juju command arguments for list-action
+    """
+    command = [cmd()]
+    if min_version('2.1'):
+        command.append(actions())
+    else:
+        command.extend([actions(), 'defined'])
+    return command
@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Run Juju commands built with kiki, several at a time.
+
+Commands ask for JSON output and are returned as CommandResults holding the
+parsed output, or the error which stopped the command, rather than raising,
+so one failing command among hundreds does not lose the results of the rest.
+
+Usage:
+
+from os_charms_tools import kiki
+from os_charms_tools.kiki.runner import Runner
+
+runner = Runner(concurrency=8, timeout=60)
+results = runner.run_many([kiki.show_action_output_cmd() + [action_id]
+                           for action_id in action_ids])
+for result in results:
+    if result.ok:
+        print(result.data['status'])
+    else:
+        print(result.error)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import subprocess
+import time
+
+# Default number of commands run at the same time
+DEFAULT_CONCURRENCY = 8
+
+
+class JujuCommandError(Exception):
+    pass
+
+
+class CommandResult(object):
+    """The outcome of one Juju command
+
+    @param cmd: the command line which was run
+    @param returncode: exit code, None if the command did not finish
+    @param stdout: decoded standard output
+    @param stderr: decoded standard error
+    @param data: the parsed output, None if output was not parsed
+    @param error: description of what went wrong, None on success
+    @param duration: seconds the command ran for
+    """
+
+    def __init__(self, cmd, returncode=None, stdout='', stderr='', data=None,
+                 error=None, duration=0.0):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.data = data
+        self.error = error
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def check(self):
+        """Return the parsed output, or the raw output if not parsed
+
+        @raises JujuCommandError: if the command failed
+        """
+        if not self.ok:
+            raise JujuCommandError(self.error)
+        return self.data if self.data is not None else self.stdout
+
+    def __repr__(self):
+        return '<CommandResult {} {}>'.format(
+            ' '.join(self.cmd), 'ok' if self.ok else repr(self.error))
+
+
+class Runner(object):
+    """Runs Juju commands with bounded concurrency
+
+    @param concurrency: maximum number of commands running at once
+    @param timeout: seconds each command is allowed, None for no limit
+    @param model: [controller:]model the commands operate on, defaults to the
+                  current model of the client
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, timeout=None,
+                 model=None):
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.model = model
+        self.env = None
+        if model:
+            self.env = dict(os.environ)
+            # JUJU_ENV is the Juju 1.x spelling
+            self.env['JUJU_MODEL'] = self.env['JUJU_ENV'] = model
+
+    def run(self, cmd, output_format='json', timeout=None):
+        """Run one command
+
+        @param cmd: list of command arguments, i.e. from kiki.run_action_cmd()
+        @param output_format: 'json' to ask for and parse JSON output, None to
+                              leave the output as text
+        @param timeout: seconds allowed, overriding the runner's timeout
+        @returns CommandResult
+        """
+        cmd = list(cmd)
+        if output_format == 'json' and not any(
+                arg.startswith('--format') for arg in cmd):
+            cmd.append('--format=json')
+        timeout = timeout or self.timeout
+        start = time.time()
+        try:
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE,
+                                  stdin=subprocess.DEVNULL, env=self.env,
+                                  timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            return CommandResult(
+                cmd, stdout=(e.stdout or b'').decode('utf-8', 'replace'),
+                error='{} timed out after {}s'.format(' '.join(cmd),
+                                                      timeout),
+                duration=time.time() - start)
+        except OSError as e:
+            return CommandResult(cmd, error='{} failed: {}'.format(
+                ' '.join(cmd), e), duration=time.time() - start)
+
+        result = CommandResult(cmd, proc.returncode,
+                               proc.stdout.decode('utf-8', 'replace'),
+                               proc.stderr.decode('utf-8', 'replace'),
+                               duration=time.time() - start)
+        if proc.returncode != 0:
+            result.error = '{} failed: {}'.format(' '.join(cmd),
+                                                  result.stderr.strip())
+        elif output_format == 'json':
+            try:
+                result.data = json.loads(result.stdout)
+            except ValueError as e:
+                result.error = 'Unable to parse the output of {}: {}'.format(
+                    ' '.join(cmd), e)
+        return result
+
+    def run_many(self, cmds, output_format='json', timeout=None):
+        """Run several commands, concurrency at a time
+
+        @param cmds: list of lists of command arguments
+        @returns list of CommandResult, in the order of cmds
+        """
+        if not cmds:
+            return []
+        workers = min(self.concurrency, len(cmds))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(
+                lambda cmd: self.run(cmd, output_format, timeout), cmds))
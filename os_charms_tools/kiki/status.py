@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A model status snapshot indexed for direct lookups.
+
+The status of the model is fetched once and its applications, units,
+subordinate units and machines indexed by name, whichever version of Juju
+reported it. One application can be refreshed on its own later, without
+fetching and parsing the status of the whole model again.
+
+Usage:
+
+from os_charms_tools.kiki.status import StatusSnapshot
+
+snapshot = StatusSnapshot()
+for unit in snapshot.units('keystone'):
+    print(unit, snapshot.unit(unit)['workload-status']['current'],
+          snapshot.machine_of(unit).get('dns-name'))
+snapshot.refresh_application('keystone')
+"""
+
+from os_charms_tools import kiki
+from os_charms_tools.kiki.runner import Runner
+
+
+class UnknownEntity(KeyError):
+    pass
+
+
+class StatusSnapshot(object):
+    """Indexed status of a model
+
+    @param runner: Runner the status is fetched with, a default Runner if
+                   None
+    @param status: status dictionary to index instead of fetching one
+    @param fetch: callable taking an optional application name and returning
+                  its status, used instead of the runner, i.e. the status
+                  method of a JujuBackend
+    @param applications_key: status key the applications are listed under,
+                             worked out from the Juju version if None
+    """
+
+    def __init__(self, runner=None, status=None, fetch=None,
+                 applications_key=None):
+        self.runner = runner or Runner()
+        self.fetch = fetch
+        self.applications_key = applications_key or kiki.applications()
+        self.status = None
+        self._applications = {}
+        self._units = {}
+        self._unit_application = {}
+        self._principals = {}
+        self._machines = {}
+        if status is None:
+            self.refresh()
+        else:
+            self._index(status)
+
+    def _fetch(self, application=None):
+        if self.fetch:
+            return self.fetch(application)
+        cmd = [kiki.cmd(), 'status']
+        if application:
+            cmd.append(application)
+        return self.runner.run(cmd).check()
+
+    def refresh(self):
+        """Fetch and index the status of the whole model"""
+        self._index(self._fetch())
+
+    def refresh_application(self, application):
+        """Fetch and index the status of one application
+
+        The units and machines of the application are replaced, the rest of
+        the snapshot is left as it was.
+
+        @raises UnknownEntity: if the application no longer exists
+        """
+        status = self._fetch(application)
+        found = status.get(self.applications_key) or {}
+        self._forget_application(application)
+        if application not in found:
+            self.status[self.applications_key].pop(application, None)
+            raise UnknownEntity(application)
+        self.status[self.applications_key][application] = found[application]
+        self._index_application(application, found[application])
+        for machine_id, machine in (status.get('machines') or {}).items():
+            self.status.setdefault('machines', {})[machine_id] = machine
+            self._index_machine(machine_id, machine)
+
+    def _index(self, status):
+        self.status = status
+        self._applications.clear()
+        self._units.clear()
+        self._unit_application.clear()
+        self._principals.clear()
+        self._machines.clear()
+        status.setdefault(self.applications_key, {})
+        for name, application in status[self.applications_key].items():
+            self._index_application(name, application)
+        for machine_id, machine in (status.get('machines') or {}).items():
+            self._index_machine(machine_id, machine)
+
+    def _index_application(self, name, application):
+        self._applications[name] = application
+        for unit_name, unit in (application.get('units') or {}).items():
+            self._units[unit_name] = unit
+            self._unit_application[unit_name] = name
+            for sub_name, sub in (unit.get('subordinates') or {}).items():
+                self._units[sub_name] = sub
+                self._unit_application[sub_name] = sub_name.split('/')[0]
+                self._principals[sub_name] = unit_name
+
+    def _index_machine(self, machine_id, machine):
+        self._machines[machine_id] = machine
+        # Containers are nested within their host machine
+        for container_id, container in (machine.get('containers') or
+                                        {}).items():
+            self._index_machine(container_id, container)
+
+    def _forget_application(self, name):
+        application = self._applications.pop(name, None)
+        if application is None:
+            return
+        for unit_name, unit in (application.get('units') or {}).items():
+            self._units.pop(unit_name, None)
+            self._unit_application.pop(unit_name, None)
+            for sub_name in unit.get('subordinates') or {}:
+                if self._principals.get(sub_name) == unit_name:
+                    self._units.pop(sub_name, None)
+                    self._unit_application.pop(sub_name, None)
+                    self._principals.pop(sub_name, None)
+
+    def application_names(self):
+        return sorted(self._applications)
+
+    def application(self, name):
+        """Return the status of an application
+
+        @raises UnknownEntity: if there is no such application
+        """
+        try:
+            return self._applications[name]
+        except KeyError:
+            raise UnknownEntity(name)
+
+    def units(self, application):
+        """Return the names of the principal units of an application
+
+        @returns sorted list of unit names
+        """
+        return sorted((self.application(application).get('units') or {}))
+
+    def unit(self, name):
+        """Return the status of a unit, principal or subordinate
+
+        @raises UnknownEntity: if there is no such unit
+        """
+        try:
+            return self._units[name]
+        except KeyError:
+            raise UnknownEntity(name)
+
+    def unit_application(self, name):
+        """Return the name of the application of a unit"""
+        try:
+            return self._unit_application[name]
+        except KeyError:
+            raise UnknownEntity(name)
+
+    def subordinates(self, unit):
+        """Return the names of the subordinate units of a principal unit"""
+        return sorted(self.unit(unit).get('subordinates') or {})
+
+    def principal(self, unit):
+        """Return the name of the principal of a unit
+
+        @returns unit name, the unit itself if it is a principal
+        """
+        self.unit(unit)
+        return self._principals.get(unit, unit)
+
+    def leader(self, application):
+        """Return the name of the leader unit of an application
+
+        @returns unit name, None if the status does not report a leader
+        """
+        for name, unit in (self.application(application).get('units') or
+                           {}).items():
+            if unit.get('leader'):
+                return name
+        return None
+
+    def machine(self, machine_id):
+        """Return the status of a machine or container
+
+        @raises UnknownEntity: if there is no such machine
+        """
+        try:
+            return self._machines[str(machine_id)]
+        except KeyError:
+            raise UnknownEntity(machine_id)
+
+    def machine_of(self, unit):
+        """Return the status of the machine a unit, or its principal, is on"""
+        return self.machine(self.unit(self.principal(unit)).get('machine'))
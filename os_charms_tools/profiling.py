@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Profiling of the command line tools, turned on with --profile.
+
+While profiling, every thread runs under cProfile and the stacks of all
+threads are sampled, so both the deterministic statistics and a flame graph
+cover the work done in thread pools. Named phases of the tool are timed by
+wall clock. When profiling stops, given the prefix PREFIX, these are
+written:
+
+ PREFIX.pstats:    cProfile statistics, for pstats, snakeviz and the like
+ PREFIX.txt:       the functions taking the most cumulative time
+ PREFIX.collapsed: sampled stacks in the collapsed format read by
+                   flamegraph.pl and speedscope
+ PREFIX.phases:    wall clock time of each phase
+
+phase() costs next to nothing when profiling is off, so phases may be
+marked unconditionally.
+
+Usage:
+
+from os_charms_tools import profiling
+
+profiling.start('render_bundle.profile')
+try:
+    with profiling.phase('load'):
+        ...
+finally:
+    profiling.stop()
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+# Seconds between samples of the thread stacks
+DEFAULT_INTERVAL = 0.005
+
+# Number of functions listed in PREFIX.txt
+REPORT_FUNCTIONS = 40
+
+# From Python 3.12 cProfile profiles every thread of the process, and only
+# one profiler may be enabled at a time
+PROFILES_ALL_THREADS = sys.version_info >= (3, 12)
+
+_active = None
+
+
+class StackSampler(threading.Thread):
+    """Counts the stacks of every other thread, interval seconds apart"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        super(StackSampler, self).__init__(name='profile-sampler')
+        self.daemon = True
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        names = dict((thread.ident, thread.name)
+                     for thread in threading.enumerate())
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(
+                    code.co_name, os.path.basename(code.co_filename),
+                    code.co_firstlineno))
+                frame = frame.f_back
+            # Workers of one pool share a name, merging their stacks
+            stack.append(re.sub(r'_\d+$', '', names.get(ident,
+                                                        str(ident))))
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class Profiler(object):
+    """Profiles the process until stopped, then writes the reports
+
+    :param: prefix: path the report files are named from
+    :param: interval: seconds between stack samples
+    """
+
+    def __init__(self, prefix, interval=DEFAULT_INTERVAL):
+        # cProfile and pstats are only imported when profiling, every run
+        # of the tools imports this module
+        import cProfile
+        self.prefix = prefix
+        self.sampler = StackSampler(interval)
+        self.phases = {}
+        self.start_time = None
+        self._profile = cProfile.Profile()
+        self._thread_profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _profile_thread(self, frame, event, arg):
+        # Called by threading in each new thread, replaced by cProfile's own
+        # hook as soon as the thread's profile is enabled
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already enabled and sees this thread.
+            # Remove the hook, or it runs again on every call.
+            sys.setprofile(None)
+            return
+        with self._lock:
+            self._thread_profiles.append(profile)
+
+    def start(self):
+        self.start_time = time.time()
+        self.sampler.start()
+        if not PROFILES_ALL_THREADS:
+            threading.setprofile(self._profile_thread)
+        self._profile.enable()
+
+    @contextmanager
+    def phase(self, name):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        path = '/'.join(stack)
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            stack.pop()
+            with self._lock:
+                entry = self.phases.setdefault(path, [0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def stop(self):
+        """Stop profiling and write the reports
+
+        :returns: list of the files written
+        """
+        import pstats
+        self._profile.disable()
+        if not PROFILES_ALL_THREADS:
+            threading.setprofile(None)
+        self.sampler.stop()
+        wall = time.time() - self.start_time
+
+        stats = pstats.Stats(self._profile)
+        with self._lock:
+            thread_profiles = list(self._thread_profiles)
+        for profile in thread_profiles:
+            try:
+                stats.add(profile)
+            except TypeError:
+                # The thread ran nothing while profiled
+                pass
+        written = []
+
+        path = self.prefix + '.pstats'
+        stats.dump_stats(path)
+        written.append(path)
+
+        path = self.prefix + '.txt'
+        with open(path, 'w') as report:
+            stats.stream = report
+            stats.sort_stats('cumulative').print_stats(REPORT_FUNCTIONS)
+        written.append(path)
+
+        path = self.prefix + '.collapsed'
+        with open(path, 'w') as collapsed:
+            for stack, count in sorted(self.sampler.stacks.items()):
+                collapsed.write('{} {}\n'.format(stack, count))
+        written.append(path)
+
+        path = self.prefix + '.phases'
+        with open(path, 'w') as phases:
+            phases.write(self.format_phases(wall))
+        written.append(path)
+        return written
+
+    def format_phases(self, wall):
+        """Return the table of the time spent in each phase
+
+        Phases within phases are named parent/child. Phases run by several
+        threads at once may add up to more than the wall clock time.
+        """
+        lines = ['{:<40} {:>6} {:>10} {:>7}'.format('phase', 'calls',
+                                                    'seconds', '% wall'),
+                 '{:<40} {:>6} {:>10.3f} {:>7.1f}'.format('total', 1, wall,
+                                                          100.0)]
+        for path, (calls, seconds) in sorted(self.phases.items()):
+            lines.append('{:<40} {:>6} {:>10.3f} {:>7.1f}'.format(
+                path, calls, seconds, 100.0 * seconds / wall if wall else 0))
+        return '\n'.join(lines) + '\n'
+
+
+def start(prefix, interval=DEFAULT_INTERVAL):
+    """Start profiling the process, the reports being named from prefix"""
+    global _active
+    if _active is not None:
+        raise RuntimeError('Profiling has already started')
+    _active = Profiler(prefix, interval)
+    _active.start()
+
+
+def stop():
+    """Stop profiling and write the reports, if profiling
+
+    :returns: list of the files written
+    """
+    global _active
+    if _active is None:
+        return []
+    profiler, _active = _active, None
+    written = profiler.stop()
+    logging.info('Profile written to {}'.format(', '.join(written)))
+    return written
+
+
+@contextmanager
+def phase(name):
+    """Time the enclosed code as a phase, if profiling"""
+    if _active is None:
+        yield
+    else:
+        with _active.phase(name):
+            yield
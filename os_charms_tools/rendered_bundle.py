@@ -26,6 +26,7 @@ import logging
 import os
 import yaml
 
+from os_charms_tools import yaml_io
 from os_charms_tools.charm import Charm
 from os_charms_tools.tools_common import render_target_inheritance
 from os_charms_tools.base_constants import (
@@ -117,7 +118,9 @@ class RenderedBundle(object):
 
     def get_bundle_from_yaml(self, yamlfile):
         # Get a dictionary representation of the bundle
-        bundle_dict = self.get_yaml_dict(yamlfile)
+        # Of a deployer file only the target rendered and the targets it
+        # inherits from are loaded
+        bundle_dict = self.get_yaml_dict(yamlfile, self.get_target())
 
         # The render_target_inheritance function has this note:
         #   - Use an override keys map to determine which charms and config
@@ -189,7 +192,7 @@ class RenderedBundle(object):
     def write_bundle(self, destination):
 
         with open(destination, 'w') as dest:
-            dest.write(yaml.dump(self.get_bundle_dict()))
+            yaml_io.dump(self.get_bundle_dict(), dest)
 
     def add_ha(self):
         # TODO read vips from yaml fragment
@@ -221,11 +224,13 @@ class RenderedBundle(object):
             self.relations.append(
                     [charm.application_name, charm_obj.application_name])
 
-    def get_yaml_dict(self, filename):
+    def get_yaml_dict(self, filename, target=None):
         if os.path.isfile(filename):
             with open(filename) as yamlfile:
                 try:
-                    return yaml.load(yamlfile)
+                    if target:
+                        return yaml_io.load_targets(filename, target)
+                    return yaml_io.load(yamlfile)
                 except yaml.parser.ParserError as e:
                     logging.error("Invalid YAML:{}".format(e))
                 except yaml.constructor.ConstructorError as e:
@@ -22,31 +22,38 @@ import logging
 import os
 import random
 import string
-import yaml
+import threading
 
 import os_charms_tools.control_data_common as control_data
+from os_charms_tools import yaml_io
 
 from copy import deepcopy
-from jinja2 import Environment, FileSystemLoader
 
 __author__ = 'Ryan Beisner <ryan.beisner@canonical.com>'
 
 
+# Jinja environments by absolute templates directory, see get_environment
+_environments = {}
+_environments_lock = threading.Lock()
+
+
 class CharmHasNoSource(Exception):
     pass
 
 
-def read_yaml(the_file):
+def read_yaml(the_file, target=None):
     '''Returns yaml data from provided file name
 
     :param the_file: yaml file name to read
+    :param target: of a deployer file, only load this target and the
+                   targets it inherits from
     :returns: dictionary of yaml data from file
     '''
     if not os.path.exists(the_file):
         raise ValueError('File not found: {}'.format(the_file))
-    with open(the_file) as yaml_file:
-        data = yaml.safe_load(yaml_file.read())
-    return data
+    if target:
+        return yaml_io.load_targets(the_file, target)
+    return yaml_io.load_file(the_file)
 
 
 def write_yaml(data, the_file):
@@ -55,8 +62,7 @@ def write_yaml(data, the_file):
     :param the_file: yaml file name to write
     :returns: dictionary of yaml data to write to file
     '''
-    with open(the_file, 'w') as yaml_file:
-        yaml_file.write(yaml.dump(data, default_flow_style=False))
+    yaml_io.dump_file(data, the_file)
 
 
 def recursive_dict_key_search(data, key):
@@ -75,6 +81,46 @@ def recursive_dict_key_search(data, key):
                 return ret
 
 
+def template_cache_dir():
+    '''Returns the directory compiled templates are cached in'''
+    cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                  os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'os-charms-tools', 'jinja2')
+
+
+def get_environment(templates_dir=None):
+    '''Returns the Jinja environment loading templates from templates_dir
+
+       One environment is kept per directory, so each template is read and
+       compiled once per process. Compiled templates are also cached on
+       disk, sparing later processes the compilation.
+
+       If omitted, `templates_dir` defaults to the current working dir.
+    '''
+    templates_dir = os.path.abspath(templates_dir or os.getcwd())
+    with _environments_lock:
+        environment = _environments.get(templates_dir)
+        if environment is None:
+            # jinja2 is slow to import and only needed for templates
+            from jinja2 import (
+                Environment,
+                FileSystemBytecodeCache,
+                FileSystemLoader,
+            )
+            bytecode_cache = None
+            try:
+                os.makedirs(template_cache_dir(), exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(
+                    template_cache_dir())
+            except OSError as e:
+                logging.debug('Not caching compiled templates: {}'.format(e))
+            environment = Environment(
+                loader=FileSystemLoader(templates_dir),
+                bytecode_cache=bytecode_cache)
+            _environments[templates_dir] = environment
+    return environment
+
+
 def render(source, target, context, templates_dir=None):
     '''Render a template.
 
@@ -87,16 +133,11 @@ def render(source, target, context, templates_dir=None):
 
        If omitted, `templates_dir` defaults to the current working dir.
     '''
-
-    if templates_dir is None:
-        templates_dir = os.getcwd()
-    loader = Environment(loader=FileSystemLoader(templates_dir))
     try:
-        source = source
-        template = loader.get_template(source)
+        template = get_environment(templates_dir).get_template(source)
     except Exception:
         logging.error('Could not load template {} from {}.'.format(
-            source, templates_dir))
+            source, templates_dir or os.getcwd()))
         raise
 
 #    safe_mkdir(templates_dir)
@@ -104,13 +145,45 @@ def render(source, target, context, templates_dir=None):
         _file.write(template.render(context))
 
 
+def render_many(jobs, templates_dir=None):
+    '''Render many templates.
+
+       Each template is loaded and compiled once, however many jobs use it.
+       The jobs are rendered one after another: rendering is CPU bound, so
+       threads only contend for the GIL and 2000 renders took no less time
+       with 8 threads than without.
+
+       :param jobs: list of (source, target, context) tuples, as the
+                    arguments of render()
+       :param templates_dir: directory the sources are relative to
+       :returns: list of the targets written, in the order of jobs
+    '''
+    templates = {}
+    targets = []
+    for source, target, context in jobs:
+        template = templates.get(source)
+        if template is None:
+            try:
+                template = get_environment(templates_dir).get_template(
+                    source)
+            except Exception:
+                logging.error('Could not load template {} from {}.'.format(
+                    source, templates_dir or os.getcwd()))
+                raise
+            templates[source] = template
+        with open(target, 'w') as _file:
+            _file.write(template.render(context))
+        targets.append(target)
+    return targets
+
+
 # above, ripped from uosci common
 # below, unique here, or improved from uosci common
 
 
 def yaml_dump(data):
     '''Return dict data as pretty-ish yaml output.'''
-    return yaml.dump(data, default_flow_style=False)
+    return yaml_io.dump(data)
 
 
 def rnd_str(length=32):
@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Upgrade a fleet of Juju models at the same time.
+
+Each model is upgraded by its own os-upgrade process, started with the
+model's own directory for its log, journal and events, so the models share
+nothing but the timing history. At most concurrency models are upgraded at
+once, and the progress of the whole fleet is read from the journals of the
+models and logged every report_interval seconds.
+
+Usage:
+
+fleet = FleetUpgrade(['prod:cloud1', 'prod:cloud2'], command,
+                     'os-upgrade-fleet', concurrency=2)
+failed = [model for model, code in fleet.run().items() if code != 0]
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import subprocess
+import threading
+import time
+from urllib.parse import quote
+
+from os_charms_tools.upgrade_journal import UpgradeJournal
+
+# Default number of models upgraded at the same time
+DEFAULT_CONCURRENCY = 4
+# Default seconds between fleet progress reports
+DEFAULT_REPORT_INTERVAL = 60
+
+# Names of the files kept in the directory of each model
+JOURNAL_FILE = 'os-upgrade.journal'
+LOG_FILE = 'os-upgrade.log'
+EVENTS_FILE = 'os-upgrade.events'
+OUTPUT_FILE = 'os-upgrade.out'
+
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def model_directory(base, model):
+    """Return the directory the files of model are kept in
+
+    controller:model names are percent-encoded so every model gets its own
+    directory directly under base, and no two names share one.
+    """
+    return os.path.join(base, quote(model, safe=''))
+
+
+class FleetUpgrade(object):
+    """Runs one upgrade process per model under a concurrency cap
+
+    :param: models: names of the models to upgrade, [controller:]model
+    :param: command: callable taking a model name and its directory and
+                     returning the command line which upgrades the model
+    :param: directory: directory under which each model gets its own
+    :param: concurrency: maximum number of models upgraded at once
+    :param: report_interval: seconds between progress reports
+    """
+
+    def __init__(self, models, command, directory,
+                 concurrency=DEFAULT_CONCURRENCY,
+                 report_interval=DEFAULT_REPORT_INTERVAL):
+        self.models = list(models)
+        if len(set(self.models)) != len(self.models):
+            raise ValueError('Models may only be upgraded once per fleet: '
+                             '{}'.format(', '.join(self.models)))
+        self.command = command
+        self.directory = directory
+        self.concurrency = max(1, concurrency)
+        self.report_interval = report_interval
+        self.states = dict((model, PENDING) for model in self.models)
+        self.returncodes = {}
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    def _set_state(self, model, state):
+        with self._lock:
+            self.states[model] = state
+
+    def upgrade_model(self, model):
+        """Run the upgrade process of one model and wait for it
+
+        :returns: the exit code of the process
+        """
+        directory = model_directory(self.directory, model)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        cmd = self.command(model, directory)
+        logging.info("Upgrading model {}: {}".format(model, ' '.join(cmd)))
+        self._set_state(model, RUNNING)
+        with open(os.path.join(directory, OUTPUT_FILE), 'w') as output:
+            returncode = subprocess.call(cmd, stdin=subprocess.DEVNULL,
+                                         stdout=output,
+                                         stderr=subprocess.STDOUT)
+        with self._lock:
+            self.returncodes[model] = returncode
+            self.states[model] = SUCCEEDED if returncode == 0 else FAILED
+        if returncode == 0:
+            logging.info("Model {} upgraded".format(model))
+        else:
+            logging.error("Upgrade of model {} failed with exit code {}, see "
+                          "{}".format(model, returncode, directory))
+        return returncode
+
+    def progress(self):
+        """Return the progress of every model
+
+        :returns: dictionary of model name to a dictionary with state, units
+                  and applications keys, the latter two counting what the
+                  journal of the model records as upgraded
+        """
+        with self._lock:
+            states = dict(self.states)
+        progress = {}
+        for model in self.models:
+            journal = UpgradeJournal(os.path.join(
+                model_directory(self.directory, model), JOURNAL_FILE))
+            journal.load()
+            progress[model] = {'state': states[model],
+                               'units': len(journal.completed_units()),
+                               'applications': len(journal.applications)}
+        return progress
+
+    def format_progress(self, progress=None):
+        """Return a one line summary of the progress of the fleet"""
+        progress = progress or self.progress()
+        counts = dict((state, 0)
+                      for state in (PENDING, RUNNING, SUCCEEDED, FAILED))
+        for model in progress.values():
+            counts[model['state']] += 1
+        return ('Fleet: {} of {} models done ({} failed), {} running, {} '
+                'pending; {} applications and {} units upgraded'
+                ''.format(counts[SUCCEEDED] + counts[FAILED],
+                          len(self.models), counts[FAILED], counts[RUNNING],
+                          counts[PENDING],
+                          sum(m['applications'] for m in progress.values()),
+                          sum(m['units'] for m in progress.values())))
+
+    def _report(self):
+        while not self._finished.wait(self.report_interval):
+            logging.info(self.format_progress())
+
+    def run(self):
+        """Upgrade every model, concurrency at a time
+
+        :returns: dictionary of model name to the exit code of its upgrade
+        """
+        self._finished.clear()
+        reporter = threading.Thread(target=self._report,
+                                    name='fleet-progress')
+        reporter.daemon = True
+        reporter.start()
+        start = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                list(executor.map(self.upgrade_model, self.models))
+        finally:
+            self._finished.set()
+            reporter.join()
+        logging.info("{} in {:.0f}s".format(self.format_progress(),
+                                            time.time() - start))
+        return dict(self.returncodes)
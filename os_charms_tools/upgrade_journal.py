@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Durable journal of upgrade progress.
+
+Every completed step is appended to the journal file as one JSON document
+per line and synced to disk before the upgrade moves on, so an interrupted
+run can be resumed from the first step which had not completed.
+
+Usage:
+
+journal = UpgradeJournal('os-upgrade.journal')
+journal.start('cloud:xenial-newton', resume=True)
+if not journal.has_step('keystone/0', UNIT_PAUSED):
+    ...
+    journal.record_unit('keystone/0', UNIT_PAUSED)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+# Unit steps, in the order they are performed
+UNIT_PAUSED = 'paused'
+UNIT_UPGRADED = 'upgraded'
+UNIT_RESUMED = 'resumed'
+UNIT_DONE = 'done'
+UNIT_STEPS = [UNIT_PAUSED, UNIT_UPGRADED, UNIT_RESUMED, UNIT_DONE]
+
+
+class JournalMismatch(Exception):
+    pass
+
+
+class UpgradeJournal(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.origin = None
+        self.units = {}
+        self.applications = set()
+        # Compute hosts evacuated and not yet put back in service
+        self.disabled_hosts = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the progress recorded in an existing journal"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A partially written final line from an interrupted run
+                    logging.warning("Ignoring corrupt journal entry: "
+                                    "{}".format(line.strip()))
+                    continue
+                if entry['event'] == 'start':
+                    self.origin = entry['origin']
+                elif entry['event'] == 'unit':
+                    self.units.setdefault(entry['unit'],
+                                          set()).add(entry['step'])
+                elif entry['event'] == 'application':
+                    self.applications.add(entry['application'])
+                elif entry['event'] == 'host':
+                    if entry['enabled']:
+                        self.disabled_hosts.discard(entry['host'])
+                    else:
+                        self.disabled_hosts.add(entry['host'])
+
+    def _append(self, entry):
+        entry['time'] = time.time()
+        with self._lock:
+            with open(self.path, 'a') as journal_file:
+                journal_file.write(json.dumps(entry, sort_keys=True) + '\n')
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    def _drop_torn_line(self):
+        """Truncate a partially written final line from an interrupted run
+
+        Otherwise the next entry would be appended to it, and ignored along
+        with it when the journal is next loaded.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as journal_file:
+            content = journal_file.read()
+            end = content.rfind(b'\n') + 1
+            if end != len(content):
+                journal_file.truncate(end)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    def start(self, origin, resume=False):
+        """Start or resume the journal for an upgrade to origin
+
+        When not resuming any previous journal is discarded.
+
+        :param: origin: the origin being upgraded to
+        :param: resume: keep the progress recorded by a previous run
+        :raises JournalMismatch: when resuming a journal recorded for a
+                                 different origin
+        """
+        if resume:
+            self.load()
+            if self.origin is not None and self.origin != origin:
+                raise JournalMismatch(
+                    "Journal {} records an upgrade to {}, not {}. Remove it "
+                    "or run without --resume.".format(self.path, self.origin,
+                                                      origin))
+            self._drop_torn_line()
+            if self.origin is not None:
+                logging.info("Resuming upgrade to {} from {}: {} units and {} "
+                             "applications already done"
+                             "".format(origin, self.path,
+                                       len(self.completed_units()),
+                                       len(self.applications)))
+                return
+        elif os.path.exists(self.path):
+            os.unlink(self.path)
+        self.origin = origin
+        self._append({'event': 'start', 'origin': origin})
+
+    def record_unit(self, unit, step):
+        """Record that step has completed for unit"""
+        if step not in UNIT_STEPS:
+            raise ValueError("Unknown unit step: {}".format(step))
+        with self._lock:
+            self.units.setdefault(unit, set()).add(step)
+        self._append({'event': 'unit', 'unit': unit, 'step': step})
+
+    def has_step(self, unit, step):
+        """Return True if step has already completed for unit"""
+        return step in self.units.get(unit, ())
+
+    def is_unit_done(self, unit):
+        return self.has_step(unit, UNIT_DONE)
+
+    def completed_units(self):
+        return sorted(unit for unit in self.units if self.is_unit_done(unit))
+
+    def record_application(self, application):
+        """Record that every unit of application has been upgraded"""
+        with self._lock:
+            self.applications.add(application)
+        self._append({'event': 'application', 'application': application})
+
+    def record_hosts(self, hosts, enabled):
+        """Record that compute hosts were disabled, or enabled again"""
+        for host in hosts:
+            with self._lock:
+                if enabled:
+                    self.disabled_hosts.discard(host)
+                else:
+                    self.disabled_hosts.add(host)
+            self._append({'event': 'host', 'host': host, 'enabled': enabled})
+
+    def is_application_done(self, application):
+        return application in self.applications
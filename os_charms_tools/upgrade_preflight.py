@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Check the cloud is fit to be upgraded before starting.
+
+All checks read one kiki StatusSnapshot of the model, walking the units of
+every target application and their subordinates once:
+
+ - every unit is active and its agent idle
+ - no unit or agent is in error
+ - every hacluster application has quorum
+ - the actions the upgrade will run are provided by the charms
+
+Usage:
+
+problems = preflight_problems(StatusSnapshot(), ['keystone', 'glance'],
+                              actions={'keystone': [...], ...})
+"""
+
+import logging
+
+from os_charms_tools.juju_backend import JujuBackendError
+from os_charms_tools.kiki.status import UnknownEntity
+
+ACTIVE = 'active'
+IDLE = 'idle'
+ERROR = 'error'
+
+HACLUSTER = 'hacluster'
+
+
+def _current(status):
+    return (status or {}).get('current')
+
+
+def unit_problems(name, unit, allow_paused=False):
+    """Return the problems with the status of one unit
+
+    :param: unit: status dictionary of the unit
+    :param: allow_paused: accept a unit an interrupted upgrade left paused
+    """
+    problems = []
+    workload = unit.get('workload-status') or {}
+    agent = unit.get('juju-status') or unit.get('agent-status') or {}
+    if ERROR in (_current(workload), _current(agent)):
+        problems.append('{} is in error: {}'.format(
+            name, workload.get('message') or agent.get('message') or ''))
+        return problems
+    paused = 'paused' in (workload.get('message') or '').lower()
+    if _current(workload) != ACTIVE and not (allow_paused and paused):
+        problems.append('{} is {}: {}'.format(name, _current(workload),
+                                              workload.get('message', '')))
+    if agent and _current(agent) != IDLE:
+        problems.append('{} agent is {}'.format(name, _current(agent)))
+    return problems
+
+
+def hacluster_problems(clusters):
+    """Return the hacluster applications which lack quorum
+
+    :param: clusters: dictionary of hacluster application name to a list of
+                      (unit name, unit status) tuples
+    """
+    problems = []
+    for application, units in sorted(clusters.items()):
+        active = [name for name, unit in units
+                  if _current(unit.get('workload-status')) == ACTIVE]
+        if len(active) * 2 <= len(units):
+            problems.append('{} has no quorum: {} of {} units active'
+                            ''.format(application, len(active), len(units)))
+    return problems
+
+
+def preflight_problems(snapshot, applications, actions=None,
+                       required_actions=(), hacluster_actions=(),
+                       allow_paused=()):
+    """Return every problem which should stop the upgrade from starting
+
+    :param: snapshot: kiki StatusSnapshot of the model
+    :param: applications: names of the applications to be upgraded
+    :param: actions: dictionary of application name to the actions it
+                     provides, applications without an entry are not checked
+    :param: required_actions: actions each application of actions must have
+    :param: hacluster_actions: actions each hacluster subordinate must have
+    :param: allow_paused: names of the units allowed to be paused
+    :returns: list of problem descriptions, empty if the upgrade may start
+    """
+    problems = []
+    clusters = {}
+    actions = actions or {}
+    for application in applications:
+        try:
+            units = snapshot.units(application)
+        except UnknownEntity:
+            continue
+        for name in units:
+            problems.extend(unit_problems(name, snapshot.unit(name),
+                                          name in allow_paused))
+            for sub_name in snapshot.subordinates(name):
+                sub = snapshot.unit(sub_name)
+                sub_application = snapshot.unit_application(sub_name)
+                if HACLUSTER in sub_application:
+                    clusters.setdefault(sub_application, []).append(
+                        (sub_name, sub))
+                problems.extend(unit_problems(sub_name, sub,
+                                              name in allow_paused))
+        if application in actions:
+            missing = [action for action in required_actions
+                       if action not in actions[application]]
+            if missing:
+                problems.append('{} does not provide the {} actions'.format(
+                    application, ', '.join(missing)))
+    problems.extend(hacluster_problems(clusters))
+    for application in sorted(clusters):
+        if application not in actions:
+            continue
+        missing = [action for action in hacluster_actions
+                   if action not in actions[application]]
+        if missing:
+            problems.append('{} does not provide the {} actions'.format(
+                application, ', '.join(missing)))
+    return problems
+
+
+def hacluster_applications(snapshot, applications):
+    """Return the hacluster applications subordinate to applications
+
+    :param: snapshot: kiki StatusSnapshot of the model
+    """
+    found = set(snapshot.application_names())
+    return sorted(set(
+        snapshot.unit_application(sub)
+        for application in applications if application in found
+        for unit in snapshot.units(application)
+        for sub in snapshot.subordinates(unit)
+        if HACLUSTER in snapshot.unit_application(sub)))
+
+
+def enumerate_actions(backend, applications, executor):
+    """Return the actions of every application, asking for all at once
+
+    :param: backend: JujuBackend to ask through
+    :param: executor: concurrent.futures executor to ask with
+    :returns: dictionary of application name to list of action names,
+              applications whose actions could not be listed are left out
+    """
+    def list_actions(application):
+        try:
+            return application, backend.enumerate_actions(application)
+        except JujuBackendError as e:
+            logging.warning("Unable to list the actions of {}: {}"
+                            "".format(application, e))
+            return application, None
+
+    return dict((application, listed) for application, listed in
+                executor.map(list_actions, applications)
+                if listed is not None)
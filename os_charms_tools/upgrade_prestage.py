@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pre-stage the packages of an OpenStack upgrade on units.
+
+Downloading the new packages onto every unit of an application before the
+rolling upgrade starts means a unit's paused window only covers installing
+them and restarting services.
+
+The Ubuntu Cloud Archive pocket for the new origin is added to apt in a
+temporary sources list, the package lists are refreshed and a download-only
+dist-upgrade fills the apt cache. The temporary sources list is removed
+again, leaving the charm to configure the origin itself when the
+openstack-upgrade action runs.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+from os_charms_tools.juju_backend import JujuBackendError
+
+UCA_URL = 'http://ubuntu-cloud.archive.canonical.com/ubuntu'
+PRESTAGE_SOURCES_LIST = '/etc/apt/sources.list.d/os-upgrade-prestage.list'
+
+PRESTAGE_SCRIPT = """set -e
+trap 'rm -f {sources_list}' EXIT
+dpkg -s ubuntu-cloud-keyring >/dev/null 2>&1 || \\
+    apt-get -qq install -y ubuntu-cloud-keyring
+echo 'deb {url} {pocket} main' > {sources_list}
+apt-get -qq update
+DEBIAN_FRONTEND=noninteractive apt-get -qq -y --download-only dist-upgrade
+"""
+
+# Default number of units to pre-stage at the same time
+DEFAULT_CONCURRENCY = 10
+# Default seconds each unit is given to download its packages
+DEFAULT_TIMEOUT = 1800
+
+
+class UnsupportedOrigin(Exception):
+    pass
+
+
+def cloud_archive_pocket(origin):
+    """Return the Ubuntu Cloud Archive pocket for an origin
+
+    cloud:xenial-newton becomes xenial-updates/newton and
+    cloud:xenial-newton/proposed becomes xenial-proposed/newton.
+
+    :param: origin: openstack-origin style cloud archive origin
+    :raises UnsupportedOrigin: if origin is not a cloud archive origin
+    """
+    if not origin or not origin.startswith('cloud:'):
+        raise UnsupportedOrigin("{} is not a cloud archive origin"
+                                "".format(origin))
+    pocket = origin[len('cloud:'):]
+    release, _, suffix = pocket.partition('/')
+    if release.endswith('-updates') or release.endswith('-proposed'):
+        # Already in pocket form, i.e. cloud:xenial-updates/newton
+        return pocket
+    if '-' not in release or suffix not in ('', 'updates', 'proposed'):
+        raise UnsupportedOrigin("Unable to determine the cloud archive "
+                                "pocket for {}".format(origin))
+    series, openstack_release = release.split('-', 1)
+    return '{}-{}/{}'.format(series, suffix or 'updates', openstack_release)
+
+
+def prestage_command(origin):
+    """Return the shell commands which pre-stage packages for origin"""
+    return PRESTAGE_SCRIPT.format(url=UCA_URL,
+                                  pocket=cloud_archive_pocket(origin),
+                                  sources_list=PRESTAGE_SOURCES_LIST)
+
+
+def prestage_units(backend, units, origin, concurrency=DEFAULT_CONCURRENCY,
+                   timeout=DEFAULT_TIMEOUT):
+    """Download the packages for origin on units, several at a time
+
+    A unit failing to pre-stage is not fatal, its packages are simply
+    downloaded during the upgrade instead.
+
+    :param: backend: JujuBackend to run the commands through
+    :param: units: names of the units to pre-stage
+    :param: concurrency: maximum number of units downloading at once
+    :param: timeout: seconds each unit is given
+    :returns: dictionary of unit name to a dictionary with ok, start, end and
+              error keys
+    """
+    command = prestage_command(origin)
+
+    def prestage(unit):
+        start = time.time()
+        error = None
+        try:
+            result = backend.run_on_unit(unit, command, timeout=timeout)
+            if result['Code'] != 0:
+                error = (result.get('Stderr') or
+                         result.get('Stdout') or '').strip()
+        except JujuBackendError as e:
+            error = str(e)
+        if error is not None:
+            logging.warning("Failed to pre-stage packages on {}: "
+                            "{}".format(unit, error))
+        return unit, {'ok': error is None, 'start': start,
+                      'end': time.time(), 'error': error}
+
+    if not units:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return dict(executor.map(prestage, units))
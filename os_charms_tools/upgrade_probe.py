@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Find the units of an application which are already on an origin.
+
+A single command run on every unit of the application at once reports the
+Ubuntu Cloud Archive pocket the charm configured on the unit and how many
+cloud archive packages are still waiting to be upgraded. A unit is already
+upgraded when the pocket matches the origin and nothing is pending.
+"""
+
+import logging
+
+from os_charms_tools.juju_backend import JujuBackendError
+from os_charms_tools.upgrade_prestage import (
+    UnsupportedOrigin,
+    cloud_archive_pocket,
+)
+
+# Sources list the charms write the cloud archive pocket to
+CLOUD_ARCHIVE_SOURCES_LIST = '/etc/apt/sources.list.d/cloud-archive.list'
+
+# Cloud archive package versions carry a ~cloud suffix
+PROBE_SCRIPT = """\
+echo "pocket=$(sed -n 's|^deb [^ ]* \\([^ ]*\\) .*|\\1|p' \\
+    {sources_list} 2>/dev/null | head -n1)"
+echo "pending=$(apt-get -s -o Debug::NoLocking=1 dist-upgrade 2>/dev/null \\
+    | grep -c '^Inst .*~cloud')"
+"""
+
+
+def probe_command():
+    """Return the shell commands which report a unit's pocket"""
+    return PROBE_SCRIPT.format(sources_list=CLOUD_ARCHIVE_SOURCES_LIST)
+
+
+def parse_probe_output(stdout):
+    """Return a dictionary of the key=value lines of the probe output"""
+    values = {}
+    for line in (stdout or '').splitlines():
+        key, sep, value = line.partition('=')
+        if sep:
+            values[key.strip()] = value.strip()
+    return values
+
+
+def probe_units(backend, application):
+    """Return the pocket and pending upgrade count of every unit
+
+    :param: backend: JujuBackend to run the probe through
+    :param: application: name of the application to probe
+    :returns: dictionary of unit name to a dictionary with pocket and pending
+              keys, units which failed to report are left out
+    """
+    try:
+        results = backend.run_on_application(application, probe_command())
+    except JujuBackendError as e:
+        logging.warning("Unable to probe units of {}: {}".format(application,
+                                                                 e))
+        return {}
+
+    probed = {}
+    for result in results or []:
+        code = result.get('Code', result.get('ReturnCode', 0))
+        values = parse_probe_output(result.get('Stdout'))
+        if str(code) != '0' or 'pocket' not in values:
+            logging.debug("Probe of {} failed: {}".format(
+                result.get('UnitId'), result.get('Stderr', result)))
+            continue
+        try:
+            pending = int(values.get('pending', 0))
+        except ValueError:
+            continue
+        probed[result['UnitId']] = {'pocket': values['pocket'],
+                                    'pending': pending}
+    return probed
+
+
+def upgraded_units(backend, application, origin):
+    """Return the names of the units of application already on origin
+
+    :param: backend: JujuBackend to run the probe through
+    :param: application: name of the application to probe
+    :param: origin: the origin being upgraded to
+    :returns: set of unit names, empty when origin is not a cloud archive
+              origin and so can not be checked for
+    """
+    try:
+        pocket = cloud_archive_pocket(origin)
+    except UnsupportedOrigin as e:
+        logging.debug("Not probing for upgraded units: {}".format(e))
+        return set()
+    return set(unit for unit, probed in
+               probe_units(backend, application).items()
+               if probed['pocket'] == pocket and probed['pending'] == 0)
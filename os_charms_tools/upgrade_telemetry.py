@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Structured per-unit, per-phase upgrade timing events.
+
+Events are appended to a file as one JSON document per line and, optionally,
+summarised in a Prometheus node-exporter textfile collector file.
+
+Usage:
+
+telemetry = UpgradeTelemetry('os-upgrade.events',
+                             '/var/lib/node-exporter/os_upgrade.prom')
+with telemetry.phase('keystone', 'keystone/0', 'pause', host='10.5.0.12'):
+    ...
+telemetry.flush()
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import tempfile
+import threading
+import time
+
+PROMETHEUS_PREFIX = 'os_upgrade'
+# Minimum seconds between two rewrites of the Prometheus textfile
+PROMETHEUS_INTERVAL = 10
+
+
+def _escape_label(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _labels(**labels):
+    return ','.join('{}="{}"'.format(key, _escape_label(value))
+                    for key, value in sorted(labels.items()))
+
+
+class UpgradeTelemetry(object):
+    """Collects phase timing events
+
+    :param: events_file: file to append JSON events to, None to disable
+    :param: prometheus_file: textfile collector file to rewrite at most
+                             every prometheus_interval seconds, and on
+                             flush(), None to disable
+    :param: history: optional TimingHistory successful phases are recorded in
+    :param: labels: dictionary of labels added to every Prometheus sample,
+                    i.e. the model when several models are upgraded at once
+    """
+
+    def __init__(self, events_file=None, prometheus_file=None, history=None,
+                 labels=None, prometheus_interval=PROMETHEUS_INTERVAL):
+        self.events_file = events_file
+        self.prometheus_file = prometheus_file
+        self.prometheus_interval = prometheus_interval
+        self.history = history
+        self.labels = labels or {}
+        self.events = []
+        # Prometheus samples, updated as events are recorded
+        self._last = {}
+        self._totals = {}
+        self._counts = {}
+        self._last_end = 0
+        self._written = None
+        self._unwritten = False
+        self._lock = threading.Lock()
+
+    def record(self, application, unit, phase, start, end, status='ok',
+               host=None, charm=None, history_phase=None):
+        """Record one finished phase
+
+        :param: unit: unit name, None for application wide phases
+        :param: status: 'ok' or 'failed'
+        :param: charm: charm the phase duration is recorded against in the
+                       timing history
+        :param: history_phase: phase name to use in the timing history,
+                               defaults to phase
+        """
+        event = {
+            'application': application,
+            'unit': unit,
+            'host': host,
+            'phase': phase,
+            'status': status,
+            'start': round(start, 3),
+            'end': round(end, 3),
+            'duration': round(end - start, 3),
+        }
+        with self._lock:
+            self.events.append(event)
+            self._add_samples(event)
+            self._unwritten = True
+            if self.events_file:
+                with open(self.events_file, 'a') as events_file:
+                    events_file.write(json.dumps(event, sort_keys=True) +
+                                      '\n')
+            if self.prometheus_file and (
+                    self._written is None or
+                    time.time() - self._written >= self.prometheus_interval):
+                self.write_prometheus()
+        if self.history is not None and charm and status == 'ok':
+            self.history.record(charm, history_phase or phase,
+                                event['duration'])
+        return event
+
+    def flush(self):
+        """Write the Prometheus textfile if events were recorded since"""
+        with self._lock:
+            if self.prometheus_file and self._unwritten:
+                self.write_prometheus()
+
+    @contextmanager
+    def phase(self, application, unit, phase, start=None, **kwargs):
+        """Time the enclosed block as phase of unit
+
+        Keyword arguments are passed on to record(). A block which raises is
+        recorded with a 'failed' status.
+
+        :param: start: time the phase started, defaults to when the block is
+                       entered
+        """
+        start = start or time.time()
+        status = 'failed'
+        try:
+            yield
+            status = 'ok'
+        finally:
+            self.record(application, unit, phase, start, time.time(),
+                        status=status, **kwargs)
+
+    def _add_samples(self, event):
+        if event['unit']:
+            self._last[_labels(application=event['application'],
+                               unit=event['unit'], host=event['host'] or '',
+                               phase=event['phase'],
+                               **self.labels)] = event['duration']
+        key = _labels(application=event['application'],
+                      phase=event['phase'], **self.labels)
+        self._totals[key] = self._totals.get(key, 0) + event['duration']
+        key = _labels(application=event['application'],
+                      phase=event['phase'], status=event['status'],
+                      **self.labels)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self._last_end = max(self._last_end, event['end'])
+
+    def prometheus_metrics(self):
+        """Return the collected events in Prometheus text exposition format"""
+        lines = []
+        for name, kind, doc, samples in [
+                ('phase_duration_seconds', 'gauge',
+                 'Duration of the last run of a phase on a unit',
+                 self._last),
+                ('phase_seconds_total', 'counter',
+                 'Total time spent in a phase per application',
+                 self._totals),
+                ('phases_total', 'counter',
+                 'Number of phases run per application and status',
+                 self._counts)]:
+            metric = '{}_{}'.format(PROMETHEUS_PREFIX, name)
+            lines.append('# HELP {} {}'.format(metric, doc))
+            lines.append('# TYPE {} {}'.format(metric, kind))
+            for labels, value in sorted(samples.items()):
+                lines.append('{}{{{}}} {}'.format(metric, labels, value))
+        metric = '{}_last_event_timestamp_seconds'.format(PROMETHEUS_PREFIX)
+        lines.append('# HELP {} Time the last phase finished'.format(metric))
+        lines.append('# TYPE {} gauge'.format(metric))
+        lines.append('{}{} {}'.format(
+            metric, '{{{}}}'.format(_labels(**self.labels))
+            if self.labels else '',
+            self._last_end))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self):
+        # The textfile collector may read at any time, so write then rename.
+        directory = os.path.dirname(os.path.abspath(self.prometheus_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp_file:
+            tmp_file.write(self.prometheus_metrics())
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, self.prometheus_file)
+        self._written = time.time()
+        self._unwritten = False
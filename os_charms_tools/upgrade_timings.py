@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Historical upgrade phase timings and upgrade plan estimates.
+
+Each upgrade run records how long every phase took for each charm. Those
+timings are then used to estimate how long a future upgrade will take.
+
+Usage:
+
+history = TimingHistory(DEFAULT_TIMINGS_FILE)
+history.record('keystone', PHASE_UPGRADE, 190.2)
+plan = UpgradePlan(history, pause=True)
+plan.add_application('keystone', 'keystone', ROLLING, units, hacluster=True)
+print(plan.format())
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+PHASE_PAUSE = 'pause'
+PHASE_UPGRADE = 'openstack-upgrade'
+PHASE_RESUME = 'resume'
+PHASE_BIGBANG = 'big-bang'
+PHASE_PRESTAGE = 'prestage'
+PHASE_EVACUATE = 'evacuate'
+# Plan labels for the pause and resume of a hacluster subordinate, whose
+# timings are recorded as the pause and resume phases of the hacluster charm
+PHASE_HACLUSTER_PAUSE = 'hacluster-pause'
+PHASE_HACLUSTER_RESUME = 'hacluster-resume'
+# Phases whose actions run at the same time
+BATCHED_PHASES = [
+    (PHASE_HACLUSTER_PAUSE, PHASE_PAUSE),
+    (PHASE_RESUME, PHASE_HACLUSTER_RESUME),
+]
+
+# Used when neither the charm nor any other charm has a recorded timing
+DEFAULT_PHASE_SECONDS = {
+    PHASE_PAUSE: 60,
+    PHASE_UPGRADE: 300,
+    PHASE_RESUME: 60,
+    PHASE_BIGBANG: 600,
+    PHASE_PRESTAGE: 300,
+    PHASE_EVACUATE: 900,
+}
+
+# Number of timings kept for each charm and phase
+HISTORY_LENGTH = 20
+
+DEFAULT_TIMINGS_FILE = os.path.join(os.path.expanduser('~'), '.cache',
+                                    'os-upgrade', 'timings.json')
+
+ROLLING = 'rolling'
+BIGBANG = 'big-bang'
+
+
+def charm_name(charm_url):
+    """Return the bare charm name from a charm url
+
+    cs:~openstack-charmers/xenial/keystone-262 becomes keystone.
+    """
+    name = charm_url.split('/')[-1].split(':')[-1]
+    return re.sub(r'-\d+$', '', name)
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def format_duration(seconds):
+    """Return seconds as a short human readable duration, i.e. 1h02m"""
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return '{}h{:02d}m'.format(hours, minutes)
+    if minutes:
+        return '{}m{:02d}s'.format(minutes, seconds)
+    return '{}s'.format(seconds)
+
+
+class TimingHistory(object):
+    """Per charm, per phase durations recorded by previous upgrades
+
+    Several processes may share one history file, i.e. the upgrades of a
+    fleet. Each save merges the durations recorded since the last save into
+    the file as it is on disk, under an exclusive lock, so no process loses
+    the timings of another.
+    """
+
+    def __init__(self, path=DEFAULT_TIMINGS_FILE):
+        self.path = path
+        self.timings = self._read()
+        self._unsaved = []
+        self._lock = threading.RLock()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as timings_file:
+                return json.load(timings_file)
+        except ValueError as e:
+            logging.warning("Ignoring unreadable timing history "
+                            "{}: {}".format(self.path, e))
+            return {}
+
+    def _append(self, timings, charm, phase, seconds):
+        durations = timings.setdefault(charm, {}).setdefault(phase, [])
+        durations.append(seconds)
+        del durations[:-HISTORY_LENGTH]
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self._lock, open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            timings = self._read()
+            for charm, phase, seconds in self._unsaved:
+                self._append(timings, charm, phase, seconds)
+            # Write then rename so an interrupted save never loses the
+            # history
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(timings, tmp_file, indent=2, sort_keys=True)
+            os.rename(tmp_path, self.path)
+            self.timings = timings
+            self._unsaved = []
+
+    def record(self, charm, phase, seconds, save=True):
+        """Record that phase took seconds for charm"""
+        with self._lock:
+            seconds = round(seconds, 3)
+            self._append(self.timings, charm, phase, seconds)
+            self._unsaved.append((charm, phase, seconds))
+            if save:
+                self.save()
+
+    def estimate(self, charm, phase):
+        """Return the estimated duration of phase for charm in seconds
+
+        The median of the charm's own history is preferred, falling back to
+        the median of every charm's history for the phase and finally to
+        DEFAULT_PHASE_SECONDS.
+        """
+        durations = self.timings.get(charm, {}).get(phase)
+        if durations:
+            return median(durations)
+        durations = [d for phases in self.timings.values()
+                     for d in phases.get(phase, [])]
+        if durations:
+            return median(durations)
+        return DEFAULT_PHASE_SECONDS[phase]
+
+
+def wave_seconds(phases):
+    """Return how long a wave running phases takes
+
+    The hacluster and principal pause actions of a wave are run as one
+    batch, as are the resume actions, so each pair takes as long as the
+    slower of the two.
+    """
+    seconds = dict(phases)
+    total = sum(seconds.values())
+    for batch in BATCHED_PHASES:
+        batched = [seconds[phase] for phase in batch if phase in seconds]
+        total -= sum(batched) - max(batched + [0])
+    return total
+
+
+class UpgradePlan(object):
+    """Ordered upgrade plan with duration estimates
+
+    Applications are upgraded one after another. The units of a rolling
+    upgrade are processed in waves of wave_size units which run at the same
+    time, so a wave takes as long as its slowest unit. All units of a
+    big-bang upgrade run at once.
+
+    When prestage_concurrency is set the packages of a rolling upgrade are
+    first downloaded on prestage_concurrency units at a time.
+    """
+
+    def __init__(self, history, pause=False, wave_size=1,
+                 prestage_concurrency=0):
+        self.history = history
+        self.pause = pause
+        self.wave_size = max(1, wave_size)
+        self.prestage_concurrency = prestage_concurrency
+        self.applications = []
+
+    def unit_phases(self, charm, hacluster=False, actions=None,
+                    evacuate=False):
+        """Return [(phase, seconds)] for upgrading one unit of charm"""
+        actions = actions or [PHASE_PAUSE, PHASE_UPGRADE, PHASE_RESUME]
+        phases = []
+        if evacuate:
+            phases.append((PHASE_EVACUATE,
+                           self.history.estimate(charm, PHASE_EVACUATE)))
+        if self.pause and hacluster:
+            phases.append((PHASE_HACLUSTER_PAUSE,
+                           self.history.estimate('hacluster', PHASE_PAUSE)))
+        for phase in [PHASE_PAUSE, PHASE_UPGRADE, PHASE_RESUME]:
+            if phase not in actions:
+                continue
+            if phase != PHASE_UPGRADE and not self.pause:
+                continue
+            phases.append((phase, self.history.estimate(charm, phase)))
+        if self.pause and hacluster:
+            phases.append((PHASE_HACLUSTER_RESUME,
+                           self.history.estimate('hacluster', PHASE_RESUME)))
+        return phases
+
+    def add_application(self, application, charm, mode, units,
+                        hacluster=False, actions=None, evacuate=False):
+        """Add the next application to be upgraded to the plan
+
+        :param: mode: ROLLING or BIGBANG
+        :param: units: unit names in the order they will be upgraded
+        :param: hacluster: True if the units have a hacluster subordinate
+        :param: actions: actions provided by the charm
+        :param: evacuate: True if the hosts of the units are evacuated
+        """
+        if mode == ROLLING:
+            phases = self.unit_phases(charm, hacluster, actions, evacuate)
+            per_unit = wave_seconds(phases)
+            waves = [units[i:i + self.wave_size]
+                     for i in range(0, len(units), self.wave_size)]
+            duration = per_unit * len(waves)
+            prestage = 0
+            if self.prestage_concurrency and units:
+                batches = -(-len(units) // self.prestage_concurrency)
+                prestage = batches * self.history.estimate(charm,
+                                                           PHASE_PRESTAGE)
+                duration += prestage
+        else:
+            phases = [(PHASE_BIGBANG,
+                       self.history.estimate(charm, PHASE_BIGBANG))]
+            waves = [units]
+            duration = phases[0][1]
+            prestage = 0
+        self.applications.append({
+            'application': application,
+            'charm': charm,
+            'mode': mode,
+            'units': units,
+            'phases': phases,
+            'waves': waves,
+            'prestage': prestage,
+            'duration': duration,
+        })
+
+    def total(self):
+        return sum(app['duration'] for app in self.applications)
+
+    def critical_path(self):
+        """Return [(step, seconds)] for the chain of steps bounding the run
+
+        Every application is upgraded in turn, and within an application each
+        wave must finish before the next starts, so the critical path runs
+        through the slowest unit of every wave.
+        """
+        path = []
+        for app in self.applications:
+            if app['prestage']:
+                path.append(('{} {}'.format(app['application'],
+                                            PHASE_PRESTAGE),
+                             app['prestage']))
+            step_seconds = wave_seconds(app['phases'])
+            if app['mode'] == BIGBANG:
+                path.append((app['application'], step_seconds))
+                continue
+            for wave in app['waves']:
+                # Units of a charm share an estimate, the first is as slow
+                # as any other.
+                path.append((wave[0], step_seconds))
+        return path
+
+    def format(self):
+        """Return the plan as human readable text"""
+        lines = []
+        width = max([len(app['application'])
+                     for app in self.applications] + [11])
+        for i, app in enumerate(self.applications, 1):
+            lines.append('{:3d}. {:<{width}}  {:<8}  {:4d} units  '
+                         '~{:>7}'.format(i, app['application'], app['mode'],
+                                         len(app['units']),
+                                         format_duration(app['duration']),
+                                         width=width))
+            per = ' per wave' if app['mode'] == ROLLING else ''
+            lines.append('      {}{}'.format(
+                ', '.join('{} {}'.format(phase, format_duration(seconds))
+                          for phase, seconds in app['phases']), per))
+            if app['prestage']:
+                lines.append('      {} {} for all units'.format(
+                    PHASE_PRESTAGE, format_duration(app['prestage'])))
+            if app['mode'] == ROLLING and app['units']:
+                lines.append('      order: {}'.format(
+                    ' | '.join(', '.join(wave) for wave in app['waves'])))
+        path = self.critical_path()
+        lines.append('')
+        lines.append('Critical path (wave size {}, {} steps):'.format(
+            self.wave_size, len(path)))
+        lines.append('  ' + ' -> '.join(step for step, _ in path))
+        lines.append('Estimated total: {}'.format(
+            format_duration(self.total())))
+        return '\n'.join(lines)
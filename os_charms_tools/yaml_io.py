@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+YAML loading and dumping for the whole package.
+
+The libyaml based CSafeLoader and CSafeDumper parse and emit several times
+faster than the pure Python ones, which matters for bundles and status
+output running to megabytes. PyYAML built without libyaml falls back to
+SafeLoader and SafeDumper. Either way only plain YAML types are loaded or
+dumped, never arbitrary Python objects.
+
+load_targets() loads only the targets of a deployer style file which one
+target needs, see its docstring.
+'''
+
+import yaml
+from yaml.events import (
+    AliasEvent,
+    CollectionEndEvent,
+    CollectionStartEvent,
+    MappingEndEvent,
+    MappingStartEvent,
+    ScalarEvent,
+    StreamEndEvent,
+)
+from yaml.nodes import ScalarNode
+from yaml.resolver import Resolver
+
+try:
+    from yaml import CSafeLoader as _SafeLoader
+    from yaml import CSafeDumper as _SafeDumper
+    WITH_LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+    from yaml import SafeDumper as _SafeDumper
+    WITH_LIBYAML = False
+
+Loader = _SafeLoader
+
+
+class Dumper(_SafeDumper):
+    pass
+
+
+# Tuples are written as lists rather than refused
+Dumper.add_representer(tuple, Dumper.represent_list)
+
+# Load the whole file rather than the targets selected by load_targets when
+# they hold more than this share of its events, as the file is then parsed
+# about twice over
+SELECTIVE_LOAD_RATIO = 0.5
+
+STR_TAG = 'tag:yaml.org,2002:str'
+
+# Line breaks of YAML 1.1 which Python does not split lines of a file on
+UNICODE_LINE_BREAKS = ('\x85', '\u2028', '\u2029')
+
+
+def load(stream):
+    '''Return the data of a YAML document
+
+    :param stream: string, bytes or open file holding the document
+    '''
+    return yaml.load(stream, Loader=Loader)
+
+
+def dump(data, stream=None, **kwargs):
+    '''Return data as a YAML document, or write it to stream
+
+    Collections are written in block style unless default_flow_style says
+    otherwise.
+    '''
+    kwargs.setdefault('default_flow_style', False)
+    return yaml.dump(data, stream, Dumper=Dumper, **kwargs)
+
+
+def load_file(path):
+    '''Return the data of the YAML file at path'''
+    with open(path) as yaml_file:
+        return load(yaml_file)
+
+
+def dump_file(data, path):
+    '''Write data to the YAML file at path'''
+    with open(path, 'w') as yaml_file:
+        dump(data, yaml_file)
+
+
+class _Unselectable(Exception):
+    pass
+
+
+_resolver = Resolver()
+
+
+def _string(event):
+    '''Return the value of a scalar event which loads as a string'''
+    if not isinstance(event, ScalarEvent):
+        raise _Unselectable()
+    tag = event.tag
+    if tag is None or tag == '!':
+        tag = _resolver.resolve(ScalarNode, event.value, event.implicit)
+    if tag != STR_TAG:
+        raise _Unselectable()
+    return event.value
+
+
+def _skip_node(events, first):
+    '''Consume the events of the node starting with first
+
+    :returns: the number of events of the node
+    :raises _Unselectable: on an alias, which may refer to any node
+    '''
+    if isinstance(first, AliasEvent):
+        raise _Unselectable()
+    count = 1
+    depth = 1 if isinstance(first, CollectionStartEvent) else 0
+    while depth:
+        event = next(events)
+        count += 1
+        if isinstance(event, AliasEvent):
+            raise _Unselectable()
+        if isinstance(event, CollectionStartEvent):
+            depth += 1
+        elif isinstance(event, CollectionEndEvent):
+            depth -= 1
+    return count
+
+
+def _scan_targets(path):
+    '''Parse a deployer file for the layout of its targets
+
+    Every target must be a key at the start of a line of a block mapping,
+    so that the lines from one target to the next hold exactly that target.
+
+    :returns: tuple of the line each target starts on, the target each
+              target inherits from, the number of events of each target and
+              of the file
+    :raises _Unselectable: if the file is not laid out so
+    '''
+    lines = {}
+    inherits = {}
+    sizes = {}
+    total = 0
+    with open(path) as stream:
+        events = yaml.parse(stream, Loader=Loader)
+        next(events)  # StreamStart
+        document = next(events)
+        mapping = next(events)
+        if (document.version or document.tags or
+                not isinstance(mapping, MappingStartEvent) or
+                mapping.flow_style or mapping.anchor):
+            # Directives and aliases would not carry over to a lone target
+            raise _Unselectable()
+        while True:
+            key = next(events)
+            if isinstance(key, MappingEndEvent):
+                break
+            name = _string(key)
+            if key.anchor or key.start_mark.column:
+                raise _Unselectable()
+            lines[name] = key.start_mark.line
+            first = next(events)
+            size = 2
+            if isinstance(first, MappingStartEvent):
+                if first.anchor:
+                    raise _Unselectable()
+                while True:
+                    event = next(events)
+                    if isinstance(event, MappingEndEvent):
+                        size += 1
+                        break
+                    size += _skip_node(events, event)
+                    value = next(events)
+                    if (isinstance(event, ScalarEvent) and
+                            event.value == 'inherits'):
+                        inherits[name] = _string(value)
+                        size += 1
+                    else:
+                        size += _skip_node(events, value)
+            else:
+                size += _skip_node(events, first)
+            sizes[name] = size
+            total += size
+        next(events)  # DocumentEnd
+        if not isinstance(next(events), StreamEndEvent):
+            # More than one document
+            raise _Unselectable()
+    return lines, inherits, sizes, total
+
+
+def _target_lines(path, starts, wanted):
+    '''Return the lines of the file holding the wanted targets
+
+    :param starts: list of the line each target of the file starts on
+    :param wanted: lines the wanted targets start on
+    :raises _Unselectable: on line breaks libyaml counts but Python does not
+    '''
+    ends = dict(zip(starts, starts[1:]))
+    selected = []
+    end = -1
+    with open(path) as stream:
+        for number, line in enumerate(stream):
+            if any(char in line for char in UNICODE_LINE_BREAKS):
+                raise _Unselectable()
+            if number in wanted:
+                end = ends.get(number)
+            elif number == end:
+                end = -1
+            if end != -1:
+                selected.append(line)
+    return ''.join(selected)
+
+
+def load_targets(path, target):
+    '''Return the targets of a deployer style file needed to render target
+
+    Only target and the targets it inherits from, directly or not, are
+    loaded: the file is parsed once, without building anything, to find
+    where each target starts and what it inherits from, then only the lines
+    of the targets needed are loaded. The whole file is loaded instead when
+    the targets needed make up most of it, when it uses anchors or
+    directives, or when it is not a single block mapping of targets holding
+    target.
+
+    :param path: the YAML file
+    :param target: name of the target to render
+    :returns: dictionary of target name to target
+    '''
+    try:
+        lines, inherits, sizes, total = _scan_targets(path)
+        if target not in sizes or 'services' in sizes:
+            # Not a deployer file of targets, or not holding target
+            raise _Unselectable()
+        lineage = [target]
+        while lineage[-1] in inherits and inherits[lineage[-1]] in sizes:
+            if inherits[lineage[-1]] in lineage:
+                break
+            lineage.append(inherits[lineage[-1]])
+        if sum(sizes[name] for name in lineage) > total * SELECTIVE_LOAD_RATIO:
+            raise _Unselectable()
+        selected = _target_lines(path, sorted(lines.values()),
+                                 set(lines[name] for name in lineage))
+    except _Unselectable:
+        return load_file(path)
+    return load(selected)
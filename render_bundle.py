@@ -24,7 +24,7 @@
 import argparse
 import logging
 
-from os_charms_tools.rendered_bundle import RenderedBundle
+from os_charms_tools import profiling
 
 __author__ = 'David Ames <david.ames@canonical.com>'
 
@@ -69,6 +69,12 @@ def get_args():
             '-l', '--log_level', default="WARN",
             choices=['DEBUG', 'INFO', 'WARN',  'ERROR'],
             help="Set logging level")
+    parser.add_argument(
+            '--profile', nargs='?', const='render_bundle.profile',
+            metavar='PREFIX',
+            help="Profile the render, writing PREFIX.pstats, PREFIX.txt, "
+                 "PREFIX.collapsed and PREFIX.phases. "
+                 "Default PREFIX: render_bundle.profile")
     return parser.parse_args()
 
 
@@ -79,37 +85,54 @@ def set_log_level(log_level):
 def main():
     args = get_args()
     set_log_level(args.log_level)
+    if args.profile:
+        profiling.start(args.profile)
+    try:
+        render(args)
+    finally:
+        profiling.stop()
+
+
+def render(args):
+    # Imported once the arguments are parsed, so --help and argument errors
+    # do not wait on yaml and the bundle machinery
+    from os_charms_tools.rendered_bundle import RenderedBundle
 
     # Initialize the bundle
     bundle = RenderedBundle(args.series, args.release,
                             args.source, args.target)
 
-    if args.generate:
-        # Generate base bundle from scratch
-        bundle.generate_bundle()
-    else:
-        # Render bundle from existing bundle yaml
-        bundle.get_bundle_from_yaml(args.source_bundle)
+    with profiling.phase('load'):
+        if args.generate:
+            # Generate base bundle from scratch
+            bundle.generate_bundle()
+        else:
+            # Render bundle from existing bundle yaml
+            bundle.get_bundle_from_yaml(args.source_bundle)
 
     # Based on target urls and origin may be different
     # than self initilized urls and origin.
-    bundle.update_urls()
-    bundle.update_origin()
+    with profiling.phase('update'):
+        bundle.update_urls()
+        bundle.update_origin()
 
     # Setup High Availability
     if args.high_availability:
         # TODO: Will need to pass yaml with VIP info
-        bundle.add_ha()
+        with profiling.phase('add_ha'):
+            bundle.add_ha()
 
     # Merge override yaml files
     # Note: This merge happens last so these are truly overrides
     # New charms and relations can be added
     # Options, urls, origin etc can all be overriden
     if args.overrides:
-        bundle.merge_overrides(args.overrides)
+        with profiling.phase('merge_overrides'):
+            bundle.merge_overrides(args.overrides)
 
     # Write out the bundle
-    bundle.write_bundle(args.destination)
+    with profiling.phase('write'):
+        bundle.write_bundle(args.destination)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from os_charms_tools.juju_backend import FakeBackend  # noqa: E402
+from os_charms_tools.upgrade_journal import UpgradeJournal  # noqa: E402
+from os_charms_tools.upgrade_telemetry import UpgradeTelemetry  # noqa: E402
+
+ORIGIN = 'cloud:xenial-newton'
+UPGRADE_ACTIONS = ['pause', 'resume', 'openstack-upgrade']
+
+
+def load_script(name, path):
+    '''Import a script whose file name is not a module name.'''
+    loader = importlib.machinery.SourceFileLoader(name, path)
+    spec = importlib.util.spec_from_loader(name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+def upgrade_args(**kwargs):
+    '''Return the parsed arguments of os-upgrade.py, as main() sets them.'''
+    defaults = {
+        'origin': ORIGIN,
+        'pause': True,
+        'evacuate': False,
+        'compute_client': None,
+        'migration_concurrency': 4,
+        'evacuate_timeout': 60,
+        'wave_size': 1,
+        'prestage': False,
+        'prestage_concurrency': 4,
+        'prestage_timeout': 60,
+        'probe': False,
+        'resume': False,
+        'app': [],
+    }
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+@pytest.fixture
+def backend():
+    '''A fake model of a keystone cluster and a nova-compute cloud.'''
+    fake = FakeBackend(command_handler=hostname_handler)
+    fake.add_application('keystone', num_units=3, leader=1,
+                         actions=UPGRADE_ACTIONS,
+                         subordinates=['keystone-hacluster'])
+    fake.add_application('nova-compute', num_units=4,
+                         actions=UPGRADE_ACTIONS)
+    return fake
+
+
+def hostname_handler(backend, unit, command):
+    if command == 'hostname':
+        return 'compute-{}'.format(unit.split('/')[1])
+    return ''
+
+
+@pytest.fixture
+def upgrader(tmp_path, backend):
+    '''os-upgrade.py, set up as main() would against the fake backend.
+
+    Tests change upgrader.args, upgrader.compute and upgrader.journal as
+    needed.
+    '''
+    module = load_script('os_upgrade', os.path.join(ROOT, 'os-upgrade.py'))
+    module.args = upgrade_args()
+    module.compute = None
+    module.journal = UpgradeJournal(str(tmp_path / 'os-upgrade.journal'))
+    module.journal.start(ORIGIN)
+    module.telemetry = UpgradeTelemetry()
+    module.Juju.backend = backend
+    yield module
+    # Every load of the script adds its handler to the same logger
+    module.log.removeHandler(module.handler)
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from os_charms_tools.juju_backend import FakeBackend, JujuBackendError
+from os_charms_tools.juju_ratelimit import (
+    AdaptiveLimiter,
+    RATE_INCREASE,
+    RateLimitedBackend,
+)
+
+
+def fail(limiter, error):
+    with pytest.raises(type(error)):
+        with limiter.call():
+            raise error
+
+
+def test_controller_errors_back_off():
+    limiter = AdaptiveLimiter('reads', rate=100, concurrency=8)
+    fail(limiter, JujuBackendError('controller unavailable'))
+    assert limiter.rate == 50
+    assert limiter.concurrency == 4
+    assert limiter.backoffs == 1
+
+
+def test_back_off_is_bounded():
+    limiter = AdaptiveLimiter('reads', rate=100, concurrency=8, min_rate=30)
+    for _ in range(5):
+        fail(limiter, JujuBackendError('controller unavailable'))
+    assert limiter.rate == 30
+    assert limiter.concurrency == 1
+
+
+def test_success_recovers_up_to_the_maximum():
+    limiter = AdaptiveLimiter('reads', rate=100, concurrency=8)
+    fail(limiter, JujuBackendError('controller unavailable'))
+    with limiter.call():
+        pass
+    assert limiter.rate == 50 + 100 * RATE_INCREASE
+    for _ in range(50):
+        with limiter.call():
+            pass
+    assert limiter.rate == 100
+    assert limiter.concurrency == 8
+    assert limiter.in_flight == 0
+
+
+def test_slow_calls_back_off():
+    limiter = AdaptiveLimiter('reads', rate=100, concurrency=8,
+                              slow_seconds=-1)
+    with limiter.call():
+        pass
+    assert limiter.backoffs == 1
+    with limiter.call(timed=False):
+        pass
+    assert limiter.backoffs == 1
+
+
+def test_other_errors_do_not_back_off():
+    limiter = AdaptiveLimiter('reads', rate=100, concurrency=8)
+    fail(limiter, KeyError('unit'))
+    assert limiter.rate == 100
+    assert limiter.backoffs == 0
+    assert limiter.in_flight == 0
+
+
+def test_backend_calls_are_limited():
+    fake = FakeBackend()
+    fake.add_application('keystone', num_units=2, actions=['pause'])
+    backend = RateLimitedBackend(fake, read_rate=100, write_rate=100)
+
+    action_ids = backend.run_actions([('keystone/0', 'pause'),
+                                      ('keystone/1', 'pause')])
+    assert backend.action_statuses(action_ids) == dict(
+        (action_id, 'completed') for action_id in action_ids)
+    assert backend.writes.calls == 1
+    assert backend.reads.calls == 1
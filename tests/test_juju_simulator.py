@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+The Juju client simulator, on its own and as the juju binary CLIBackend
+runs, so it cannot drift from what CLIBackend parses.
+'''
+
+import os
+
+import pytest
+
+from os_charms_tools import kiki
+from os_charms_tools.juju_backend import CLIBackend, JujuBackendError
+from os_charms_tools.juju_simulator import (
+    PAUSED,
+    READY,
+    STATE_ENVIRONMENT,
+    SimulatorError,
+    Simulator,
+    build_state,
+    juju,
+    save_state,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DESCRIPTION = {
+    'model': 'bench',
+    'seed': 42,
+    'actions': {
+        'pause': 10,
+        'resume': 10,
+        'openstack-upgrade': {'distribution': 'fixed', 'seconds': 100},
+    },
+    'applications': {
+        'keystone': {'units': 3, 'leader': 1,
+                     'subordinates': ['keystone-hacluster'],
+                     'config': {'openstack-origin': 'cloud:xenial-mitaka'}},
+        'keystone-hacluster': {'charm': 'hacluster', 'subordinate': True,
+                               'actions': {'openstack-upgrade': None}},
+        'glance': {'units': 1,
+                   'actions': {'openstack-upgrade': {
+                       'distribution': 'fixed', 'seconds': 100,
+                       'failure-rate': 1.0}}},
+    },
+}
+
+
+def test_build_state():
+    state = build_state(DESCRIPTION)
+    assert sorted(state['units']) == [
+        'glance/0', 'keystone-hacluster/0', 'keystone-hacluster/1',
+        'keystone-hacluster/2', 'keystone/0', 'keystone/1', 'keystone/2']
+    assert len(state['machines']) == 4
+    keystone = state['units']['keystone/1']
+    assert keystone['leader']
+    assert keystone['origin'] == 'cloud:xenial-mitaka'
+    assert keystone['subordinates'] == ['keystone-hacluster/1']
+    hacluster = state['units']['keystone-hacluster/1']
+    assert hacluster['principal'] == 'keystone/1'
+    assert hacluster['machine'] == keystone['machine']
+    assert sorted(state['applications']['keystone-hacluster']['actions']) == [
+        'pause', 'resume']
+
+
+def test_subordinate_must_be_declared_one():
+    with pytest.raises(SimulatorError):
+        build_state({'applications': {'keystone': {'subordinates': ['mysql']},
+                                      'mysql': {'units': 1}}})
+
+
+def test_action_lifecycle():
+    state = build_state(DESCRIPTION)
+    simulator = Simulator(state, now=1000)
+    pause, = simulator.run_action(['keystone/0'], 'pause')
+    upgrade, = simulator.run_action(['keystone/0'], 'openstack-upgrade')
+    failing, = simulator.run_action(['glance/0'], 'openstack-upgrade')
+    # Actions run one at a time per unit
+    assert simulator.action_output(pause)['status'] == 'running'
+    assert simulator.action_output(upgrade)['status'] == 'pending'
+
+    simulator = Simulator(state, now=1010)
+    assert simulator.action_output(pause)['status'] == 'completed'
+    assert simulator.action_output(upgrade)['status'] == 'running'
+    unit = simulator.status()['applications']['keystone']['units'][
+        'keystone/0']
+    assert unit['workload-status']['message'] == (
+        'Upgrading to cloud:xenial-mitaka')
+    assert unit['juju-status']['current'] == 'executing'
+
+    simulator = Simulator(state, now=1110)
+    assert simulator.action_output(upgrade)['status'] == 'completed'
+    output = simulator.action_output(failing)
+    assert output['status'] == 'failed'
+    assert output['message'] == 'openstack-upgrade failed on glance/0'
+    unit = simulator.status()['applications']['keystone']['units'][
+        'keystone/0']
+    assert unit['workload-status'] == {'current': 'maintenance',
+                                       'message': PAUSED}
+    assert unit['juju-status'] == {'current': 'idle'}
+
+
+def test_unknown_action_queues_nothing():
+    simulator = Simulator(build_state(DESCRIPTION), now=1000)
+    with pytest.raises(SimulatorError):
+        simulator.run_action(['keystone/0', 'keystone-hacluster/0'],
+                             'openstack-upgrade')
+    assert simulator.state['operations'] == {}
+
+
+def test_status_filters(tmp_path):
+    path = str(tmp_path / 'state.json')
+    save_state(path, build_state(DESCRIPTION))
+    stdout, stderr, code = juju(path, ['status', 'glance', '--format=json'])
+    assert code == 0
+    assert '"keystone"' not in stdout
+    assert juju(path, ['destroy-model'])[2] == 2
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    '''CLIBackend running juju-simulator.py as its juju binary.'''
+    path = str(tmp_path / 'state.json')
+    description = dict(DESCRIPTION, **{'time-scale': 0})
+    save_state(path, build_state(description))
+    monkeypatch.setenv(STATE_ENVIRONMENT, path)
+    monkeypatch.setenv('JUJU_BINARY', os.path.join(ROOT, 'juju-simulator.py'))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    kiki.clear_caches()
+    yield CLIBackend()
+    kiki.clear_caches()
+
+
+def test_status_shape(backend):
+    assert backend.applications_key() == 'applications'
+    status = backend.status()
+    assert sorted(status['applications']) == ['glance', 'keystone',
+                                              'keystone-hacluster']
+    assert status['applications']['keystone-hacluster']['subordinate-to'] == [
+        'keystone']
+    assert status['machines']['0']['dns-name'] == '10.0.0.0'
+
+    units = backend.units('keystone')
+    assert sorted(units) == ['keystone/0', 'keystone/1', 'keystone/2']
+    unit = units['keystone/1']
+    assert unit['leader']
+    assert unit['workload-status'] == {'current': 'active',
+                                       'message': READY}
+    assert unit['machine'] == '2'
+    assert sorted(unit['subordinates']) == ['keystone-hacluster/1']
+    with pytest.raises(JujuBackendError):
+        backend.units('nova-compute')
+
+
+def test_actions_through_the_cli(backend):
+    assert sorted(backend.enumerate_actions('keystone')) == [
+        'openstack-upgrade', 'pause', 'resume']
+    ids = backend.run_actions([('keystone/0', 'pause'),
+                               ('glance/0', 'openstack-upgrade'),
+                               ('keystone/1', 'pause')])
+    assert len(set(ids)) == 3
+    assert backend.action_statuses(ids) == {
+        ids[0]: 'completed', ids[1]: 'failed', ids[2]: 'completed'}
+    assert backend.action_result(ids[0])['status'] == 'completed'
+    assert backend.units('keystone')['keystone/0']['workload-status'][
+        'message'] == PAUSED
+
+    leaders = backend.run_on_application('keystone', 'is-leader')
+    assert sorted((result['UnitId'], result['Stdout'].strip())
+                  for result in leaders) == [
+        ('keystone/0', 'False'), ('keystone/1', 'True'),
+        ('keystone/2', 'False')]
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+The Juju version cache of kiki, against a stand-in juju binary which counts
+how often it is asked for its version.
+'''
+
+import os
+import stat
+
+import pytest
+
+from os_charms_tools import kiki
+
+FAKE_JUJU = '''#!/bin/sh
+echo probed >> {probes}
+echo {version}
+'''
+
+
+@pytest.fixture
+def juju(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    binary = tmp_path / 'juju'
+    monkeypatch.setenv('JUJU_BINARY', str(binary))
+    write_juju(binary, '2.1.2-xenial-amd64')
+    kiki.clear_caches()
+    yield binary
+    kiki.clear_caches()
+
+
+def write_juju(binary, version):
+    binary.write_text(FAKE_JUJU.format(probes=binary.parent / 'probes',
+                                       version=version))
+    binary.chmod(binary.stat().st_mode | stat.S_IEXEC)
+
+
+def probes(binary):
+    path = binary.parent / 'probes'
+    return len(path.read_text().splitlines()) if path.exists() else 0
+
+
+def test_version_is_probed_once(juju):
+    assert kiki.version() == '2.1.2-xenial-amd64'
+    assert kiki.min_version('2.1')
+    assert probes(juju) == 1
+
+    # A later process reads the version from the cache on disk
+    kiki.clear_caches()
+    assert kiki.version() == '2.1.2-xenial-amd64'
+    assert probes(juju) == 1
+    assert os.path.exists(kiki.version_cache_file())
+
+
+def test_changed_binary_is_probed_again(juju):
+    kiki.version()
+    write_juju(juju, '2.2.0-xenial-amd64')
+    mtime = juju.stat().st_mtime + 10
+    os.utime(str(juju), (mtime, mtime))
+
+    kiki.clear_caches()
+    assert kiki.version() == '2.2.0-xenial-amd64'
+    assert probes(juju) == 2
+
+
+def test_unsupported_version(juju):
+    write_juju(juju, '2.0.2-xenial-amd64')
+    with pytest.raises(kiki.UnsupportedJujuVersion):
+        kiki.min_version('2.1')
+
+
+def same_named_function(module):
+    namespace = {'__name__': module}
+    exec('def status(unit):\n    return __name__ + unit', namespace)
+    return kiki.cached(namespace['status'])
+
+
+def test_same_named_functions_are_cached_apart():
+    first = same_named_function('first')
+    second = same_named_function('second')
+    try:
+        assert first('/0') == 'first/0'
+        assert second('/0') == 'second/0'
+        assert first('/0') == 'first/0'
+        info = kiki.cache_info()
+        assert info['first.status']['hits'] == 1
+        assert info['second.status']['size'] == 1
+        assert 'os_charms_tools.kiki.version' in info
+
+        kiki.clear_caches()
+        assert first.cache.info()['size'] == 0
+        assert second.cache.info()['size'] == 0
+    finally:
+        del kiki.caches['first.status'], kiki.caches['second.status']
@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+kiki.runner against python one-liners standing in for the juju client.
+'''
+
+import sys
+
+import pytest
+
+from os_charms_tools.juju_backend import CLIBackend, JujuBackendError
+from os_charms_tools.kiki.runner import JujuCommandError, Runner
+
+
+def python(code):
+    return [sys.executable, '-c', 'import sys, time\n' + code]
+
+
+def test_json_output_is_parsed():
+    result = Runner().run(python('print(\'{"status": "completed"}\')'))
+    assert result.ok
+    assert result.cmd[-1] == '--format=json'
+    assert result.returncode == 0
+    assert result.check() == {'status': 'completed'}
+
+
+def test_format_given_by_the_command_is_kept():
+    result = Runner().run(python('import json; print(json.dumps(sys.argv))') +
+                          ['--format=json'])
+    assert result.check() == ['-c', '--format=json']
+
+
+def test_unparsable_output():
+    result = Runner().run(python('print("Unit is ready")'))
+    assert not result.ok
+    assert result.error.startswith('Unable to parse the output of')
+    assert result.stdout == 'Unit is ready\n'
+    with pytest.raises(JujuCommandError):
+        result.check()
+
+
+def test_non_zero_exit():
+    result = Runner().run(python('sys.exit("ERROR model not found")'),
+                          output_format=None)
+    assert not result.ok
+    assert result.returncode == 1
+    assert result.error.endswith('failed: ERROR model not found')
+    assert result.data is None
+
+
+def test_non_zero_exit_raises_backend_error():
+    backend = CLIBackend()
+    with pytest.raises(JujuBackendError) as error:
+        backend._check_output(python('sys.exit("ERROR no such unit")'))
+    assert 'ERROR no such unit' in str(error.value)
+
+
+def test_timeout():
+    result = Runner(timeout=0.2).run(python('time.sleep(10)'))
+    assert not result.ok
+    assert result.returncode is None
+    assert 'timed out after 0.2s' in result.error
+
+
+def test_missing_binary():
+    result = Runner().run(['/nonexistent/juju', 'status'])
+    assert not result.ok
+    assert result.returncode is None
+
+
+def test_model_is_passed_in_the_environment():
+    result = Runner(model='ctl:cloud').run(
+        python('import os; print(os.environ["JUJU_MODEL"])'),
+        output_format=None)
+    assert result.check() == 'ctl:cloud\n'
+
+
+def test_run_many_keeps_the_order_of_the_commands():
+    # The first command finishes last
+    cmds = [python('time.sleep({}); print({})'.format(0.3 - 0.1 * i, i))
+            for i in range(3)] + [python('sys.exit(2)')]
+    results = Runner(concurrency=4).run_many(cmds)
+    assert [result.data for result in results] == [0, 1, 2, None]
+    assert [result.ok for result in results] == [True, True, True, False]
+    assert Runner().run_many([]) == []
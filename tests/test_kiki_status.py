@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from os_charms_tools.juju_backend import FakeBackend
+from os_charms_tools.kiki.status import StatusSnapshot, UnknownEntity
+
+
+@pytest.fixture
+def backend():
+    fake = FakeBackend()
+    fake.add_application('keystone', num_units=3, leader=2,
+                         subordinates=['keystone-hacluster'])
+    fake.add_application('glance', num_units=1)
+    fake.model['machines'] = {
+        '0': {'dns-name': '10.5.0.10',
+              'containers': {'0/lxd/0': {'dns-name': '10.5.0.20'}}},
+        '1': {'dns-name': '10.5.0.11'},
+    }
+    return fake
+
+
+@pytest.fixture
+def snapshot(backend):
+    return StatusSnapshot(status=backend.status(), fetch=backend.status,
+                          applications_key=backend.applications_key())
+
+
+def test_applications_and_units_are_indexed(snapshot):
+    assert snapshot.application_names() == ['glance', 'keystone',
+                                            'keystone-hacluster']
+    assert snapshot.units('keystone') == ['keystone/0', 'keystone/1',
+                                          'keystone/2']
+    assert snapshot.unit('glance/0')['workload-status']['current'] == (
+        'active')
+    assert snapshot.unit_application('keystone/1') == 'keystone'
+    assert snapshot.leader('keystone') == 'keystone/2'
+    with pytest.raises(UnknownEntity):
+        snapshot.application('nova-compute')
+    with pytest.raises(UnknownEntity):
+        snapshot.unit('keystone/3')
+
+
+def test_subordinates_lead_to_their_principal(snapshot):
+    assert snapshot.subordinates('keystone/1') == ['keystone-hacluster/1']
+    assert snapshot.unit_application('keystone-hacluster/1') == (
+        'keystone-hacluster')
+    assert snapshot.principal('keystone-hacluster/1') == 'keystone/1'
+    assert snapshot.principal('keystone/1') == 'keystone/1'
+    # A subordinate is on the machine of its principal
+    assert snapshot.machine_of('keystone-hacluster/1')['dns-name'] == (
+        '10.5.0.11')
+    assert snapshot.machine('0/lxd/0')['dns-name'] == '10.5.0.20'
+
+
+def test_refresh_application(snapshot, backend):
+    backend._applications()['keystone']['units']['keystone/0'][
+        'workload-status'] = {'current': 'maintenance',
+                              'message': 'Paused'}
+    glance = snapshot.application('glance')
+    assert snapshot.unit('keystone/0')['workload-status']['current'] == (
+        'active')
+
+    snapshot.refresh_application('keystone')
+    assert snapshot.unit('keystone/0')['workload-status']['current'] == (
+        'maintenance')
+    assert snapshot.principal('keystone-hacluster/0') == 'keystone/0'
+    # The other applications are left as they were
+    assert snapshot.application('glance') is glance
+
+
+def test_refresh_a_removed_application(snapshot):
+    # juju status lists no applications for one which is gone
+    snapshot.fetch = lambda application: {'applications': {}}
+    with pytest.raises(UnknownEntity):
+        snapshot.refresh_application('glance')
+    assert 'glance' not in snapshot.application_names()
+    with pytest.raises(UnknownEntity):
+        snapshot.unit('glance/0')
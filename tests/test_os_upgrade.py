@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Rolling upgrades and evacuations of os-upgrade.py against the fake backend
+and compute client.
+'''
+
+import pytest
+
+from os_charms_tools.compute_client import FakeComputeClient
+from os_charms_tools.upgrade_journal import (
+    UNIT_PAUSED,
+    UNIT_UPGRADED,
+    UpgradeJournal,
+)
+from os_charms_tools.upgrade_timings import PHASE_BIGBANG, TimingHistory
+
+KEYSTONE_UNITS = ['keystone/0', 'keystone/1', 'keystone/2']
+COMPUTE_UNITS = ['nova-compute/0', 'nova-compute/1', 'nova-compute/2',
+                 'nova-compute/3']
+
+
+def service(upgrader, name):
+    return upgrader.Juju.current().get_service(name)
+
+
+def queued(backend, action):
+    '''Return the units action was queued on, in order.'''
+    return [unit for call in backend.calls if call[0] == 'run_actions'
+            for unit, queued_action in call[1] if queued_action == action]
+
+
+def resume(upgrader):
+    '''Start a new run of the upgrade from the journal of the last one.'''
+    upgrader.journal = UpgradeJournal(upgrader.journal.path)
+    upgrader.journal.start(upgrader.args.origin, resume=True)
+
+
+def test_rolling_upgrade_journals_every_unit(upgrader, backend):
+    upgrader.perform_rolling_upgrade(service(upgrader, 'keystone'))
+
+    assert (backend.config['keystone']['openstack-origin'] ==
+            upgrader.args.origin)
+    # The leader goes first
+    assert queued(backend, 'openstack-upgrade') == [
+        'keystone/1', 'keystone/0', 'keystone/2']
+    assert sorted(queued(backend, 'pause')) == sorted(
+        KEYSTONE_UNITS + ['keystone-hacluster/0', 'keystone-hacluster/1',
+                          'keystone-hacluster/2'])
+    assert upgrader.journal.completed_units() == KEYSTONE_UNITS
+
+
+def test_wave_batches_actions(upgrader, backend):
+    upgrader.args.wave_size = 3
+    upgrader.perform_rolling_upgrade(service(upgrader, 'keystone'))
+
+    upgrades = [call for call in backend.calls if call[0] == 'run_actions' and
+                call[1][0][1] == 'openstack-upgrade']
+    assert len(upgrades) == 1
+    assert len(upgrades[0][1]) == 3
+
+
+def test_failed_upgrade_is_not_journaled(upgrader, backend):
+    upgrader.args.wave_size = 3
+    backend.failed_actions.add(('keystone/0', 'openstack-upgrade'))
+
+    with pytest.raises(SystemExit) as exit_info:
+        upgrader.perform_rolling_upgrade(service(upgrader, 'keystone'))
+    assert exit_info.value.code == 1
+
+    journal = upgrader.journal
+    assert not journal.has_step('keystone/0', UNIT_UPGRADED)
+    assert journal.has_step('keystone/0', UNIT_PAUSED)
+    assert journal.has_step('keystone/1', UNIT_UPGRADED)
+    assert journal.has_step('keystone/2', UNIT_UPGRADED)
+    assert journal.completed_units() == []
+    # Nothing was resumed after the failure
+    assert queued(backend, 'resume') == []
+
+    # Once the unit is fixed, resuming upgrades only the failed unit
+    backend.failed_actions.clear()
+    del backend.calls[:]
+    resume(upgrader)
+    upgrader.perform_rolling_upgrade(service(upgrader, 'keystone'))
+
+    assert queued(backend, 'pause') == []
+    assert queued(backend, 'openstack-upgrade') == ['keystone/0']
+    assert upgrader.journal.completed_units() == KEYSTONE_UNITS
+
+
+def test_failed_hacluster_pause_is_not_journaled(upgrader, backend):
+    backend.failed_actions.add(('keystone-hacluster/1', 'pause'))
+
+    with pytest.raises(SystemExit):
+        upgrader.perform_rolling_upgrade(service(upgrader, 'keystone'))
+
+    assert not upgrader.journal.has_step('keystone/1', UNIT_PAUSED)
+    assert queued(backend, 'openstack-upgrade') == []
+
+
+def test_failed_application_is_not_journaled(upgrader, backend):
+    upgrader.args.app = ['keystone']
+    backend.failed_actions.add(('keystone/2', 'resume'))
+
+    with pytest.raises(SystemExit):
+        upgrader.upgrade(upgrader.Juju.current())
+
+    assert not upgrader.journal.is_application_done('keystone')
+    assert 'keystone/2' not in upgrader.journal.completed_units()
+
+
+def compute_client(spare_hosts=1):
+    hosts = dict(('compute-{}'.format(i), 2) for i in range(4))
+    for i in range(spare_hosts):
+        hosts['spare-{}'.format(i)] = 0
+    return FakeComputeClient(hosts, stopped=['i-1'])
+
+
+def test_evacuation(upgrader, backend):
+    upgrader.args.evacuate = True
+    upgrader.args.wave_size = 2
+    upgrader.compute = compute_client()
+
+    upgrader.perform_rolling_upgrade(service(upgrader, 'nova-compute'))
+
+    # The hosts are looked up once for the application, not once per wave
+    assert [call for call in backend.calls
+            if call[0] == 'run_on_application' and
+            call[2] == 'hostname'] == [
+        ('run_on_application', 'nova-compute', 'hostname')]
+    client = upgrader.compute
+    assert sorted(call[1] for call in client.calls
+                  if call[0] == 'disable_host') == [
+        'compute-0', 'compute-1', 'compute-2', 'compute-3']
+    assert client.disabled == set()
+    assert ('cold_migrate', 'i-1') in client.calls
+    assert upgrader.journal.completed_units() == COMPUTE_UNITS
+
+
+def test_failed_evacuation_stops_the_upgrade(upgrader, backend):
+    upgrader.args.evacuate = True
+    upgrader.compute = compute_client(spare_hosts=0)
+    # No host the instances of the first wave could be moved to
+    upgrader.compute.disabled.update(['compute-1', 'compute-2',
+                                      'compute-3'])
+
+    with pytest.raises(SystemExit):
+        upgrader.perform_rolling_upgrade(service(upgrader, 'nova-compute'))
+
+    assert queued(backend, 'pause') == []
+    assert upgrader.journal.units == {}
+
+
+def test_hosts_of_a_stopped_wave_are_journaled(upgrader, backend, caplog):
+    upgrader.args.evacuate = True
+    upgrader.args.wave_size = 2
+    upgrader.compute = compute_client()
+    backend.failed_actions.add(('nova-compute/1', 'openstack-upgrade'))
+
+    with pytest.raises(SystemExit):
+        upgrader.perform_rolling_upgrade(service(upgrader, 'nova-compute'))
+
+    assert upgrader.compute.disabled == set(['compute-0', 'compute-1'])
+    assert upgrader.journal.disabled_hosts == set(['compute-0', 'compute-1'])
+    assert "Compute hosts ['compute-0', 'compute-1'] are left disabled" in (
+        caplog.text)
+
+    # Resuming enables the hosts once their units are upgraded
+    backend.failed_actions.clear()
+    resume(upgrader)
+    assert upgrader.journal.disabled_hosts == set(['compute-0', 'compute-1'])
+    upgrader.perform_rolling_upgrade(service(upgrader, 'nova-compute'))
+
+    assert upgrader.compute.disabled == set()
+    assert upgrader.journal.disabled_hosts == set()
+    assert upgrader.journal.completed_units() == COMPUTE_UNITS
+
+
+def test_evacuate_units_requires_hosts(upgrader):
+    units = service(upgrader, 'nova-compute').units()
+    upgrader.compute = compute_client()
+
+    with pytest.raises(SystemExit):
+        upgrader.evacuate_units(service(upgrader, 'nova-compute'), units, {})
+    assert upgrader.compute.calls == []
+
+
+def test_bigbang_timing_starts_with_the_config_change(upgrader, backend,
+                                                      tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(upgrader.time, 'time', lambda: clock[0])
+    monkeypatch.setattr(upgrader.time, 'sleep',
+                        lambda seconds: clock.__setitem__(0, clock[0] +
+                                                          seconds))
+    backend.add_application('ceph-mon', num_units=3)
+    upgrader.telemetry.history = TimingHistory(str(tmp_path / 'timings'))
+
+    upgrader.perform_bigbang_upgrade(service(upgrader, 'ceph-mon'))
+
+    # The settle after the config change is part of the upgrade
+    assert upgrader.telemetry.history.timings['ceph-mon'][PHASE_BIGBANG] == [
+        5]
+    assert [event['duration'] for event in upgrader.telemetry.events] == [
+        5, 5, 5, 5]
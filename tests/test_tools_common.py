@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from os_charms_tools.tools_common import render, render_many
+
+
+@pytest.fixture
+def templates(tmp_path):
+    directory = tmp_path / 'templates'
+    directory.mkdir()
+    (directory / 'app.j2').write_text('{{ name }}: {{ units }}\n')
+    (directory / 'options.j2').write_text(
+        '{% for key in options | sort %}{{ key }}\n{% endfor %}')
+    return str(directory)
+
+
+def read(path):
+    with open(path) as rendered:
+        return rendered.read()
+
+
+def test_render_many_matches_render(templates, tmp_path):
+    jobs = []
+    for i in range(10):
+        jobs.append(('app.j2', str(tmp_path / 'app-{}'.format(i)),
+                     {'name': 'app-{}'.format(i), 'units': i}))
+        jobs.append(('options.j2', str(tmp_path / 'options-{}'.format(i)),
+                     {'options': ['debug', 'verbose'][:i % 3]}))
+
+    targets = render_many(jobs, templates)
+    assert targets == [target for _, target, _ in jobs]
+    rendered = [read(target) for target in targets]
+    assert rendered[2] == 'app-1: 1'
+
+    for source, target, context in jobs:
+        render(source, target, context, templates)
+    assert [read(target) for target in targets] == rendered
+
+
+def test_render_many_of_a_missing_template(templates, tmp_path):
+    with pytest.raises(Exception):
+        render_many([('missing.j2', str(tmp_path / 'out'), {})], templates)
+    assert render_many([], templates) == []
@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+
+from os_charms_tools.upgrade_fleet import FleetUpgrade, model_directory
+
+
+def test_model_directories_do_not_collide():
+    models = ['ctl:model', 'ctl_model', 'ctl%3Amodel', 'ctl/model']
+    directories = [model_directory('fleet', model) for model in models]
+    assert len(set(directories)) == len(models)
+    for directory in directories:
+        assert os.path.dirname(directory) == 'fleet'
+
+
+def test_model_upgraded_twice_is_refused():
+    with pytest.raises(ValueError):
+        FleetUpgrade(['ctl:model', 'ctl:model'], None, 'fleet')
@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from os_charms_tools.upgrade_journal import (
+    JournalMismatch,
+    UNIT_DONE,
+    UNIT_PAUSED,
+    UNIT_UPGRADED,
+    UpgradeJournal,
+)
+
+ORIGIN = 'cloud:xenial-newton'
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'os-upgrade.journal')
+
+
+def test_resume_keeps_progress(path):
+    journal = UpgradeJournal(path)
+    journal.start(ORIGIN)
+    journal.record_unit('keystone/0', UNIT_PAUSED)
+    journal.record_unit('keystone/0', UNIT_UPGRADED)
+    journal.record_unit('keystone/1', UNIT_DONE)
+    journal.record_application('glance')
+
+    resumed = UpgradeJournal(path)
+    resumed.start(ORIGIN, resume=True)
+    assert resumed.has_step('keystone/0', UNIT_UPGRADED)
+    assert not resumed.is_unit_done('keystone/0')
+    assert resumed.completed_units() == ['keystone/1']
+    assert resumed.is_application_done('glance')
+
+
+def test_start_without_resume_discards_progress(path):
+    journal = UpgradeJournal(path)
+    journal.start(ORIGIN)
+    journal.record_unit('keystone/0', UNIT_DONE)
+
+    restarted = UpgradeJournal(path)
+    restarted.start(ORIGIN)
+    assert restarted.completed_units() == []
+    restarted.load()
+    assert restarted.completed_units() == []
+
+
+def test_resume_for_another_origin_is_refused(path):
+    UpgradeJournal(path).start(ORIGIN)
+    with pytest.raises(JournalMismatch):
+        UpgradeJournal(path).start('cloud:xenial-ocata', resume=True)
+
+
+def test_corrupt_final_line_is_ignored(path):
+    journal = UpgradeJournal(path)
+    journal.start(ORIGIN)
+    journal.record_unit('keystone/0', UNIT_DONE)
+    with open(path, 'a') as journal_file:
+        journal_file.write('{"event": "unit", "unit": "keyst')
+
+    resumed = UpgradeJournal(path)
+    resumed.start(ORIGIN, resume=True)
+    assert resumed.completed_units() == ['keystone/0']
+
+
+def test_resume_after_a_torn_line_keeps_new_progress(path):
+    journal = UpgradeJournal(path)
+    journal.start(ORIGIN)
+    journal.record_unit('keystone/0', UNIT_DONE)
+    journal.record_unit('keystone/1', UNIT_PAUSED)
+    # Interrupted while writing the last entry
+    with open(path, 'rb+') as journal_file:
+        journal_file.truncate(len(journal_file.read()) - 10)
+
+    resumed = UpgradeJournal(path)
+    resumed.start(ORIGIN, resume=True)
+    assert not resumed.has_step('keystone/1', UNIT_PAUSED)
+    resumed.record_unit('keystone/1', UNIT_PAUSED)
+    resumed.record_unit('keystone/1', UNIT_DONE)
+
+    resumed_again = UpgradeJournal(path)
+    resumed_again.start(ORIGIN, resume=True)
+    assert resumed_again.has_step('keystone/1', UNIT_PAUSED)
+    assert resumed_again.completed_units() == ['keystone/0', 'keystone/1']
+
+
+def test_disabled_hosts_are_resumed(path):
+    journal = UpgradeJournal(path)
+    journal.start(ORIGIN)
+    journal.record_hosts(['compute-0', 'compute-1'], enabled=False)
+    journal.record_hosts(['compute-0'], enabled=True)
+
+    resumed = UpgradeJournal(path)
+    resumed.start(ORIGIN, resume=True)
+    assert resumed.disabled_hosts == set(['compute-1'])
+
+
+def test_unknown_step_is_refused(path):
+    journal = UpgradeJournal(path)
+    journal.start(ORIGIN)
+    with pytest.raises(ValueError):
+        journal.record_unit('keystone/0', 'evacuated')
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os_charms_tools.juju_backend import FakeBackend
+from os_charms_tools.kiki.status import StatusSnapshot
+from os_charms_tools.upgrade_preflight import (
+    hacluster_applications,
+    preflight_problems,
+)
+
+ACTIONS = ['pause', 'resume', 'openstack-upgrade']
+
+
+def snapshot(backend):
+    return StatusSnapshot(status=backend.status(),
+                          applications_key=backend.applications_key())
+
+
+def cloud():
+    fake = FakeBackend()
+    fake.add_application('keystone', num_units=3, actions=ACTIONS,
+                         subordinates=['keystone-hacluster'])
+    fake.add_application('glance', num_units=1, actions=['pause'])
+    return fake
+
+
+def test_healthy_cloud():
+    status = snapshot(cloud())
+    assert hacluster_applications(status, ['keystone', 'glance']) == [
+        'keystone-hacluster']
+    assert preflight_problems(status, ['keystone', 'glance', 'cinder']) == []
+
+
+def test_problems():
+    fake = cloud()
+    units = fake._applications()['keystone']['units']
+    units['keystone/0']['workload-status'] = {'current': 'error',
+                                              'message': 'hook failed'}
+    for i in (1, 2):
+        units['keystone/{}'.format(i)]['subordinates'][
+            'keystone-hacluster/{}'.format(i)]['workload-status'] = {
+                'current': 'blocked', 'message': 'Resource: res_ks_vip'}
+
+    problems = preflight_problems(
+        snapshot(fake), ['keystone', 'glance'],
+        actions={'glance': ['pause'], 'keystone-hacluster': ['pause']},
+        required_actions=['pause', 'resume'],
+        hacluster_actions=['pause', 'resume'])
+    assert problems == [
+        'keystone/0 is in error: hook failed',
+        'keystone-hacluster/1 is blocked: Resource: res_ks_vip',
+        'keystone-hacluster/2 is blocked: Resource: res_ks_vip',
+        'glance does not provide the resume actions',
+        'keystone-hacluster has no quorum: 1 of 3 units active',
+        'keystone-hacluster does not provide the resume actions',
+    ]
+
+
+def test_paused_units_of_an_interrupted_upgrade_are_allowed():
+    fake = cloud()
+    fake._applications()['glance']['units']['glance/0'][
+        'workload-status'] = {'current': 'maintenance', 'message': 'Paused'}
+    assert len(preflight_problems(snapshot(fake), ['glance'])) == 1
+    assert preflight_problems(snapshot(fake), ['glance'],
+                              allow_paused=['glance/0']) == []
@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from os_charms_tools.upgrade_telemetry import UpgradeTelemetry
+
+COUNT = ('os_upgrade_phases_total{application="keystone",phase="pause",'
+         'status="ok"}')
+
+
+def phases(path):
+    with open(path) as prometheus_file:
+        for line in prometheus_file:
+            if line.startswith(COUNT):
+                return int(line.split()[-1])
+
+
+def test_prometheus_file_is_rewritten_at_most_once_per_interval(tmp_path):
+    path = str(tmp_path / 'os_upgrade.prom')
+    telemetry = UpgradeTelemetry(prometheus_file=path,
+                                 prometheus_interval=3600)
+    for i in range(3):
+        telemetry.record('keystone', 'keystone/{}'.format(i), 'pause',
+                         100, 110 + i)
+    assert phases(path) == 1
+
+    telemetry.flush()
+    assert phases(path) == 3
+    metrics = telemetry.prometheus_metrics()
+    assert ('os_upgrade_phase_duration_seconds{application="keystone",'
+            'host="",phase="pause",unit="keystone/2"} 12') in metrics
+    assert 'os_upgrade_last_event_timestamp_seconds 112' in metrics
+
+
+def test_failed_phase(tmp_path):
+    telemetry = UpgradeTelemetry(prometheus_file=str(tmp_path / 'prom'),
+                                 prometheus_interval=0)
+    with pytest.raises(ValueError):
+        with telemetry.phase('keystone', 'keystone/0', 'pause', start=100):
+            raise ValueError
+    assert telemetry.events[0]['status'] == 'failed'
+    assert telemetry.events[0]['start'] == 100
+    assert ('os_upgrade_phases_total{application="keystone",phase="pause",'
+            'status="failed"} 1') in telemetry.prometheus_metrics()
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from os_charms_tools.upgrade_timings import (
+    BIGBANG,
+    DEFAULT_PHASE_SECONDS,
+    PHASE_BIGBANG,
+    PHASE_PAUSE,
+    PHASE_PRESTAGE,
+    PHASE_RESUME,
+    PHASE_UPGRADE,
+    ROLLING,
+    TimingHistory,
+    UpgradePlan,
+    charm_name,
+)
+
+UNITS = ['keystone/1', 'keystone/0', 'keystone/2']
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = TimingHistory(str(tmp_path / 'timings.json'))
+    for seconds in (100, 200, 300):
+        history.record('keystone', PHASE_UPGRADE, seconds, save=False)
+    history.record('keystone', PHASE_PAUSE, 10, save=False)
+    history.record('keystone', PHASE_RESUME, 20, save=False)
+    history.record('hacluster', PHASE_PAUSE, 30, save=False)
+    history.record('hacluster', PHASE_RESUME, 5, save=False)
+    return history
+
+
+def test_estimates(history):
+    assert history.estimate('keystone', PHASE_UPGRADE) == 200
+    # Other charms' timings before the defaults
+    assert history.estimate('glance', PHASE_UPGRADE) == 200
+    assert (history.estimate('glance', PHASE_BIGBANG) ==
+            DEFAULT_PHASE_SECONDS[PHASE_BIGBANG])
+
+
+def test_history_is_saved(history):
+    history.save()
+    assert TimingHistory(history.path).timings == history.timings
+
+
+def test_histories_sharing_a_file_merge(history):
+    history.save()
+    first = TimingHistory(history.path)
+    second = TimingHistory(history.path)
+    first.record('keystone', PHASE_RESUME, 25)
+    second.record('glance', PHASE_UPGRADE, 150)
+    first.record('keystone', PHASE_RESUME, 30)
+
+    merged = TimingHistory(history.path).timings
+    assert merged['keystone'][PHASE_RESUME] == [20, 25, 30]
+    assert merged['glance'][PHASE_UPGRADE] == [150]
+    assert merged['keystone'][PHASE_UPGRADE] == [100, 200, 300]
+    # Each history sees the other's timings once it saves
+    assert first.timings == merged
+
+
+def test_rolling_plan(history):
+    plan = UpgradePlan(history, pause=True, wave_size=2)
+    plan.add_application('keystone', 'keystone', ROLLING, UNITS,
+                         hacluster=True)
+
+    app = plan.applications[0]
+    assert app['waves'] == [['keystone/1', 'keystone/0'], ['keystone/2']]
+    # The hacluster and keystone pause, and resume, run as one batch
+    per_wave = 30 + 200 + 20
+    assert app['duration'] == 2 * per_wave
+    assert plan.critical_path() == [('keystone/1', per_wave),
+                                    ('keystone/2', per_wave)]
+
+
+def test_rolling_plan_without_pause(history):
+    plan = UpgradePlan(history)
+    plan.add_application('keystone', 'keystone', ROLLING, UNITS,
+                         hacluster=True)
+    assert plan.applications[0]['phases'] == [(PHASE_UPGRADE, 200)]
+    assert plan.total() == 3 * 200
+
+
+def test_prestage(history):
+    plan = UpgradePlan(history, prestage_concurrency=2)
+    plan.add_application('keystone', 'keystone', ROLLING, UNITS)
+    prestage = 2 * DEFAULT_PHASE_SECONDS[PHASE_PRESTAGE]
+    assert plan.applications[0]['prestage'] == prestage
+    assert plan.total() == prestage + 3 * 200
+
+
+def test_bigbang_plan(history):
+    plan = UpgradePlan(history, pause=True)
+    plan.add_application('ceph-mon', 'ceph-mon', BIGBANG,
+                         ['ceph-mon/0', 'ceph-mon/1'])
+    seconds = DEFAULT_PHASE_SECONDS[PHASE_BIGBANG]
+    assert plan.total() == seconds
+    assert plan.critical_path() == [('ceph-mon', seconds)]
+    assert 'ceph-mon' in plan.format()
+
+
+def test_charm_name():
+    assert charm_name('cs:xenial/keystone-262') == 'keystone'
+    assert charm_name('keystone') == 'keystone'
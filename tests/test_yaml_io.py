@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+#
+# Copyright 2017 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from os_charms_tools import yaml_io
+
+# Targets which only xenial-newton needs, among others which it does not
+DEPLOYER_FILE = '''\
+# Shared by every release
+openstack-base:
+  series: xenial
+  services:
+    keystone:
+      charm: cs:xenial/keystone
+      options: {debug: true}
+  relations:
+  - [keystone, mysql]
+xenial-mitaka:
+  inherits: openstack-base
+  services:
+    keystone:
+      options: {openstack-origin: 'cloud:xenial-mitaka'}
+xenial-newton:
+  inherits: xenial-mitaka
+  services:
+    keystone:
+      options:
+        openstack-origin: cloud:xenial-newton
+        admin-password: |
+          multi
+          line
+trusty-liberty:
+  series: trusty
+  services: {keystone: {charm: cs:trusty/keystone, num_units: 3}}
+trusty-mitaka:
+  series: trusty
+  services: {keystone: {charm: cs:trusty/keystone, num_units: 3}}
+  relations: [[keystone, mysql], [keystone, rabbitmq-server]]
+unrelated-1: {series: bionic, services: {glance: {num_units: 1}}}
+unrelated-2: {series: bionic, services: {glance: {num_units: 2}}}
+unrelated-3: {series: bionic, services: {glance: {num_units: 3}}}
+unrelated-4: {series: bionic, services: {glance: {num_units: 4}}}
+unrelated-5: {series: bionic, services: {glance: {num_units: 5}}}
+unrelated-6: {series: bionic, services: {glance: {num_units: 6}}}
+'''
+
+
+def write(tmp_path, text):
+    path = str(tmp_path / 'bundle.yaml')
+    with open(path, 'w') as bundle:
+        bundle.write(text)
+    return path
+
+
+def test_only_the_lineage_is_loaded(tmp_path):
+    path = write(tmp_path, DEPLOYER_FILE)
+    full = yaml_io.load_file(path)
+
+    targets = yaml_io.load_targets(path, 'xenial-newton')
+    assert sorted(targets) == ['openstack-base', 'xenial-mitaka',
+                               'xenial-newton']
+    for name, target in targets.items():
+        assert target == full[name]
+
+
+def test_target_without_parent(tmp_path):
+    path = write(tmp_path, DEPLOYER_FILE)
+    assert yaml_io.load_targets(path, 'trusty-mitaka') == {
+        'trusty-mitaka': yaml_io.load_file(path)['trusty-mitaka']}
+
+
+@pytest.mark.parametrize('text', [
+    # Aliases may refer to any target
+    DEPLOYER_FILE + 'trusty-newton: &trusty {series: trusty}\n'
+    'trusty-ocata: *trusty\n',
+    # Not a deployer file
+    'series: xenial\nservices: {keystone: {num_units: 3}}\n',
+    # The targets are flow style
+    '{xenial-newton: {series: xenial}, a: [1, 2, 3], b: [4, 5, 6]}\n',
+    # A parent given as a list
+    'xenial-newton: {inherits: [base]}\nbase: {}\n' +
+    ''.join('unrelated-{0}: {{num_units: {0}}}\n'.format(i)
+            for i in range(6)),
+    # Most of the file is needed
+    'xenial-newton: {inherits: base}\nbase: {series: xenial}\n',
+])
+def test_whole_file_is_loaded(tmp_path, text):
+    path = write(tmp_path, text)
+    assert yaml_io.load_targets(path, 'xenial-newton') == (
+        yaml_io.load_file(path))
+
+
+def test_missing_target_loads_the_whole_file(tmp_path):
+    path = write(tmp_path, DEPLOYER_FILE)
+    assert yaml_io.load_targets(path, 'xenial-ocata') == (
+        yaml_io.load_file(path))
+
+
+def test_inheritance_cycle(tmp_path):
+    path = write(tmp_path, 'a: {inherits: b}\nb: {inherits: a}\n' +
+                 DEPLOYER_FILE)
+    assert sorted(yaml_io.load_targets(path, 'a')) == ['a', 'b']
+
+
+def test_dump_lists_tuples():
+    assert yaml_io.load(yaml_io.dump({'relations': [('a', 'b')]})) == {
+        'relations': [['a', 'b']]}